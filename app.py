@@ -1,11 +1,21 @@
 import os
-from flask import Flask, render_template
+from flask import Flask, render_template, request
 from flask_jwt_extended import JWTManager
 from dotenv import load_dotenv
 from datetime import timedelta
 from models import db, bcrypt
-from controllers.api_controller import api_bp
+from services.customer_features import init_feature_store, start_compaction_worker
+from services.db_routing import READ_BIND_KEY, build_read_bind, init_db_routing
+from services.loadtest_store import LOADTEST_BIND_KEY, build_loadtest_bind, init_loadtest_store, start_retention_worker
+from services.assets import init_assets, static_cache_control
+from services.compression import init_compression
+from services.admission import init_admission
+from services.device_counters import init_device_counters
+from services.stage_timing import init_stage_timing
+from services.warmup import preload_ml
+from controllers.api_controller import api_bp, TXN_CAPACITY_MAP
 from controllers.transactions_controller import transactions_bp
+from controllers.batch_controller import batch_bp
 
 # -------------------------------------------------
 # Load environment variables
@@ -26,6 +36,26 @@ if database_url and database_url.startswith("postgres://"):
 app.config['SQLALCHEMY_DATABASE_URI'] = database_url or 'sqlite:///' + os.path.join(basedir, 'bankedge.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Read/Write routing: read-only views use a separate pool (SQLite WAL) or replica (Postgres)
+read_bind = build_read_bind(
+    app.config['SQLALCHEMY_DATABASE_URI'],
+    replica_url=os.environ.get('DATABASE_READ_URL'),
+    pool_size=int(os.environ.get('DATABASE_READ_POOL_SIZE', 10))
+)
+app.config['SQLALCHEMY_BINDS'] = {}
+if read_bind:
+    app.config['SQLALCHEMY_BINDS'][READ_BIND_KEY] = read_bind
+
+# Load-test (Locust) traffic: separate DB file on SQLite, separate table otherwise
+app.config['SQLALCHEMY_BINDS'][LOADTEST_BIND_KEY] = build_loadtest_bind(
+    app.config['SQLALCHEMY_DATABASE_URI'],
+    loadtest_url=os.environ.get('LOADTEST_DATABASE_URL')
+)
+app.config['LOADTEST_ROUTING'] = os.environ.get('LOADTEST_ROUTING', 'auto')  # auto / header / off
+app.config['LOADTEST_RETENTION_HOURS'] = float(os.environ.get('LOADTEST_RETENTION_HOURS', 24))
+app.config['LOADTEST_RETENTION_INTERVAL'] = int(os.environ.get('LOADTEST_RETENTION_INTERVAL', 300))  # 0 = off
+app.config['LOADTEST_RETENTION_BATCH'] = int(os.environ.get('LOADTEST_RETENTION_BATCH', 1000))
+
 # Secrets
 app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET', 'dev-secret-key')
 app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'jwt-secret-key')
@@ -37,6 +67,66 @@ app.config['STRIPE_SECRET_KEY'] = os.environ.get('STRIPE_SECRET_KEY')
 # JWT Token Expiry
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(minutes=30)
 
+# Password hashing (bcrypt in a bounded process pool; hashes are upgraded on login when rounds change)
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+app.config['BCRYPT_POOL_WORKERS'] = int(os.environ.get('BCRYPT_POOL_WORKERS', 0))  # 0 = min(2, cpu count)
+# Jobs queued or hashing at once; more callers wait for a slot. Defaults to the server's request threads
+app.config['BCRYPT_POOL_MAX_PENDING'] = int(os.environ.get('BCRYPT_POOL_MAX_PENDING') or os.environ.get('WEB_THREADS', 16))
+app.config['BCRYPT_TIMEOUT'] = float(os.environ.get('BCRYPT_TIMEOUT', 10))  # slot wait + hashing, then 503
+
+# Offloading decision: distilled lookup policy when confident, RandomForest otherwise
+app.config['OFFLOADING_FAST_PATH'] = os.environ.get('OFFLOADING_FAST_PATH', '1') != '0'
+
+# Shadow evaluation of a candidate model (scored off the request path)
+app.config['OFFLOADING_SHADOW_MODEL'] = os.environ.get('OFFLOADING_SHADOW_MODEL')  # file in ml_models/
+app.config['SHADOW_WORKERS'] = int(os.environ.get('SHADOW_WORKERS', 1))
+app.config['SHADOW_MAX_PENDING'] = int(os.environ.get('SHADOW_MAX_PENDING', 64))
+app.config['SHADOW_LOG_PATH'] = os.environ.get('SHADOW_LOG_PATH')  # default ml_proof/shadow_eval.log
+app.config['SHADOW_LOG_MAX_BYTES'] = int(os.environ.get('SHADOW_LOG_MAX_BYTES', 1_000_000))
+
+# /api/ml-diagnosis/validate: minimum seconds between subprocess reload checks
+app.config['MODEL_VALIDATE_MIN_INTERVAL'] = int(os.environ.get('MODEL_VALIDATE_MIN_INTERVAL', 300))
+
+# Per-stage latency spans (always aggregated; Server-Timing header is opt-in)
+app.config['SERVER_TIMING_HEADER'] = os.environ.get('SERVER_TIMING_HEADER', '0') == '1'
+
+# Import numpy/pandas/sklearn and load the models at startup (pre-fork master) instead of
+# on the first payment that needs them; see services/warmup.py
+app.config['PRELOAD_ML'] = os.environ.get('PRELOAD_ML', '0') == '1'
+
+# asgi.py: payment_success as a coroutine (0 = serve it through the Flask view as well)
+app.config['ASYNC_PAYMENTS'] = os.environ.get('ASYNC_PAYMENTS', '1') != '0'
+app.config['ASYNC_IO_THREADS'] = int(os.environ.get('ASYNC_IO_THREADS', 16))  # Stripe + DB calls
+app.config['ASYNC_SCORING_WORKERS'] = int(os.environ.get('ASYNC_SCORING_WORKERS', 0))  # 0 = cpu count
+
+# gzip for text responses >= COMPRESS_MIN_SIZE bytes; bodies >= COMPRESS_STREAM_THRESHOLD are compressed as they stream
+app.config['COMPRESSION'] = os.environ.get('COMPRESSION', '1') != '0'
+app.config['COMPRESS_LEVEL'] = int(os.environ.get('COMPRESS_LEVEL', 6))  # 1 (fast) .. 9 (small)
+app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+app.config['COMPRESS_STREAM_THRESHOLD'] = int(os.environ.get('COMPRESS_STREAM_THRESHOLD', 256 * 1024))
+
+# /api/batch: threads per worker process running a batch's resources concurrently
+app.config['BATCH_WORKERS'] = int(os.environ.get('BATCH_WORKERS', 4))
+
+# Static bundles: content-hashed builds in static/dist (scripts/build_assets.py); 1 = rebuild when a source changes
+app.config['ASSETS_WATCH'] = os.environ.get('ASSETS_WATCH', '0') == '1'
+
+# Per-device payment counters in shared memory, read by the device endpoints (0 = query the DB)
+app.config['DEVICE_COUNTERS'] = os.environ.get('DEVICE_COUNTERS', '1') != '0'
+
+# Admission control for /api/payment-success (per worker process): ADMISSION_RATE payments/s split across
+# devices by TXN_CAPACITY_MAP (429 when a device's bucket is empty), at most ADMISSION_MAX_CONCURRENT in
+# flight, 503 when ADMISSION_MAX_QUEUE are waiting or a payment waited ADMISSION_MAX_QUEUE_MS for a slot
+app.config['ADMISSION_CONTROL'] = os.environ.get('ADMISSION_CONTROL', '1') != '0'
+app.config['ADMISSION_RATE'] = float(os.environ.get('ADMISSION_RATE', 1000))
+app.config['ADMISSION_BURST_SECONDS'] = float(os.environ.get('ADMISSION_BURST_SECONDS', 2))
+app.config['ADMISSION_MAX_CONCURRENT'] = int(os.environ.get('ADMISSION_MAX_CONCURRENT', 64))
+app.config['ADMISSION_MAX_QUEUE'] = int(os.environ.get('ADMISSION_MAX_QUEUE', 128))
+app.config['ADMISSION_MAX_QUEUE_MS'] = float(os.environ.get('ADMISSION_MAX_QUEUE_MS', 250))
+
+# Customer feature store: drop daily buckets that left the 30-day window (0 = off)
+app.config['CUSTOMER_FEATURES_COMPACT_INTERVAL'] = int(os.environ.get('CUSTOMER_FEATURES_COMPACT_INTERVAL', 3600))
+
 # -------------------------------------------------
 # Initialize Extensions
 # -------------------------------------------------
@@ -44,6 +134,9 @@ db.init_app(app)
 bcrypt.init_app(app)
 jwt = JWTManager(app)
 
+# Response compression: registered first so it runs after every other after_request hook
+init_compression(app)
+
 # Enable SQLite Write-Ahead Logging (WAL) for concurrency
 if 'sqlite' in (app.config['SQLALCHEMY_DATABASE_URI'] or ''):
     from sqlalchemy import event
@@ -55,11 +148,37 @@ if 'sqlite' in (app.config['SQLALCHEMY_DATABASE_URI'] or ''):
         cursor.execute("PRAGMA journal_mode=WAL")
         cursor.close()
 
+# Query metrics per route (primary / read) + read-only engine setup
+init_db_routing(app, db)
+
+# Load-test table + background retention (batched purge, incremental vacuum)
+init_loadtest_store(app, db)
+start_retention_worker(app, db)
+
+# Customer feature store: tables on pre-existing databases + bucket compaction
+init_feature_store(app, db)
+start_compaction_worker(app, db)
+
+# Per-stage latency histograms (+ optional Server-Timing header)
+init_stage_timing(app)
+
+# Device load/latency counters shared by every worker forked from this process
+init_device_counters(app, TXN_CAPACITY_MAP)
+init_admission(app, TXN_CAPACITY_MAP)
+
 # -------------------------------------------------
 # Register Blueprints
 # -------------------------------------------------
 app.register_blueprint(api_bp, url_prefix='/api')
 app.register_blueprint(transactions_bp)
+app.register_blueprint(batch_bp)
+
+# Fingerprinted static bundles for the templates' asset_url()
+init_assets(app)
+
+# Shared by forked workers copy-on-write when the server preloads the app
+if app.config['PRELOAD_ML']:
+    preload_ml(app)
 
 # -------------------------------------------------
 # Routes (Template Rendering Only)
@@ -67,12 +186,19 @@ app.register_blueprint(transactions_bp)
 @app.after_request
 def add_header(response):
     """
-    Add headers to both force latest IE rendering engine or Chrome Frame,
-    and also to cache the rendered page for 10 minutes.
+    API and HTML responses are never cached. Static files keep their own
+    caching: fingerprinted builds (static/dist) are immutable for a year,
+    other static files revalidate (ETag / Last-Modified). Only a served
+    file is immutable; a 404 for a missing dist/ path is not cached.
     """
-    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    response.headers["Pragma"] = "no-cache"
-    response.headers["Expires"] = "0"
+    if request.endpoint == 'static':
+        cache_control = static_cache_control(request.view_args.get('filename'))
+        if cache_control and response.status_code in (200, 206):
+            response.headers["Cache-Control"] = cache_control
+    else:
+        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+        response.headers["Pragma"] = "no-cache"
+        response.headers["Expires"] = "0"
     response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
     return response
 
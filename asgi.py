@@ -0,0 +1,143 @@
+"""
+ASGI entry point: payment_success runs as a coroutine
+(controllers/async_payment_controller.py); every other route is the
+regular Flask app, run in the thread pool through asgiref's WsgiToAsgi.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+The async view gets a real Flask request context, so before/after_request
+hooks, JWT error handlers, after_this_request and response.call_on_close
+(shadow scoring) behave as they do under a WSGI server.
+"""
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app
+from controllers.async_payment_controller import (
+    payment_success_async, shutdown_pool as shutdown_scoring_pool, start_pool as start_scoring_pool
+)
+from models import db
+from services.password_hashing import shutdown_pool as shutdown_hashing_pool, start_pool as start_hashing_pool
+from services.shadow_eval import shutdown_pool as shutdown_shadow_pool, start_pool as start_shadow_pool
+
+ASYNC_ROUTES = {
+    ('POST', '/api/payment-success'): payment_success_async,
+}
+
+wsgi_application = WsgiToAsgi(app)
+
+
+# =====================================================================
+# ASGI -> WSGI ENVIRON (for the Flask request context)
+# =====================================================================
+def _environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('ascii'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name, value = name.decode('latin1'), value.decode('latin1')
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'content-length':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def _dispatch(view, scope, receive, send):
+    ctx = app.request_context(_environ(scope, await _read_body(receive)))
+    ctx.push()
+    error = None
+    try:
+        try:
+            rv = app.preprocess_request()
+            if rv is None:
+                rv = await view()
+        except Exception as e:
+            # JWT errors etc. -> their registered handlers (re-raised when there is none)
+            rv = app.handle_user_exception(e)
+        response = app.process_response(app.make_response(rv))
+    except Exception as e:
+        error = e
+        response = app.make_response(app.handle_exception(e))
+    finally:
+        # Hand the DB connection back from a pool thread rather than the event loop
+        await asyncio.to_thread(db.session.remove)
+        ctx.pop(error)
+
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in response.headers.items()],
+        })
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+    finally:
+        response.close()  # call_on_close hooks (shadow scoring) run after the body is sent
+
+
+# =====================================================================
+# LIFESPAN + ROUTING
+# =====================================================================
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Stripe SDK + SQLAlchemy calls from every in-flight payment share this pool
+            asyncio.get_running_loop().set_default_executor(
+                ThreadPoolExecutor(max_workers=app.config['ASYNC_IO_THREADS'], thread_name_prefix='async-io'))
+            # Fork the process pools before the first connection: a child forked mid-request
+            # inherits that client's socket and the client never sees the connection close
+            with app.app_context():
+                start_scoring_pool()
+                start_hashing_pool()
+                start_shadow_pool()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            shutdown_scoring_pool(wait=False)
+            shutdown_shadow_pool(wait=False)
+            shutdown_hashing_pool(wait=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+
+    view = ASYNC_ROUTES.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+    if view is not None and app.config['ASYNC_PAYMENTS']:
+        return await _dispatch(view, scope, receive, send)
+    return await wsgi_application(scope, receive, send)
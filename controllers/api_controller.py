@@ -1,6 +1,13 @@
 from flask import Blueprint, jsonify, request, current_app
-from flask_jwt_extended import jwt_required, get_jwt, create_access_token, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt, create_access_token
 from models import db, User, Device, Transaction
+from services.admission import admission
+from services.columnar import columnar, transaction_columns, transaction_rows, wants_columnar
+from services.db_routing import use_read_replica, query_metrics_snapshot
+from services.device_counters import device_counters
+from services.request_context import current_identity
+from services.password_hashing import PasswordHasherBusy, hashing_metrics
+from services.stage_timing import stage_timing_snapshot, reset_stage_timing
 from sqlalchemy import func
 from datetime import datetime, timedelta, timezone
 import random
@@ -14,7 +21,14 @@ def login():
     username = request.json.get('username', None)
     password = request.json.get('password', None)
     user = User.query.filter_by(username=username).first()
-    if user and user.check_password(password):
+    try:
+        verified = bool(user) and user.check_password(password)
+        if verified:
+            user.rehash_password_if_needed(password)
+    except PasswordHasherBusy:
+        return jsonify({"msg": "Login temporarily unavailable, please retry"}), 503, {"Retry-After": "1"}
+
+    if verified:
         additional_claims = {"role": user.role}
         if user.role == 'admin':
              # Extract location from username e.g. admin.kl@...
@@ -65,25 +79,30 @@ def get_hybrid_devices(target_device_id=None):
     now = datetime.now(UTC8)
     one_min_ago = now - timedelta(minutes=1)
 
-    # Pre-fetch stats for all devices to avoid N+1 queries if possible
+    # Last-minute counts come from the shared-memory counters (all workers), DB as fallback
+    counters = device_counters()
     results = []
     
     for d in devices:
         # Calculate Real Stats based on last 1 minute of activity
         # Load: defined as % of capacity (e.g. 100 txns/min = 100% load)
         # Latency: Average of last minute
-        
-        # 1. Get transactions for this device in last minute
-        txns = db.session.query(
-            func.count(Transaction.id),
-            func.avg(Transaction.latency)
-        ).filter(
-            Transaction.device_id == d.id,
-            Transaction.timestamp >= one_min_ago
-        ).first()
-
-        count = txns[0] or 0
-        avg_lat = txns[1] or 0
+        window = counters.window_stats(d.id) if counters is not None else None
+
+        if window is not None:
+            count, avg_lat = window
+        else:
+            # 1. Get transactions for this device in last minute
+            txns = db.session.query(
+                func.count(Transaction.id),
+                func.avg(Transaction.latency)
+            ).filter(
+                Transaction.device_id == d.id,
+                Transaction.timestamp >= one_min_ago
+            ).first()
+
+            count = txns[0] or 0
+            avg_lat = txns[1] or 0
 
         # Calculate metrics
         tps = count / 60.0 # TPS
@@ -163,49 +182,49 @@ def generate_latency_history(device_id=None):
 # - Dashboard data (real devices + recent transactions from DB)
 @api_bp.route('/dashboard-data', methods=['GET'])
 @jwt_required()
+@use_read_replica
 def dashboard_data():
     try:
-        claims = get_jwt()
-        user_location = claims.get("userLocation", "").upper()
-
-        # Map region → device id
-        locmap = {
-            "JOHOR": "edge-1", "KEDAH": "edge-2", "KELANTAN": "edge-3",
-            "MALACCA": "edge-4", "NEGERISEMBILAN": "edge-5", "PAHANG": "edge-6",
-            "PENANG": "edge-7", "PERAK": "edge-8", "PERLIS": "edge-9",
-            "SABAH": "edge-10", "SARAWAK": "edge-11", "SELANGOR": "edge-12",
-            "TERENGGANU": "edge-13", "KL": "edge-14", "LABUAN": "edge-15",
-            "PUTRAJAYA": "edge-16"
+        return jsonify(dashboard_payload())
+    except Exception as e:
+        current_app.logger.exception("Failed dashboard")
+        return jsonify({"error": str(e)}), 500
+
+def dashboard_payload():
+    """Dashboard data in the caller's scope (also served by /api/batch)."""
+    ident = current_identity()
+
+    # Region → device id
+    device_id = ident.device_id
+    device = db.session.get(Device, device_id) if device_id else None
+
+    # Get User Balance
+    user = ident.user
+    user_balance = user.balance if user else 0.0
+
+    # Build final device info for dashboard header box
+    device_box = None
+    if device:
+        device_box = {
+            "id": device.id,
+            "location": device.location,
+            "status": (device.status or "").lower(),
+            "syncStatus": "synced" if (device.status or "").lower() == "online" else "pending",
         }
 
-        device_id = locmap.get(user_location, None)
-        device = db.session.get(Device, device_id)
-        
-        # Get User Balance
-        username = get_jwt_identity()
-        user = User.query.filter_by(username=username).first()
-        user_balance = user.balance if user else 0.0
-
-        # Build final device info for dashboard header box
-        device_box = None
-        if device:
-            device_box = {
-                "id": device.id,
-                "location": device.location,
-                "status": (device.status or "").lower(),
-                "syncStatus": "synced" if (device.status or "").lower() == "online" else "pending",
-            }
-
-        # Filter devices list for bottom panel
-        filtered_devices = get_hybrid_devices()
-        if claims.get('role') != 'superadmin' and device_id:
-            filtered_devices = [d for d in filtered_devices if d['id'] == device_id]
-
-        # Filter transactions
-        query = Transaction.query.order_by(Transaction.timestamp.desc())
-        if claims.get('role') != 'superadmin' and device_id:
-            query = query.filter_by(device_id=device_id)
-        
+    # Filter devices list for bottom panel
+    filtered_devices = get_hybrid_devices()
+    if not ident.is_superadmin and device_id:
+        filtered_devices = [d for d in filtered_devices if d['id'] == device_id]
+
+    # Filter transactions
+    query = Transaction.query.order_by(Transaction.timestamp.desc())
+    if not ident.is_superadmin and device_id:
+        query = query.filter_by(device_id=device_id)
+
+    if wants_columnar():
+        txn_data = transaction_columns(transaction_rows(query).limit(5).all())
+    else:
         recent_txns = query.limit(5).all()
         txn_data = []
         for t in recent_txns:
@@ -226,19 +245,13 @@ def dashboard_data():
                 "customer_id": t.customer_id
             })
 
-        return jsonify({
-            "deviceBox": device_box,
-            "devices": filtered_devices,
-            "transactions": txn_data,
-            "devices": filtered_devices,
-            "transactions": txn_data,
-            "latency": generate_latency_history(device_id),
-            "userBalance": user_balance
-        })
-
-    except Exception as e:
-        current_app.logger.exception("Failed dashboard")
-        return jsonify({"error": str(e)}), 500
+    return {
+        "deviceBox": device_box,
+        "devices": filtered_devices,
+        "transactions": txn_data,
+        "latency": generate_latency_history(device_id),
+        "userBalance": user_balance
+    }
 
 def seed_edge_devices():
     """Returns list of 16 predefined Edge Nodes for Malaysia."""
@@ -269,6 +282,8 @@ def init_db():
     try:
         db.drop_all()
         db.create_all()
+        if device_counters() is not None:
+            device_counters().reset()
 
         # ---- Create Superadmin ----
         superadmin = User(username='superadmin@bankedge.com', role='superadmin')
@@ -317,6 +332,7 @@ def init_db():
 # ---------------------------
 @api_bp.route('/system-data', methods=['GET'])
 @jwt_required()
+@use_read_replica
 def system_data():
     try:
         claims = get_jwt()
@@ -366,59 +382,94 @@ def system_data():
         current_app.logger.exception("Failed to fetch system data")
         return jsonify({"error": str(e)}), 500
 
+# ---------------------------
+# DB Query Metrics (Read/Write Routing)
+# ---------------------------
+@api_bp.route('/db-metrics', methods=['GET'])
+@jwt_required()
+def db_metrics():
+    claims = get_jwt()
+    if claims.get('role') != 'superadmin':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    return jsonify(query_metrics_snapshot()), 200
+
+@api_bp.route('/latency-stages', methods=['GET', 'DELETE'])
+@jwt_required()
+def latency_stages():
+    claims = get_jwt()
+    if claims.get('role') != 'superadmin':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    # DELETE clears the histograms (e.g. between Locust runs)
+    if request.method == 'DELETE':
+        reset_stage_timing()
+        return jsonify({'status': 'reset'}), 200
+
+    return jsonify(stage_timing_snapshot()), 200
+
+@api_bp.route('/auth-metrics', methods=['GET'])
+@jwt_required()
+def auth_metrics():
+    claims = get_jwt()
+    if claims.get('role') != 'superadmin':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    return jsonify(hashing_metrics()), 200
+
+@api_bp.route('/admission-metrics', methods=['GET', 'DELETE'])
+@jwt_required()
+def admission_metrics():
+    claims = get_jwt()
+    if claims.get('role') != 'superadmin':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    controller = admission()
+    if controller is None:
+        return jsonify({'enabled': False}), 200
+
+    # DELETE zeroes the per-device counts (e.g. between Locust runs)
+    if request.method == 'DELETE':
+        controller.reset_stats()
+        return jsonify({'status': 'reset'}), 200
+
+    return jsonify(dict(controller.snapshot(), enabled=True)), 200
+
 @api_bp.route('/devices', methods=['GET'])
 @jwt_required()
+@use_read_replica
 def get_devices():
     try:
-        claims = get_jwt()
-        role = claims.get('role')
-        user_location = claims.get("userLocation", "").upper()
-
-        target_device_id = None
-        
-        if role != 'superadmin':
-            # Map region -> device id (Same logic as dashboard_data)
-            locmap = {
-                "JOHOR": "edge-1", "KEDAH": "edge-2", "KELANTAN": "edge-3",
-                "MALACCA": "edge-4", "NEGERISEMBILAN": "edge-5", "PAHANG": "edge-6",
-                "PENANG": "edge-7", "PERAK": "edge-8", "PERLIS": "edge-9",
-                "SABAH": "edge-10", "SARAWAK": "edge-11", "SELANGOR": "edge-12",
-                "TERENGGANU": "edge-13", "KL": "edge-14", "LABUAN": "edge-15",
-                "PUTRAJAYA": "edge-16"
-            }
-            target_device_id = locmap.get(user_location)
-            
-            # If admin has no valid location mapping, return empty or error? 
-            # Returning empty list is safer.
-            if not target_device_id:
-                return jsonify([])
-
-        results = get_hybrid_devices(target_device_id)
-        return jsonify(results)
+        return jsonify(devices_payload())
     except Exception as e:
         current_app.logger.exception("Failed to fetch devices")
         return jsonify({"error": str(e)}), 500
 
+def devices_payload():
+    """Devices in the caller's scope (also served by /api/batch)."""
+    ident = current_identity()
+
+    target_device_id = None
+
+    if not ident.is_superadmin:
+        target_device_id = ident.device_id
+
+        # If admin has no valid location mapping, return empty or error?
+        # Returning empty list is safer.
+        if not target_device_id:
+            return []
+
+    return get_hybrid_devices(target_device_id)
+
 @api_bp.route('/devices/<string:device_id>/power', methods=['POST'])
 @jwt_required()
 def toggle_device_power(device_id):
     try:
-        claims = get_jwt()
-        role = claims.get('role')
-        user_location = claims.get("userLocation", "").upper()
+        ident = current_identity()
 
         # Authorization check
-        if role != 'superadmin':
-            locmap = {
-                "JOHOR": "edge-1", "KEDAH": "edge-2", "KELANTAN": "edge-3",
-                "MALACCA": "edge-4", "NEGERISEMBILAN": "edge-5", "PAHANG": "edge-6",
-                "PENANG": "edge-7", "PERAK": "edge-8", "PERLIS": "edge-9",
-                "SABAH": "edge-10", "SARAWAK": "edge-11", "SELANGOR": "edge-12",
-                "TERENGGANU": "edge-13", "KL": "edge-14", "LABUAN": "edge-15",
-                "PUTRAJAYA": "edge-16"
-            }
-            allowed_device_id = locmap.get(user_location)
-            if device_id != allowed_device_id:
+        if not ident.is_superadmin:
+            if device_id != ident.device_id:
                 return jsonify({'error': 'Unauthorized access to this device'}), 403
 
         device = db.session.get(Device, device_id)
@@ -445,22 +496,11 @@ def toggle_device_power(device_id):
 @jwt_required()
 def sync_device(device_id):
     try:
-        claims = get_jwt()
-        role = claims.get('role')
-        user_location = claims.get("userLocation", "").upper()
+        ident = current_identity()
 
         # Authorization check
-        if role != 'superadmin':
-            locmap = {
-                "JOHOR": "edge-1", "KEDAH": "edge-2", "KELANTAN": "edge-3",
-                "MALACCA": "edge-4", "NEGERISEMBILAN": "edge-5", "PAHANG": "edge-6",
-                "PENANG": "edge-7", "PERAK": "edge-8", "PERLIS": "edge-9",
-                "SABAH": "edge-10", "SARAWAK": "edge-11", "SELANGOR": "edge-12",
-                "TERENGGANU": "edge-13", "KL": "edge-14", "LABUAN": "edge-15",
-                "PUTRAJAYA": "edge-16"
-            }
-            allowed_device_id = locmap.get(user_location)
-            if device_id != allowed_device_id:
+        if not ident.is_superadmin:
+            if device_id != ident.device_id:
                 return jsonify({'error': 'Unauthorized access to this device'}), 403
 
         device = db.session.get(Device, device_id)
@@ -484,86 +524,91 @@ def sync_device(device_id):
 
 @api_bp.route('/ml-data', methods=['GET'])
 @jwt_required()
+@use_read_replica
 def ml_data():
     try:
-        # 1. Determine Scope (User Role & Location)
-        claims = get_jwt()
-        role = claims.get('role')
-        user_location = claims.get("userLocation", "").upper()
-        
-        target_device_id = None
-        if role != 'superadmin':
-            locmap = {
-                "JOHOR": "edge-1", "KEDAH": "edge-2", "KELANTAN": "edge-3",
-                "MALACCA": "edge-4", "NEGERISEMBILAN": "edge-5", "PAHANG": "edge-6",
-                "PENANG": "edge-7", "PERAK": "edge-8", "PERLIS": "edge-9",
-                "SABAH": "edge-10", "SARAWAK": "edge-11", "SELANGOR": "edge-12",
-                "TERENGGANU": "edge-13", "KL": "edge-14", "LABUAN": "edge-15",
-                "PUTRAJAYA": "edge-16"
-            }
-            target_device_id = locmap.get(user_location)
-
-        # 2. Helper to calc stats for a time range (with optional device filter)
-        def get_stats(start_time, end_time, device_id=None):
-            query = Transaction.query.filter(
-                Transaction.timestamp >= start_time, 
-                Transaction.timestamp < end_time
-            )
-            if device_id:
-                query = query.filter_by(device_id=device_id)
-                
-            txns = query.all()
-            
-            if not txns:
-                return {'fraud': 0, 'confidence': 0, 'latency': 0, 'accuracy': 95.0} # Default static accuracy if no data
-            
-            fraud = sum(1 for t in txns if t.processing_decision == 'flagged')
-            confidence = sum(t.confidence for t in txns if t.confidence) / len(txns)
-            latency = sum(t.latency for t in txns) / len(txns)
-            
-            # Use Avg Confidence as a "Live Accuracy" proxy for now
-            return {'fraud': fraud, 'confidence': confidence, 'latency': latency, 'accuracy': confidence * 100}
+        return jsonify(ml_payload())
+    except Exception as e:
+        current_app.logger.exception("Failed to fetch ML data")
+        return jsonify({"error": str(e)}), 500
 
-        # 3. Calculate Trends: Current (Last 24h) vs Previous (24h-48h ago)
-        now = datetime.now(UTC8)
-        one_day_ago = now - timedelta(days=1)
-        two_days_ago = now - timedelta(days=2)
+def ml_payload():
+    """ML insights data in the caller's scope (also served by /api/batch)."""
+    # 1. Determine Scope (User Role & Location)
+    ident = current_identity()
 
-        current = get_stats(one_day_ago, now, target_device_id)
-        previous = get_stats(two_days_ago, one_day_ago, target_device_id)
+    target_device_id = None
+    if not ident.is_superadmin:
+        target_device_id = ident.device_id
 
-        # Trends
-        fraud_trend = current['fraud'] - previous['fraud']
-        conf_trend = round((current['confidence'] - previous['confidence']) * 100, 1)
-        latency_trend = round(current['latency'] - previous['latency'], 0) # ms
-        
-        # Accuracy Trend (using confidence as proxy, scaled to percentage)
-        acc_trend = conf_trend 
-
-        # Real Metrics Object
-        metrics = [{
-            "timestamp": now.isoformat(),
-            "accuracy": 0.95, # Keep static base but show real trend
-            "fraudDetected": current['fraud'],
-            "avgConfidence": current['confidence'],
-            "processingTime": int(current['latency'])
-        }]
-        
-        # Add trends to the response
-        trends = {
-            "fraud": fraud_trend,
-            "confidence": conf_trend,
-            "latency": latency_trend,
-            "accuracy": acc_trend 
-        }
+    # 2. Helper to calc stats for a time range (with optional device filter)
+    def get_stats(start_time, end_time, device_id=None):
+        query = Transaction.query.filter(
+            Transaction.timestamp >= start_time, 
+            Transaction.timestamp < end_time
+        )
+        if device_id:
+            query = query.filter_by(device_id=device_id)
 
-        # 4. Recent Transactions for list (Filtered by Device ID)
-        txn_query = Transaction.query.order_by(Transaction.timestamp.desc())
-        if target_device_id:
-            txn_query = txn_query.filter_by(device_id=target_device_id)
-            
-        recent_txns = txn_query.limit(20).all()
-        
+        txns = query.all()
+
+        if not txns:
+            return {'fraud': 0, 'confidence': 0, 'latency': 0, 'accuracy': 95.0} # Default static accuracy if no data
+
+        fraud = sum(1 for t in txns if t.processing_decision == 'flagged')
+        confidence = sum(t.confidence for t in txns if t.confidence) / len(txns)
+        latency = sum(t.latency for t in txns) / len(txns)
+
+        # Use Avg Confidence as a "Live Accuracy" proxy for now
+        return {'fraud': fraud, 'confidence': confidence, 'latency': latency, 'accuracy': confidence * 100}
+
+    # 3. Calculate Trends: Current (Last 24h) vs Previous (24h-48h ago)
+    now = datetime.now(UTC8)
+    one_day_ago = now - timedelta(days=1)
+    two_days_ago = now - timedelta(days=2)
+
+    current = get_stats(one_day_ago, now, target_device_id)
+    previous = get_stats(two_days_ago, one_day_ago, target_device_id)
+
+    # Trends
+    fraud_trend = current['fraud'] - previous['fraud']
+    conf_trend = round((current['confidence'] - previous['confidence']) * 100, 1)
+    latency_trend = round(current['latency'] - previous['latency'], 0) # ms
+
+    # Accuracy Trend (using confidence as proxy, scaled to percentage)
+    acc_trend = conf_trend 
+
+    # Real Metrics Object
+    metrics = [{
+        "timestamp": now.isoformat(),
+        "accuracy": 0.95, # Keep static base but show real trend
+        "fraudDetected": current['fraud'],
+        "avgConfidence": current['confidence'],
+        "processingTime": int(current['latency'])
+    }]
+
+    # Add trends to the response
+    trends = {
+        "fraud": fraud_trend,
+        "confidence": conf_trend,
+        "latency": latency_trend,
+        "accuracy": acc_trend 
+    }
+
+    # 4. Recent Transactions for list (Filtered by Device ID)
+    txn_query = Transaction.query.order_by(Transaction.timestamp.desc())
+    if target_device_id:
+        txn_query = txn_query.filter_by(device_id=target_device_id)
+
+    recent_txns = txn_query.limit(20).all()
+
+    if wants_columnar():
+        transactions = columnar(
+            ("id", "amount", "type", "decision", "confidence", "deviceId"),
+            [(t.id, t.amount, t.type, t.processing_decision, t.confidence, t.device_id) for t in recent_txns],
+            enum_fields={"type", "decision", "deviceId"}
+        )
+    else:
         transactions = []
         for t in recent_txns:
             transactions.append({
@@ -575,41 +620,38 @@ def ml_data():
                 "deviceId": t.device_id
             })
 
-        # 5. Decisions (Edge vs Cloud) - derived from the same filtered list
-        decisions = []
-        for t in recent_txns:
-            decisions.append({
-                "decision": t.processing_decision,
-                "dataType": "Transaction",
-                "reason": "ML Model Inference",
-                "size": 1, 
-                "priority": "high" if t.amount > 1000 else "medium",
-                "timestamp": t.timestamp.isoformat()
-            })
+    # 5. Decisions (Edge vs Cloud) - derived from the same filtered list
+    decisions = []
+    for t in recent_txns:
+        decisions.append({
+            "decision": t.processing_decision,
+            "dataType": "Transaction",
+            "reason": "ML Model Inference",
+            "size": 1, 
+            "priority": "high" if t.amount > 1000 else "medium",
+            "timestamp": t.timestamp.isoformat()
+        })
 
-        # 6. Latest Verification (Filtered)
-        # Note: 'recent_txns' is already ordered by desc timestamp, so index 0 is the latest.
-        latest_verification = None
-        if recent_txns:
-            latest_txn = recent_txns[0]
-            latest_verification = {
-                "id": latest_txn.id,
-                "amount": latest_txn.amount,
-                "latency": latest_txn.latency,
-                "decision": latest_txn.processing_decision,
-                "confidence": latest_txn.confidence,
-                "timestamp": latest_txn.timestamp.isoformat()
-            }
+    # 6. Latest Verification (Filtered)
+    # Note: 'recent_txns' is already ordered by desc timestamp, so index 0 is the latest.
+    latest_verification = None
+    if recent_txns:
+        latest_txn = recent_txns[0]
+        latest_verification = {
+            "id": latest_txn.id,
+            "amount": latest_txn.amount,
+            "latency": latest_txn.latency,
+            "decision": latest_txn.processing_decision,
+            "confidence": latest_txn.confidence,
+            "timestamp": latest_txn.timestamp.isoformat()
+        }
 
-        return jsonify({
-            "metrics": metrics,
-            "transactions": transactions,
-            "decisions": decisions,
-            "latestVerification": latest_verification
-        })
-    except Exception as e:
-        current_app.logger.exception("Failed to fetch ML data")
-        return jsonify({"error": str(e)}), 500
+    return {
+        "metrics": metrics,
+        "transactions": transactions,
+        "decisions": decisions,
+        "latestVerification": latest_verification
+    }
 
 # ---------------------------
 # User Management Endpoints
@@ -650,6 +692,9 @@ def create_user():
 
         return jsonify({'message': 'User created successfully', 'id': new_user.id, 'username': username}), 201
 
+    except PasswordHasherBusy:
+        db.session.rollback()
+        return jsonify({'error': 'Password hashing busy, please retry'}), 503, {"Retry-After": "1"}
     except Exception as e:
         db.session.rollback()
         current_app.logger.exception("Create user failed")
@@ -679,6 +724,9 @@ def update_user(user_id):
         db.session.commit()
         return jsonify({'message': 'User updated successfully'}), 200
 
+    except PasswordHasherBusy:
+        db.session.rollback()
+        return jsonify({'error': 'Password hashing busy, please retry'}), 503, {"Retry-After": "1"}
     except Exception as e:
         db.session.rollback()
         current_app.logger.exception("Update user failed")
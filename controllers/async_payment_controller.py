@@ -0,0 +1,164 @@
+"""
+asyncio variant of POST /api/payment-success, served by asgi.py.
+
+Same stages as the Flask view (services/payments.py), but a payment holds
+no thread and no DB connection while it waits, so one worker keeps
+thousands in flight:
+
+  1. JWT, then admission control (services/admission.py)   (inline, no I/O)
+  2. Stripe PaymentIntent retrieve                           (I/O thread)
+  3. PaymentMethod retrieve  ||  features -> policy, forest in the scoring pool
+  4. simulated delay (asyncio.sleep)  ||  balance + persist + commit (I/O thread)
+
+Blocking calls (Stripe SDK, SQLAlchemy) go through asyncio.to_thread, which
+carries the request context into the thread. Each DB step ends its session
+transaction before returning, so connections are only checked out for the
+few milliseconds of actual queries, and only one branch of each step
+touches the session.
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import stripe
+from flask import current_app, jsonify, request
+from flask_jwt_extended import verify_jwt_in_request
+
+from models import db, Transaction, LoadTestTransaction
+from services.admission import AdmissionRejected, admission
+from services.loadtest_store import is_load_test_request
+from services.payments import (
+    apply_balance, count_payment, forest_decision, forest_predict, intent_details, log_decision, offloading_inputs,
+    payment_intent_id, policy_decision, resolve_payment_method, retrieve_intent, save_transaction, simulated_delay
+)
+from services.request_context import current_identity
+from services.stage_timing import concurrent_spans
+from services.worker_pool import WorkerPool
+
+# =====================================================================
+# SCORING POOL (forest predict off the event loop)
+# =====================================================================
+# Children forked from a PRELOAD_ML process inherit the loaded forest
+_scoring_pool = WorkerPool(lambda: ProcessPoolExecutor(
+    max_workers=current_app.config.get('ASYNC_SCORING_WORKERS') or os.cpu_count() or 1))
+
+
+def start_pool():
+    _scoring_pool.start()
+
+
+def shutdown_pool(wait=True):
+    _scoring_pool.shutdown(wait=wait)
+
+
+# =====================================================================
+# BLOCKING STEPS (run in I/O threads)
+# =====================================================================
+def _features(data, customer_id, load_test):
+    try:
+        return offloading_inputs(data, customer_id, load_test)
+    finally:
+        db.session.close()  # give the connection back before the decision is awaited
+
+
+def _persist(TxnModel, pi_id, ident, details, raw_status, payment_method, label, latency_ms):
+    """Balance check/deduction and the payment row in one short transaction; returns the final status."""
+    final_status = "succeeded" if raw_status == "succeeded" else "failed"
+    final_status, old_balance, new_balance = apply_balance(ident.user, pi_id, final_status, details["amount"])
+    txn = db.session.get(TxnModel, pi_id)
+    previous = (txn.timestamp, txn.latency) if txn is not None else None
+    save_transaction(TxnModel, txn, pi_id, details, final_status, (old_balance, new_balance),
+                     payment_method, label, latency_ms)
+    db.session.commit()
+    count_payment(TxnModel, details, latency_ms, previous)
+    return final_status
+
+
+async def _timed(spans, name, awaitable):
+    with spans.span(name):
+        return await awaitable
+
+
+async def _decide(pi_id, data, details, load_test):
+    """Edge vs Cloud: distilled policy inline (sub-microsecond), forest in the scoring pool."""
+    try:
+        inputs = await asyncio.to_thread(_features, data, details["customer_id"], load_test)
+        if inputs is None:
+            print("Random Forest Model not found. Using default decision (Cloud).")
+            return "cloud"
+
+        policy, model_path, latency_val, txn_count = inputs
+        amount_rm = details["amount"]
+        decision = policy_decision(policy, model_path, amount_rm, latency_val, txn_count)
+        if decision is None:
+            label, live_ms = await asyncio.get_running_loop().run_in_executor(
+                _scoring_pool.get(), forest_predict, model_path, amount_rm, latency_val, txn_count)
+            decision = forest_decision(policy, label, live_ms)
+        log_decision(pi_id, amount_rm, latency_val, txn_count, decision)
+        return decision[0]
+
+    except Exception as e:
+        print("ML Prediction Failed:", e)
+        return "cloud"  # Fallback
+
+
+# =====================================================================
+# PAYMENT SUCCESS (coroutine; asgi.py pushes the request context)
+# =====================================================================
+async def payment_success_async():
+    spans = concurrent_spans()
+
+    with spans.span('identity'):
+        verify_jwt_in_request()
+        data = request.get_json() or {}
+        pi_id = payment_intent_id(data)
+
+    if not pi_id:
+        return jsonify({"error": "payment_intent is required"}), 400
+
+    controller = admission()
+    if controller is None:
+        return await _process_payment(spans, data, pi_id)
+    try:
+        with spans.span('admission'):
+            await controller.admit_async(current_identity().payment_device_id)
+    except AdmissionRejected as e:
+        return e.response()
+    try:
+        return await _process_payment(spans, data, pi_id)
+    finally:
+        controller.release()
+
+
+async def _process_payment(spans, data, pi_id):
+    try:
+        stripe.api_key = current_app.config.get("STRIPE_SECRET_KEY")
+
+        ident = current_identity()
+
+        # Load-test traffic is stored in its own table / DB file
+        TxnModel = LoadTestTransaction if is_load_test_request(pi_id) else Transaction
+
+        with spans.span('stripe_retrieve'):
+            intent, raw_status = await asyncio.to_thread(retrieve_intent, pi_id, data, ident.username)
+        details = intent_details(intent, data, ident)
+
+        payment_method, label = await asyncio.gather(
+            _timed(spans, 'payment_method_retrieve', asyncio.to_thread(resolve_payment_method, intent)),
+            _timed(spans, 'offloading_decision',
+                   _decide(pi_id, data, details, load_test=TxnModel is LoadTestTransaction)),
+        )
+
+        # The stored latency is drawn up front, so the row is written while the delay elapses
+        delay = simulated_delay(label)
+        _, final_status = await asyncio.gather(
+            _timed(spans, 'simulated_sleep', asyncio.sleep(delay)),
+            _timed(spans, 'commit', asyncio.to_thread(
+                _persist, TxnModel, pi_id, ident, details, raw_status, payment_method, label, delay * 1000.0)),
+        )
+        return jsonify({"status": "saved", "id": pi_id, "stripe_status": final_status}), 200
+
+    except Exception as e:
+        current_app.logger.exception("Failed to save payment-success (async)")
+        await asyncio.to_thread(db.session.rollback)
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,83 @@
+"""
+/api/batch: several read-only API resources in one request.
+
+    GET /api/batch?include=devices,ml-data&format=columnar
+
+The JWT is verified and the caller's scope (role, device) resolved once.
+Each resource then runs on a thread pool in its own copy of the request
+context, so it gets its own app context and DB session (reads go to the
+read bind), and the payloads come back keyed by resource name. A resource
+that raises is reported under "errors" without failing the others.
+
+Query parameters are shared: ?page/?per_page select the "transactions"
+page and ?format=columnar applies to every listing. Each resource's time
+is recorded as a stage of this endpoint (/api/latency-stages).
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Blueprint, copy_current_request_context, current_app, g, jsonify, request
+from flask_jwt_extended import jwt_required
+
+from controllers.api_controller import dashboard_payload, devices_payload, ml_payload
+from controllers.transactions_controller import transactions_payload
+from services.db_routing import ROUTE_READ, use_read_replica
+from services.request_context import current_identity
+from services.stage_timing import concurrent_spans
+from services.worker_pool import WorkerPool
+
+batch_bp = Blueprint('batch_api', __name__, url_prefix='/api')
+
+# ?include= name -> payload of the matching standalone endpoint
+BATCH_RESOURCES = {
+    'devices': devices_payload,            # /api/devices
+    'ml-data': ml_payload,                 # /api/ml-data
+    'dashboard': dashboard_payload,        # /api/dashboard-data
+    'transactions': transactions_payload,  # /api/transactions
+}
+
+
+# =====================================================================
+# POOL
+# =====================================================================
+_pool = WorkerPool(lambda: ThreadPoolExecutor(max_workers=current_app.config.get('BATCH_WORKERS', 4),
+                                               thread_name_prefix='batch'))
+
+
+# =====================================================================
+# BATCH ENDPOINT
+# =====================================================================
+@batch_bp.route('/batch', methods=['GET'])
+@jwt_required()
+@use_read_replica
+def batch():
+    names = list(dict.fromkeys(n.strip() for n in request.args.get('include', '').split(',') if n.strip()))
+    unknown = [n for n in names if n not in BATCH_RESOURCES]
+    if not names or unknown:
+        return jsonify({'error': f"include must list one or more of: {', '.join(BATCH_RESOURCES)}",
+                        'unknown': unknown}), 400
+
+    ident = current_identity()
+    spans = concurrent_spans()
+
+    def task(name):
+        @copy_current_request_context
+        def run():
+            g.db_route = ROUTE_READ
+            g._identity = ident.copy()
+            with spans.span(name):
+                return BATCH_RESOURCES[name]()
+        return run
+
+    pool = _pool.get()
+    futures = {name: pool.submit(task(name)) for name in names}
+
+    results, errors = {}, {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            current_app.logger.exception(f"Batch resource {name} failed")
+            errors[name] = str(e)
+    if errors:
+        results['errors'] = errors
+    return jsonify(results), 200
@@ -1,75 +1,63 @@
 import os
 import stripe
+from time import sleep
 from flask import Blueprint, jsonify, request, current_app
-from datetime import datetime, timezone, timedelta
-from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
-
-from models import db, Transaction, Device, User
+from flask_jwt_extended import jwt_required, get_jwt
+
+from models import db, Transaction, LoadTestTransaction, Device
+from services.admission import admission_controlled
+from services.columnar import transaction_columns, transaction_rows, wants_columnar
+from services.db_routing import use_read_replica
+from services.live_model import ValidationRateLimited, last_validation, live_model_stats, start_validation
+from services.loadtest_store import is_load_test_request
+from services.offloading_policy import POLICY_FILENAME, get_policy, policy_stats
+from services.payments import (
+    apply_balance, count_payment, forest_decision, forest_predict, intent_details, log_decision, offloading_inputs,
+    payment_intent_id, policy_decision, resolve_payment_method, retrieve_intent, save_transaction, simulated_delay
+)
+from services.request_context import current_identity
+from services.shadow_eval import register_candidate, shadow_stats
+from services.stage_timing import lap
 
 transactions_bp = Blueprint('transactions_api', __name__, url_prefix='/api')
 
 
-# =====================================================================
-# DEVICE MAPPING: Map user email with region and device table
-# =====================================================================
-def get_device_for_user(username):
-    """
-    Convert admin.<region>@bankedge.com to the correct device_id.
-    Always reliable.
-    """
-    if not username or "@bankedge.com" not in username:
-        return None
-
-    prefix = username.split("@")[0]  # admin.kl
-    if "." not in prefix:
-        return None
-
-    region_code = prefix.split(".")[1].strip().upper()
-
-    # canonical mapping (same as frontend)
-    locmap = {
-        "JOHOR": "edge-1", "KEDAH": "edge-2", "KELANTAN": "edge-3",
-        "MALACCA": "edge-4", "NEGERISEMBILAN": "edge-5", "PAHANG": "edge-6",
-        "PENANG": "edge-7", "PERAK": "edge-8", "PERLIS": "edge-9",
-        "SABAH": "edge-10", "SARAWAK": "edge-11", "SELANGOR": "edge-12",
-        "TERENGGANU": "edge-13", "KL": "edge-14", "LABUAN": "edge-15",
-        "PUTRAJAYA": "edge-16"
-    }
-
-    return locmap.get(region_code, None)
-
 # =====================================================================
 # GET ALL TRANSACTIONS
 # =====================================================================
 @transactions_bp.route("/transactions", methods=["GET"])
 @jwt_required()
+@use_read_replica
 def get_transactions():
-    claims = get_jwt()
-    role = claims.get('role')
-    user_location = claims.get("userLocation", "").upper()
+    return jsonify(transactions_payload()), 200
+
+
+def transactions_payload():
+    """One page (?page, ?per_page) of transactions in the caller's scope (also served by /api/batch)."""
+    ident = current_identity()
 
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
 
     query = Transaction.query.order_by(Transaction.timestamp.desc())
 
-    if role != 'superadmin':
-        # Map region -> device id (Same logic as other controllers)
-        locmap = {
-            "JOHOR": "edge-1", "KEDAH": "edge-2", "KELANTAN": "edge-3",
-            "MALACCA": "edge-4", "NEGERISEMBILAN": "edge-5", "PAHANG": "edge-6",
-            "PENANG": "edge-7", "PERAK": "edge-8", "PERLIS": "edge-9",
-            "SABAH": "edge-10", "SARAWAK": "edge-11", "SELANGOR": "edge-12",
-            "TERENGGANU": "edge-13", "KL": "edge-14", "LABUAN": "edge-15",
-            "PUTRAJAYA": "edge-16"
-        }
-        target_device_id = locmap.get(user_location)
+    if not ident.is_superadmin:
+        target_device_id = ident.device_id
 
         if target_device_id:
             query = query.filter_by(device_id=target_device_id)
         else:
             # If no valid device mapping found for admin, return empty
-            return jsonify({"transactions": [], "total": 0, "pages": 0, "current_page": page}), 200
+            return {"transactions": [], "total": 0, "pages": 0, "current_page": page}
+
+    if wants_columnar():
+        pagination = transaction_rows(query).paginate(page=page, per_page=per_page, error_out=False)
+        return {
+            "transactions": transaction_columns(pagination.items),
+            "total": pagination.total,
+            "pages": pagination.pages,
+            "current_page": page
+        }
 
     pagination = query.paginate(page=page, per_page=per_page, error_out=False)
     transactions = pagination.items
@@ -81,7 +69,6 @@ def get_transactions():
             "amount": t.amount,
             "type": t.type,
             "stripe_status": t.stripe_status,
-            "stripe_status": t.stripe_status,
             "processing_decision": t.processing_decision,
             "merchant_name": t.merchant_name,
             "device_id": t.device_id,
@@ -94,12 +81,12 @@ def get_transactions():
             "timestamp": t.timestamp.isoformat() if t.timestamp else None
         })
 
-    return jsonify({
+    return {
         "transactions": result,
         "total": pagination.total,
         "pages": pagination.pages,
         "current_page": page
-    }), 200
+    }
 
 
 # =====================================================================
@@ -147,8 +134,8 @@ def update_payment_intent(intent_id):
             return jsonify({"error": "Amount is required"}), 400
 
         # BALANCE CHECK
-        username = get_jwt_identity()
-        user = User.query.filter_by(username=username).first()
+        ident = current_identity()
+        user = ident.user
         if not user:
              return jsonify({'error': 'User not found'}), 404
 
@@ -160,8 +147,8 @@ def update_payment_intent(intent_id):
         amount_cents = int(float(amount) * 100)
 
         # Get user info from JWT
-        username = get_jwt_identity() or ""
-        device_id = get_device_for_user(username)
+        username = ident.username or ""
+        device_id = ident.payment_device_id
 
         # Update the existing PaymentIntent
         intent = stripe.PaymentIntent.modify(
@@ -191,17 +178,14 @@ def update_payment_intent(intent_id):
 # =====================================================================
 @transactions_bp.route('/payment-success', methods=['POST'])
 @jwt_required()
+@admission_controlled
 def payment_success():
     # Saves final payment result (after Stripe redirect or immediate confirm).
     # Only store: succeeded / failed (mapped).
+    # Stages live in services/payments.py; asgi.py serves an asyncio variant of this flow.
 
     data = request.get_json() or {}
-    pi_id = (
-        data.get('payment_intent')
-        or data.get('paymentIntent')
-        or data.get('paymentIntentId')
-        or data.get('payment_intent_id')
-    )
+    pi_id = payment_intent_id(data)
 
     if not pi_id:
         return jsonify({"error": "payment_intent is required"}), 400
@@ -209,197 +193,44 @@ def payment_success():
     try:
         stripe.api_key = current_app.config.get("STRIPE_SECRET_KEY")
 
-        # Retrieve PaymentIntent from Stripe
-        try:
-            if pi_id.startswith("pi_sim_"):
-                # --- LOCUST DEMO SIMULATION ---
-                import random
-                is_fail = random.random() < 0.1
-                raw_status = "requires_payment_method" if is_fail else "succeeded"
-
-                # Mock an intent object so downstream logic works
-                class MockIntent:
-                    def __init__(self):
-                        self.amount = int(float(data.get("amount", 0)) * 100)
-                        self.payment_method = None
-                        self.metadata = {
-                            "recipient_account": data.get("recipient_account", "Demo Recipient"),
-                            "reference": data.get("reference", "Demo Ref"),
-                            "customer_id": get_jwt_identity(),
-                            "device_id": data.get("device_id")
-                        }
-                        self.charges = None
-                        self.status = raw_status
-
-                intent = MockIntent()
-            else:
-                intent = stripe.PaymentIntent.retrieve(pi_id)
-                raw_status = getattr(intent, "status", None)
+        ident = current_identity()
 
-        except Exception as e:
-            current_app.logger.warning("Stripe retrieve failed: %s", e)
-            intent = None
-            raw_status = None
+        # Load-test traffic is stored in its own table / DB file
+        TxnModel = LoadTestTransaction if is_load_test_request(pi_id) else Transaction
+        lap('identity')
 
+        # Retrieve PaymentIntent from Stripe
+        intent, raw_status = retrieve_intent(pi_id, data, ident.username)
         final_status = "succeeded" if raw_status == "succeeded" else "failed"
+        lap('stripe_retrieve')
 
-        # -----------------------------------------------------------------
-        # BALANCE DEDUCTION LOGIC
-        # Only deduct if status is succeeded and we haven't processed this yet
-        # -----------------------------------------------------------------
-        username = get_jwt_identity()
-        user = User.query.filter_by(username=username).first()
-
-        old_balance = 0.0
-        new_balance = 0.0
-
-        # Determine amount
-        if intent and getattr(intent, "amount", None) is not None:
-             amount_rm = float(intent.amount) / 100.0
-        else:
-             amount_rm = float(data.get("amount", 0.0))
-
-        if user and final_status == 'succeeded':
-            # --- BALANCE CHECK ---
-            # Bypass check for LOCUST DEMO SIMULATION
-            if not pi_id.startswith("pi_sim_"):
-                current_bal_check = user.balance if user.balance is not None else 0.0
-                if current_bal_check < amount_rm:
-                     final_status = "failed" # Reject real transactions due to insufficient funds
-
-        if user and final_status == 'succeeded':
-            old_balance = user.balance if user.balance is not None else 0.0
-            if user.balance is None: user.balance = 0.0
-
-            # --- LOCUST DEMO SIMULATION BYPASS ---
-            # Do not deduct money for load testing interactions
-            if not pi_id.startswith("pi_sim_"):
-                user.balance -= amount_rm
-
-            new_balance = user.balance
-
-        elif user:
-            old_balance = user.balance if user.balance is not None else 0.0
-            new_balance = user.balance if user.balance is not None else 0.0
-        payment_method = "unknown"
-        try:
-            pm_id = getattr(intent, "payment_method", None)
-            if pm_id:
-                pm_obj = stripe.PaymentMethod.retrieve(pm_id)
-                pm_type = getattr(pm_obj, "type", "").lower()
-                if pm_type == "card":
-                    payment_method = "card"
-                elif pm_type == "grabpay":
-                    payment_method = "grabpay"
-                elif pm_type == "fpx":
-                    bank = None
-                    try:
-                        bank = getattr(pm_obj, "fpx", {}).get("bank") if pm_obj and getattr(pm_obj, "fpx", None) else None
-                        if bank:
-                            payment_method = f"fpx_{bank.lower()}"
-                        else:
-                            payment_method = "fpx"
-                    except Exception:
-                        payment_method = "fpx"
-                else:
-                    payment_method = pm_type or "unknown"
-            else:
-                # fallback: inspect charges' payment_method_details if available
-                if intent and getattr(intent, "charges", None) and getattr(intent.charges, "data", None):
-                    ch = intent.charges.data[0]
-                    pmd = getattr(ch, "payment_method_details", {}) or {}
-                    if pmd.get("card"):
-                        payment_method = "card"
-                    elif pmd.get("grabpay"):
-                        payment_method = "grabpay"
-                    elif pmd.get("fpx"):
-                        bank = pmd.get("fpx", {}).get("bank")
-                        payment_method = f"fpx_{bank.lower()}" if bank else "fpx"
-
-        except Exception as e:
-            current_app.logger.warning("PAYMENT METHOD PARSE ERROR: %s", e)
-
-        # Extract metadata values (recipient + reference + customer + device if any)
-        md = getattr(intent, "metadata", {}) if intent else {}
-        recipient_account = md.get("recipient_account") or data.get("recipientAccount")
-        reference = md.get("reference") or data.get("reference")
-        customer_from_metadata = md.get("customer_id") or None
-        device_from_metadata = md.get("device_id") or None
-
-        # Determine device_id from JWT claims as fallback
-        claims = get_jwt() or {}
-        username_claim = claims.get("sub") or get_jwt_identity()
-        user_location = claims.get("userLocation", "").upper()
-
-        location_map = {
-            "JOHOR": "edge-1", "KEDAH": "edge-2", "KELANTAN": "edge-3",
-            "MALACCA": "edge-4", "NEGERISEMBILAN": "edge-5", "PAHANG": "edge-6",
-            "PENANG": "edge-7", "PERAK": "edge-8", "PERLIS": "edge-9",
-            "SABAH": "edge-10", "SARAWAK": "edge-11", "SELANGOR": "edge-12",
-            "TERENGGANU": "edge-13", "KL": "edge-14", "LABUAN": "edge-15",
-            "PUTRAJAYA": "edge-16"
-        }
-        device_id = device_from_metadata or get_device_for_user(username_claim)
-        customer_id = customer_from_metadata or (username_claim or None)
+        # Balance deduction: only if succeeded (and never for pi_sim_ load tests)
+        details = intent_details(intent, data, ident)
+        amount_rm = details["amount"]
+        final_status, old_balance, new_balance = apply_balance(ident.user, pi_id, final_status, amount_rm)
+        lap('user_lookup')
 
-        # Determine amount (RM)
-        if intent and getattr(intent, "amount", None) is not None:
-            amount_rm = float(intent.amount) / 100.0
-        else:
-            amount_rm = float(data.get("amount", 0.0))
+        payment_method = resolve_payment_method(intent)
+        lap('payment_method_retrieve')
 
         # Create or update DB record
-        txn = db.session.get(Transaction, pi_id)
+        txn = db.session.get(TxnModel, pi_id)
+        previous = (txn.timestamp, txn.latency) if txn is not None else None
+        lap('txn_lookup')
 
-        # ML PREDICTION (Edge vs Cloud Offloading)
+        # ML PREDICTION (Edge vs Cloud Offloading): distilled policy first, forest as fallback
         processed_at_label = "cloud"
-        latency_val = 0.0
         try:
-            # Simulate latency logic
-            import numpy as np
-            import joblib
-            import pandas as pd
-
-            # Load Model
-            model_path = os.path.join(current_app.root_path, 'ml_models', 'offloading_model.pkl')
-            if os.path.exists(model_path):
-                # Use joblib to load (faster and supports compression used in training)
-                clf = joblib.load(model_path)
-                
-                # Mock realtime latency (OR accept injection from Load Test)
-                if data.get('latency') is not None:
-                     latency_val = float(data.get('latency'))
-                else:
-                     latency_val = float(int(np.random.gamma(shape=2.0, scale=10.0)))
-                # device_load_val = float(np.random.uniform(10, 95))
-
-                # Calculate Frequency (Pattern Learning)
-                txn_count = 0
-                if customer_id:
-                    cutoff_date = datetime.now(timezone.utc) - timedelta(days=30)
-                    txn_count = Transaction.query.filter(
-                        Transaction.customer_id == customer_id,
-                        Transaction.timestamp >= cutoff_date
-                    ).count()
-
-                # Predict
-                input_df = pd.DataFrame([{
-                    'amount': amount_rm,
-                    'type': 'Transfer',
-                    'latency': latency_val,
-                    'txn_count_last_30d': txn_count
-                }])
-                processed_at_label = clf.predict(input_df)[0]
-
-                # --- ML PROOF LOGGING ---
-                print("\n" + "="*50)
-                print(f" [ML PROOF - RANDOM FOREST] Transaction Processing")
-                print(f"   > ID: {pi_id}")
-                print(f"   > Inputs: Amount={amount_rm}, Latency={latency_val}, TxnCount={txn_count}")
-                print(f"   > Prediction: {processed_at_label.upper()}")
-                print(f"   > Confidence: {0.9 if processed_at_label == 'edge' else 0.7}")
-                print("="*50 + "\n")
-                # ------------------------
+            inputs = offloading_inputs(data, details["customer_id"], load_test=TxnModel is LoadTestTransaction)
+            if inputs is not None:
+                policy, model_path, latency_val, txn_count = inputs
+                decision = policy_decision(policy, model_path, amount_rm, latency_val, txn_count)
+                if decision is None:
+                    label, live_ms = forest_predict(model_path, amount_rm, latency_val, txn_count)
+                    decision = forest_decision(policy, label, live_ms)
+                processed_at_label = decision[0]
+                log_decision(pi_id, amount_rm, latency_val, txn_count, decision)
+                lap('ml_logging')
             else:
                 print("Random Forest Model not found. Using default decision (Cloud).")
 
@@ -408,62 +239,18 @@ def payment_success():
             processed_at_label = "cloud" # Fallback
 
         # --- REALISTIC LATENCY SIMULATION ---
-        import time
-        import random
-
-        simulated_delay = 0.0
-        if processed_at_label == 'cloud':
-            # Simulate WAN RTT: 200ms to 500ms
-            simulated_delay = random.uniform(0.2, 0.5)
-            time.sleep(simulated_delay)
-        else:
-            # Simulate Edge processing time (very fast): 5ms to 15ms
-            simulated_delay = random.uniform(0.005, 0.015)
-            time.sleep(simulated_delay)
+        delay = simulated_delay(processed_at_label)
+        sleep(delay)
+        lap('simulated_sleep')
 
         # Store this actual delay in the DB (converted to ms)
-        final_latency = simulated_delay * 1000.0
-        # --------------------------------------------
-
-        if not txn:
-            txn = Transaction(
-                id=pi_id,
-                amount=amount_rm,
-                stripe_status=final_status,
-                timestamp=datetime.now(timezone(timedelta(hours=8))),
-
-                old_balance_org=old_balance,
-                new_balance_org=new_balance,
-                is_fraud=False,
-                recipient_account=recipient_account,
-                reference=reference,
-
-                merchant_name=payment_method,
-                device_id=device_id,
-                customer_id=customer_id,
-                type="Transfer",
-
-                # ML Logic (Real-Time)
-                processing_decision=processed_at_label, # 'edge' or 'cloud'
-                confidence=0.9 if processed_at_label == 'edge' else 0.7,
-
-                latency=final_latency
-
-            )
-            db.session.add(txn)
-        else:
-            txn.amount = amount_rm
-            txn.stripe_status = final_status
-            txn.merchant_name = payment_method
-            txn.device_id = device_id
-            txn.customer_id = customer_id
-            txn.recipient_account = recipient_account
-            txn.reference = reference
-            txn.timestamp = datetime.now(timezone(timedelta(hours=8)))
-            if final_status == "succeeded":
-                txn.confidence = 1.0
+        save_transaction(TxnModel, txn, pi_id, details, final_status, (old_balance, new_balance),
+                         payment_method, processed_at_label, delay * 1000.0)
+        lap('build_txn')
 
         db.session.commit()
+        lap('commit')
+        count_payment(TxnModel, details, delay * 1000.0, previous)
         return jsonify({"status": "saved", "id": pi_id, "stripe_status": final_status}), 200
 
     except Exception as e:
@@ -481,26 +268,71 @@ def ml_diagnosis():
     if cl.get("role") != "superadmin":
         return jsonify({"error": "Unauthorized"}), 403
 
-    import joblib
-    import os
-
+    # The artifact on disk + the model this worker is serving (no reload; see /ml-diagnosis/validate)
     model_path = os.path.join(current_app.root_path, 'ml_models', 'offloading_model.pkl')
-    exists = os.path.exists(model_path)
-    
-    status = {
-        "model_path": model_path,
-        "exists": exists,
-        "size_bytes": os.path.getsize(model_path) if exists else 0,
-        "loadable": False,
-        "error": None
+    status = live_model_stats(model_path)
+    status["last_validation"] = last_validation(model_path)
+
+    # Distilled fast-path policy: fidelity vs the forest (from training) + live usage
+    policy = get_policy(os.path.join(current_app.root_path, 'ml_models', POLICY_FILENAME))
+    status["policy"] = {
+        "enabled": bool(current_app.config.get('OFFLOADING_FAST_PATH', True)),
+        "exists": policy is not None,
+        "min_confidence": policy.min_confidence if policy else None,
+        "fidelity": policy.artifact.get("fidelity") if policy else None,
+        "usage": policy_stats(),
     }
 
-    if exists:
-        try:
-            # Use joblib to verify loading
-            _ = joblib.load(model_path)
-            status["loadable"] = True
-        except Exception as e:
-            status["error"] = str(e)
+    # Shadow candidate: agreement with the live decision + per-model inference latency
+    status["shadow"] = shadow_stats()
 
     return jsonify(status), 200
+
+
+# =====================================================================
+# RELOAD VALIDATION (subprocess in the background, rate-limited)
+# =====================================================================
+@transactions_bp.route('/ml-diagnosis/validate', methods=['POST'])
+@jwt_required()
+def ml_validate():
+    cl = get_jwt()
+    if cl.get("role") != "superadmin":
+        return jsonify({"error": "Unauthorized"}), 403
+
+    model_path = os.path.join(current_app.root_path, 'ml_models', 'offloading_model.pkl')
+    if not os.path.exists(model_path):
+        return jsonify({"error": "model not found", "model_path": model_path}), 404
+
+    try:
+        pending = start_validation(model_path, current_app.config.get('MODEL_VALIDATE_MIN_INTERVAL', 300))
+    except ValidationRateLimited as e:
+        resp = jsonify({"error": str(e), "retry_after": e.retry_after})
+        resp.headers['Retry-After'] = str(e.retry_after)
+        return resp, 429
+
+    # The result shows up as last_validation in GET /api/ml-diagnosis (any worker)
+    return jsonify(pending), 202
+
+
+# =====================================================================
+# SHADOW CANDIDATE REGISTRATION
+# =====================================================================
+@transactions_bp.route('/ml-shadow', methods=['POST', 'DELETE'])
+@jwt_required()
+def ml_shadow():
+    cl = get_jwt()
+    if cl.get("role") != "superadmin":
+        return jsonify({"error": "Unauthorized"}), 403
+
+    name = None
+    if request.method == 'POST':
+        name = (request.get_json(silent=True) or {}).get("model")
+        if not name:
+            return jsonify({"error": "model is required (file name in ml_models/)"}), 400
+
+    try:
+        path = register_candidate(name)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+
+    return jsonify({"candidate": os.path.basename(path) if path else None}), 200
@@ -0,0 +1,64 @@
+"""
+Production server config (gunicorn, pre-fork).
+
+    gunicorn -c gunicorn.conf.py app:app
+
+* preload_app: the master imports app.py once with PRELOAD_ML=1, so numpy,
+  pandas, sklearn and both offloading artifacts are loaded before fork and
+  shared copy-on-write by every worker (see services/warmup.py).
+* gthread workers: a payment spends most of its time sleeping (simulated
+  WAN latency, Stripe calls) and a few ms on CPU (forest predict; bcrypt
+  runs in its own process pool). Threads overlap the waits, processes give
+  CPU parallelism past the GIL, so WEB_CONCURRENCY defaults to the core
+  count and WEB_THREADS to 16.
+* The retention and feature-compaction threads started by app.py run once,
+  in the master, instead of once per worker.
+"""
+import multiprocessing
+import os
+
+# Must be set before the app is imported in the master
+os.environ.setdefault('PRELOAD_ML', '1')
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 16))
+preload_app = True
+
+# A request is at most ~0.5s of simulated latency plus Stripe; 60s means a hung worker
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+# SIGTERM: stop accepting, let in-flight payments finish for up to this long
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+accesslog = os.environ.get('WEB_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('WEB_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    # Connections opened by the master (init, preload, maintenance threads) stay
+    # with the master; the worker starts with an empty pool of its own
+    from app import app
+    from models import db
+    from services.password_hashing import start_pool as start_hashing_pool
+    from services.shadow_eval import start_pool as start_shadow_pool
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+        # Fork the worker's process pools now, while it holds no client sockets
+        # (a pool forked mid-request keeps that connection open in the child)
+        start_hashing_pool()
+        start_shadow_pool()
+
+
+def worker_exit(server, worker):
+    # Stop this worker's bcrypt / shadow-scoring process pools with it
+    from services.password_hashing import shutdown_pool as shutdown_hashing_pool
+    from services.shadow_eval import shutdown_pool as shutdown_shadow_pool
+
+    shutdown_hashing_pool(wait=True)
+    shutdown_shadow_pool(wait=False)
@@ -1,8 +1,12 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from datetime import datetime, timezone, timedelta
+from services.db_routing import RoutingSession
+from services.loadtest_store import LOADTEST_BIND_KEY
+from services.password_hashing import hash_password, verify_password, needs_rehash
 
-db = SQLAlchemy()
+# RoutingSession sends queries from read-only views to the 'read' bind (if configured)
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 bcrypt = Bcrypt()
 
 UTC8 = timezone(timedelta(hours=8))
@@ -20,11 +24,19 @@ class User(db.Model):
     balance = db.Column(db.Float, default=100000.0)  # NEW: Initial balance RM 100,000
     last_login = db.Column(db.DateTime, nullable=True)
 
+    # bcrypt runs in a bounded process pool (services/password_hashing.py)
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def rehash_password_if_needed(self, password):
+        """Re-hash with the configured BCRYPT_LOG_ROUNDS after a successful login."""
+        if needs_rehash(self.password_hash):
+            self.password_hash = hash_password(password, op='rehash')
+            return True
+        return False
 
 
 # ==========================
@@ -44,11 +56,9 @@ class Device(db.Model):
 
 
 # ==========================
-# Transaction Model (UPDATED)
+# Transaction Columns (shared by live + load-test tables)
 # ==========================
-class Transaction(db.Model):
-    __tablename__ = 'transaction'
-
+class TransactionMixin:
     id = db.Column(db.String(100), primary_key=True)
     amount = db.Column(db.Float, nullable=False)
 
@@ -67,7 +77,6 @@ class Transaction(db.Model):
     reference = db.Column(db.String(200), nullable=True)
 
     merchant_name = db.Column(db.String(100))
-    device_id = db.Column(db.String(50), db.ForeignKey('device.id'), nullable=True)
     type = db.Column(db.String(50), default='Transfer')
     customer_id = db.Column(db.String(150), nullable=True)
 
@@ -92,5 +101,77 @@ class Transaction(db.Model):
             'latency': self.latency,
         }
 
+
+# ==========================
+# Transaction Model (UPDATED)
+# ==========================
+class Transaction(TransactionMixin, db.Model):
+    __tablename__ = 'transaction'
+
+    device_id = db.Column(db.String(50), db.ForeignKey('device.id'), nullable=True)
+
+
+# ==========================
+# Load-Test Transaction Model
+# ==========================
+class LoadTestTransaction(TransactionMixin, db.Model):
+    """Synthetic (Locust) payments, kept out of the production table/file."""
+    __tablename__ = 'loadtest_transaction'
+    __bind_key__ = LOADTEST_BIND_KEY
+
+    # No FK: the load-test bind may be a separate database file
+    device_id = db.Column(db.String(50), nullable=True)
+
+
+# ==========================
+# Customer Feature Store (maintained on every transaction write)
+# ==========================
+class CustomerFeatureMixin:
+    customer_id = db.Column(db.String(150), primary_key=True)
+    txn_count_total = db.Column(db.Integer, nullable=False, default=0)
+    amount_sum_total = db.Column(db.Float, nullable=False, default=0.0)
+    first_seen = db.Column(db.DateTime)
+    last_seen = db.Column(db.DateTime)
+
+
+class CustomerFeatureBucketMixin:
+    """Per-customer daily (UTC+8) counts/sums; rolling features are summed from these."""
+    customer_id = db.Column(db.String(150), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    txn_count = db.Column(db.Integer, nullable=False, default=0)
+    amount_sum = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class CustomerFeature(CustomerFeatureMixin, db.Model):
+    __tablename__ = 'customer_features'
+
+
+class CustomerFeatureBucket(CustomerFeatureBucketMixin, db.Model):
+    __tablename__ = 'customer_feature_buckets'
+
+
+class LoadTestCustomerFeature(CustomerFeatureMixin, db.Model):
+    __tablename__ = 'loadtest_customer_features'
+    __bind_key__ = LOADTEST_BIND_KEY
+
+
+class LoadTestCustomerFeatureBucket(CustomerFeatureBucketMixin, db.Model):
+    __tablename__ = 'loadtest_customer_feature_buckets'
+    __bind_key__ = LOADTEST_BIND_KEY
+
+# ==========================
+# Offloading Score (batch re-scoring side table)
+# ==========================
+class OffloadingScore(db.Model):
+    """Decision a given model version makes for a historical transaction."""
+    __tablename__ = 'offloading_score'
+
+    transaction_id = db.Column(db.String(100), primary_key=True)
+    model_version = db.Column(db.String(100), primary_key=True)
+    decision = db.Column(db.String(20), nullable=False)
+    previous_decision = db.Column(db.String(20))
+    txn_count_last_30d = db.Column(db.Float)
+    scored_at = db.Column(db.DateTime, default=lambda: datetime.now(UTC8))
+
 def get_all_transactions():
     return Transaction.query.order_by(Transaction.timestamp.desc()).all()
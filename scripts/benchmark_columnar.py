@@ -0,0 +1,130 @@
+"""
+Row vs columnar (?format=columnar) transaction listings.
+
+Seeds a throwaway DB with N transactions, then for each size fetches
+/api/transactions?per_page=N as superadmin in both formats and reports
+payload bytes (raw and gzip) and time. Two timings per format:
+  request    whole request through the test client (query + encode + JSON)
+  serialize  rows already loaded; building the payload + JSON only
+
+Usage:
+    python scripts/benchmark_columnar.py
+    python scripts/benchmark_columnar.py --rows 1000 10000 --repeat 7
+"""
+import sys
+import os
+import json
+import gzip
+import random
+import argparse
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Add project root to path
+sys.path.append(ROOT)
+
+UTC8 = timezone(timedelta(hours=8))
+
+
+def median_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000.0)
+    return statistics.median(times)
+
+
+def seed(db, Transaction, rows):
+    now = datetime.now(UTC8)
+    db.session.bulk_insert_mappings(Transaction, [{
+        "id": f"pi_bench_{i}",
+        "amount": round(random.uniform(5, 15000), 2),
+        "stripe_status": "succeeded" if random.random() < 0.9 else "failed",
+        "timestamp": now - timedelta(seconds=i),
+        "old_balance_org": 0.0,
+        "new_balance_org": 0.0,
+        "is_fraud": False,
+        "recipient_account": f"1234{i % 997:06d}",
+        "reference": f"Invoice {i}",
+        "merchant_name": random.choice(["card", "grabpay", "fpx_maybank2u"]),
+        "device_id": f"edge-{random.randint(1, 16)}",
+        "customer_id": "admin.kl@bankedge.com",
+        "type": "Transfer",
+        "processing_decision": random.choice(["edge", "edge", "cloud", "flagged"]),
+        "confidence": random.choice([0.9, 0.7, 1.0]),
+        "latency": round(random.uniform(5, 500), 3),
+    } for i in range(rows)])
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare row and columnar transaction listings.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.update(DATABASE_URL='sqlite:///' + os.path.join(tmp, 'columnar.db'), LOADTEST_RETENTION_INTERVAL='0',
+                      CUSTOMER_FEATURES_COMPACT_INTERVAL='0', BCRYPT_LOG_ROUNDS='4')
+
+    from app import app
+    from models import db, Transaction
+    from services.columnar import transaction_columns, transaction_rows
+
+    client = app.test_client()
+    client.get('/api/init-db')
+    token = client.post('/api/login', json={'username': 'superadmin@bankedge.com',
+                                            'password': 'SuperAdmin@123'}).json['access_token']
+    headers = {'Authorization': 'Bearer ' + token}
+
+    with app.app_context():
+        seed(db, Transaction, max(args.rows))
+
+    print("\n" + "="*78)
+    print(f" TRANSACTION LISTING: rows vs columnar (median of {args.repeat})")
+    print("="*78)
+    print(f" {'rows':>6}  {'format':<9} {'bytes':>10} {'gzip':>9} {'request ms':>11} {'serialize ms':>13}")
+
+    for n in args.rows:
+        url = f'/api/transactions?page=1&per_page={n}'
+        results = {}
+        for fmt in ('rows', 'columnar'):
+            full_url = url + ('&format=columnar' if fmt == 'columnar' else '')
+            body = client.get(full_url, headers=headers).get_data()
+            request_ms = median_ms(lambda: client.get(full_url, headers=headers), args.repeat)
+
+            with app.test_request_context(full_url):
+                query = Transaction.query.order_by(Transaction.timestamp.desc())
+                if fmt == 'columnar':
+                    loaded = transaction_rows(query).limit(n).all()
+                    encode = lambda: json.dumps(transaction_columns(loaded))
+                else:
+                    loaded = query.limit(n).all()
+                    for t in loaded:
+                        t.device  # relationship loaded up front, as the listing would
+                    encode = lambda: json.dumps([{
+                        "id": t.id, "amount": t.amount, "type": t.type, "stripe_status": t.stripe_status,
+                        "processing_decision": t.processing_decision, "merchant_name": t.merchant_name,
+                        "device_id": t.device_id, "device_name": t.device.name if t.device else "Unknown",
+                        "latency": t.latency, "confidence": t.confidence, "customer_id": t.customer_id,
+                        "recipient_account": t.recipient_account, "reference": t.reference,
+                        "timestamp": t.timestamp.isoformat() if t.timestamp else None
+                    } for t in loaded])
+                serialize_ms = median_ms(encode, args.repeat)
+
+            results[fmt] = (len(body), len(gzip.compress(body)), request_ms, serialize_ms)
+            print(f" {n:>6}  {fmt:<9} {len(body):>10,} {results[fmt][1]:>9,} {request_ms:>11.1f} {serialize_ms:>13.1f}")
+
+        rows_r, col_r = results['rows'], results['columnar']
+        print(f" {'':>6}  {'ratio':<9} {col_r[0] / rows_r[0]:>10.2f} {col_r[1] / rows_r[1]:>9.2f} "
+              f"{col_r[2] / rows_r[2]:>11.2f} {col_r[3] / rows_r[3]:>13.2f}")
+    print("="*78 + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Response compression: size and CPU cost per gzip level.
+
+Seeds a throwaway DB (same generator as benchmark_columnar.py), captures the
+uncompressed bodies of the large API responses as superadmin, then for each
+COMPRESS_LEVEL reports the compressed size and the time to gzip the body.
+Last column: whole request through the test client with
+`Accept-Encoding: gzip` at the app's COMPRESS_LEVEL, vs without it.
+
+Usage:
+    python scripts/benchmark_compression.py
+    python scripts/benchmark_compression.py --rows 5000 --levels 1 6 9 --repeat 9
+"""
+import sys
+import os
+import argparse
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Add project root to path
+sys.path.append(ROOT)
+
+from benchmark_columnar import median_ms, seed
+
+ENDPOINTS = [
+    '/api/system-data',
+    '/api/dashboard-data',
+    '/api/transactions?page=1&per_page=1000',
+    '/api/transactions?page=1&per_page=1000&format=columnar',
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure gzip size and CPU cost of the large API responses.")
+    parser.add_argument("--rows", type=int, default=2000, help="transactions to seed")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 3, 6, 9])
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.update(DATABASE_URL='sqlite:///' + os.path.join(tmp, 'compression.db'), LOADTEST_RETENTION_INTERVAL='0',
+                      CUSTOMER_FEATURES_COMPACT_INTERVAL='0', BCRYPT_LOG_ROUNDS='4')
+
+    from app import app
+    from models import db, Transaction
+    from services.compression import gzip_bytes
+
+    client = app.test_client()
+    client.get('/api/init-db')
+    token = client.post('/api/login', json={'username': 'superadmin@bankedge.com',
+                                            'password': 'SuperAdmin@123'}).json['access_token']
+    plain = {'Authorization': 'Bearer ' + token}
+    gzipped = dict(plain, **{'Accept-Encoding': 'gzip'})
+
+    with app.app_context():
+        seed(db, Transaction, args.rows)
+
+    print("\n" + "="*96)
+    print(f" RESPONSE COMPRESSION ({args.rows} transactions, median of {args.repeat}, "
+          f"app COMPRESS_LEVEL={app.config['COMPRESS_LEVEL']})")
+    print("="*96)
+
+    for url in ENDPOINTS:
+        body = client.get(url, headers=plain).get_data()
+        print(f"\n {url}  ({len(body):,} bytes uncompressed)")
+        print(f"   {'level':>5} {'bytes':>10} {'ratio':>7} {'gzip ms':>9} {'MB/s':>8}")
+        for level in args.levels:
+            size = len(gzip_bytes(body, level))
+            ms = median_ms(lambda: gzip_bytes(body, level), args.repeat)
+            print(f"   {level:>5} {size:>10,} {size / len(body):>7.3f} {ms:>9.2f} {len(body) / 1e3 / ms:>8.1f}")
+
+        response = client.get(url, headers=gzipped)
+        # get_data() drains streamed bodies, so their compression is inside the timing
+        off_ms = median_ms(lambda: client.get(url, headers=plain).get_data(), args.repeat)
+        on_ms = median_ms(lambda: client.get(url, headers=gzipped).get_data(), args.repeat)
+        print(f"   request: {off_ms:.1f} ms identity -> {on_ms:.1f} ms gzip "
+              f"({response.headers.get('Content-Encoding', 'identity')}, "
+              f"{'streamed' if 'Content-Length' not in response.headers else 'buffered'}, "
+              f"{len(response.get_data()):,} bytes)")
+    print("\n" + "="*96 + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import sys
+import os
+import json
+import time
+import argparse
+import tempfile
+import itertools
+import statistics
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import joblib
+from sklearn.model_selection import train_test_split
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.preprocessing import OneHotEncoder
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.offloading_features import (
+    CATEGORICAL_FEATURES, TARGET, load_transactions, add_txn_count_last_30d
+)
+
+DEFAULT_INPUT = 'ml_data/transactions_dataset_500k_latest.csv'
+DEFAULT_REPORT = 'ml_models/offloading_pareto.json'
+
+# Feature sets the search may choose from; the app always sends all four columns,
+# unused ones are simply dropped by the ColumnTransformer.
+FEATURE_SETS = {
+    'full': ['amount', 'type', 'latency', 'txn_count_last_30d'],
+    'no_type': ['amount', 'latency', 'txn_count_last_30d'],
+    'latency_amount': ['amount', 'latency'],
+    'latency_only': ['latency'],
+}
+
+SINGLE_ROW_REPEATS = 200
+BATCH_ROWS = 1000
+
+# Populated in each pool worker (inherited on fork, rebuilt by the initializer otherwise)
+_DATA = {}
+
+
+def build_candidate(n_estimators, max_depth, feature_set):
+    features = FEATURE_SETS[feature_set]
+    transformers = [('num', 'passthrough', [f for f in features if f not in CATEGORICAL_FEATURES])]
+    categorical = [f for f in features if f in CATEGORICAL_FEATURES]
+    if categorical:
+        transformers.append(('cat', OneHotEncoder(handle_unknown='ignore'), categorical))
+
+    return Pipeline(steps=[
+        ('preprocessor', ColumnTransformer(transformers=transformers)),
+        # One core per candidate: the pool supplies the parallelism
+        ('classifier', RandomForestClassifier(n_estimators=n_estimators, max_depth=max_depth,
+                                              random_state=42, n_jobs=1))
+    ])
+
+
+def _init_worker(data):
+    _DATA.update(data)
+
+
+def evaluate_candidate(params):
+    """Train one candidate and measure everything the edge path cares about."""
+    X_train, X_test, y_train, y_test = (_DATA[k] for k in ('X_train', 'X_test', 'y_train', 'y_test'))
+    clf = build_candidate(**params)
+
+    start = time.perf_counter()
+    clf.fit(X_train, y_train)
+    train_s = time.perf_counter() - start
+
+    y_pred = clf.predict(X_test)
+
+    # Same serialisation as the production artifact
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'candidate.pkl')
+        joblib.dump(clf, path, compress=3)
+        size_bytes = os.path.getsize(path)
+
+        start = time.perf_counter()
+        loaded = joblib.load(path)
+        load_ms = (time.perf_counter() - start) * 1000.0
+
+    # Single-row latency: one-row DataFrame, like payment_success builds
+    row = X_test.iloc[[0]]
+    loaded.predict(row)
+    samples = []
+    for _ in range(SINGLE_ROW_REPEATS):
+        start = time.perf_counter()
+        loaded.predict(row)
+        samples.append((time.perf_counter() - start) * 1000.0)
+    samples.sort()
+
+    batch = X_test.iloc[:BATCH_ROWS]
+    start = time.perf_counter()
+    loaded.predict(batch)
+    batch_ms = (time.perf_counter() - start) * 1000.0
+
+    return {
+        **params,
+        "accuracy": round(accuracy_score(y_test, y_pred), 4),
+        "f1_macro": round(f1_score(y_test, y_pred, average='macro'), 4),
+        "train_s": round(train_s, 3),
+        "size_bytes": size_bytes,
+        "load_ms": round(load_ms, 3),
+        "single_row_p50_ms": round(statistics.median(samples), 3),
+        "single_row_p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3),
+        "batch_us_per_row": round(batch_ms * 1000.0 / len(batch), 3),
+    }
+
+
+# =====================================================================
+# PARETO FRONT: maximise accuracy, minimise latency and artifact size
+# =====================================================================
+def _dominates(a, b):
+    better_or_equal = (a["accuracy"] >= b["accuracy"]
+                       and a["single_row_p50_ms"] <= b["single_row_p50_ms"]
+                       and a["size_bytes"] <= b["size_bytes"])
+    strictly_better = (a["accuracy"] > b["accuracy"]
+                       or a["single_row_p50_ms"] < b["single_row_p50_ms"]
+                       or a["size_bytes"] < b["size_bytes"])
+    return better_or_equal and strictly_better
+
+
+def mark_pareto(results):
+    for r in results:
+        r["pareto"] = not any(_dominates(o, r) for o in results if o is not r)
+    return results
+
+
+def cheapest_meeting(results, min_accuracy):
+    eligible = [r for r in results if r["accuracy"] >= min_accuracy]
+    if not eligible:
+        return None
+    return min(eligible, key=lambda r: (r["single_row_p50_ms"], r["size_bytes"], -r["accuracy"]))
+
+
+def _parse_list(value, cast):
+    return [None if v.strip().lower() == 'none' else cast(v) for v in value.split(',')]
+
+
+def run_search(input_file, estimators, depths, feature_sets, workers, min_accuracy, report_path, save_best):
+    if not os.path.exists(input_file):
+        print(f"Error: {input_file} not found.")
+        return
+
+    print(f"Loading data from {input_file}...")
+    df = add_txn_count_last_30d(load_transactions(input_file))
+    X = df[FEATURE_SETS['full']]
+    y = df[TARGET].astype(str)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    data = {"X_train": X_train, "X_test": X_test, "y_train": y_train, "y_test": y_test}
+
+    grid = [{"n_estimators": n, "max_depth": d, "feature_set": f}
+            for n, d, f in itertools.product(estimators, depths, feature_sets)]
+    workers = workers or os.cpu_count() or 1
+    print(f"Evaluating {len(grid)} candidates on {workers} worker processes...")
+
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data,)) as pool:
+        futures = {pool.submit(evaluate_candidate, params): params for params in grid}
+        for future in as_completed(futures):
+            r = future.result()
+            results.append(r)
+            print(f"   n={r['n_estimators']:<4} depth={str(r['max_depth']):<5} {r['feature_set']:<15} "
+                  f"acc={r['accuracy']:.4f} p50={r['single_row_p50_ms']:.2f}ms size={r['size_bytes'] / 1024:.0f}KB")
+    elapsed = time.perf_counter() - start
+
+    mark_pareto(results)
+    results.sort(key=lambda r: (not r["pareto"], r["single_row_p50_ms"]))
+    best = cheapest_meeting(results, min_accuracy)
+
+    print("\n" + "="*100)
+    print(f" PARETO REPORT ({len(grid)} candidates, {elapsed:.1f}s wall, {workers} workers)")
+    print(f"   {'n':>4} {'depth':>5} {'features':<15} {'acc':>7} {'f1':>7} {'train s':>8} "
+          f"{'size KB':>8} {'load ms':>8} {'p50 ms':>7} {'p95 ms':>7} {'batch us':>9}")
+    for r in results:
+        if not r["pareto"]:
+            continue
+        print(f"   {r['n_estimators']:>4} {str(r['max_depth']):>5} {r['feature_set']:<15} {r['accuracy']:>7.4f} "
+              f"{r['f1_macro']:>7.4f} {r['train_s']:>8.2f} {r['size_bytes'] / 1024:>8.0f} {r['load_ms']:>8.1f} "
+              f"{r['single_row_p50_ms']:>7.2f} {r['single_row_p95_ms']:>7.2f} {r['batch_us_per_row']:>9.2f}")
+    if best:
+        print(f"\n   Cheapest with accuracy >= {min_accuracy}: n_estimators={best['n_estimators']}, "
+              f"max_depth={best['max_depth']}, features={best['feature_set']} "
+              f"({best['accuracy']:.4f}, {best['single_row_p50_ms']:.2f}ms, {best['size_bytes'] / 1024:.0f}KB)")
+    else:
+        print(f"\n   No candidate reached accuracy >= {min_accuracy}")
+    print("="*100 + "\n")
+
+    report_dir = os.path.dirname(report_path)
+    if report_dir and not os.path.exists(report_dir):
+        os.makedirs(report_dir)
+    with open(report_path, 'w') as f:
+        json.dump({
+            "input": input_file,
+            "rows": len(df),
+            "workers": workers,
+            "wall_s": round(elapsed, 3),
+            "min_accuracy": min_accuracy,
+            "recommended": best,
+            "candidates": results,
+        }, f, indent=2)
+    print(f"Report written to {report_path}")
+
+    if save_best and best:
+        params = {k: best[k] for k in ('n_estimators', 'max_depth', 'feature_set')}
+        clf = build_candidate(**params).fit(X, y)
+        model_path = 'ml_models/offloading_model.pkl'
+        joblib.dump(clf, model_path, compress=3)
+        print(f"Recommended model retrained on all rows and saved to {model_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter search for the offloading model.")
+    parser.add_argument("--input", default=DEFAULT_INPUT)
+    parser.add_argument("--estimators", default="10,25,50,100", help="comma-separated n_estimators")
+    parser.add_argument("--depths", default="4,8,16,none", help="comma-separated max_depth ('none' = unlimited)")
+    parser.add_argument("--feature-sets", default=",".join(FEATURE_SETS),
+                        help=f"comma-separated, from: {', '.join(FEATURE_SETS)}")
+    parser.add_argument("--workers", type=int, default=0, help="pool size (0 = all cores)")
+    parser.add_argument("--min-accuracy", type=float, default=0.95)
+    parser.add_argument("--report", default=DEFAULT_REPORT)
+    parser.add_argument("--save-best", action="store_true",
+                        help="retrain the recommended candidate on all rows and save it as the production model")
+    args = parser.parse_args()
+
+    unknown = [f for f in args.feature_sets.split(',') if f not in FEATURE_SETS]
+    if unknown:
+        parser.error(f"unknown feature set(s): {', '.join(unknown)}")
+
+    run_search(args.input, _parse_list(args.estimators, int), _parse_list(args.depths, int),
+               args.feature_sets.split(','), args.workers, args.min_accuracy, args.report, args.save_best)
@@ -0,0 +1,44 @@
+"""
+Build the fingerprinted CSS/JS bundles into static/dist.
+
+Writes one content-hashed file per bundle (services/assets.py BUNDLES) and
+static/dist/manifest.json, which the templates resolve through asset_url().
+Run at image build time; the app also rebuilds at startup when the manifest
+is missing or older than a source.
+
+Usage:
+    python scripts/build_assets.py
+    python scripts/build_assets.py --no-minify
+"""
+import sys
+import os
+import argparse
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Add project root to path
+sys.path.append(ROOT)
+
+from services.assets import BUNDLES, build_assets
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build content-hashed static bundles into static/dist.")
+    parser.add_argument("--no-minify", action="store_true", help="concatenate CSS without minifying")
+    args = parser.parse_args()
+
+    static_folder = os.path.join(ROOT, 'static')
+    manifest = build_assets(static_folder, minify=not args.no_minify)
+
+    print("\n" + "="*72)
+    print(" STATIC BUNDLES")
+    print("="*72)
+    for name, built in sorted(manifest.items()):
+        source_bytes = sum(os.path.getsize(os.path.join(static_folder, s)) for s in BUNDLES[name])
+        built_bytes = os.path.getsize(os.path.join(static_folder, built))
+        print(f" {name:<12} -> {built:<32} {source_bytes:>8,} -> {built_bytes:>8,} bytes")
+    print("="*72 + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,87 +1,168 @@
+"""
+BankEdge workload model.
+
+Four kinds of user, mixed by weight:
+
+  BankEdgeUser      (6)  regional admins making payments, all 16 regions
+  DashboardPoller   (3)  regional dashboards and ML Insights pages refreshing
+  TransactionPager  (2)  regional admins paging through their transactions
+  SystemViewer      (1)  the superadmin on the system-management pages
+
+Each regional class hands out the 16 admin accounts round-robin, so every
+region (and so every edge device) gets traffic. LOCUST_USER pins all of
+them to one account instead. A login shed by the server (429/503) is
+retried with backoff that honours Retry-After; a user still logged out
+tries again before its next task instead of sitting idle for the run.
+
+Open http://localhost:8089 to control the test, or run it headless:
+
+    locust -f scripts/locustfile.py --headless -u 150 -r 10 -t 60s --host http://127.0.0.1:5000 --check-slo
+
+Load shapes (they replace -u / -r / -t):
+
+    LOAD_SHAPE=ramp  ramp up to --shape-users over --shape-ramp-seconds, hold for --shape-hold-seconds
+    LOAD_SHAPE=step  add --shape-step-users every --shape-step-seconds until --shape-users, then hold
+
+--check-slo compares each endpoint's p50/p95/p99 and failure ratio with
+SLOS (or the JSON file given with --slo-file) when the run ends, prints
+the result and exits with code 1 if any endpoint is outside its SLO.
+"""
+import itertools
+import json
+import math
 import os
-import time
 import random
-from locust import HttpUser, task, between, events
-# Open http://localhost:8089 to control the test
+import sys
+import time
+
+from locust import HttpUser, LoadTestShape, between, events, task
+from locust.runners import WorkerRunner
+
+ADMIN_PASSWORD = "Admin@123"
+SUPERADMIN = ("superadmin@bankedge.com", "SuperAdmin@123")
+
+LOGIN_ATTEMPTS = 4        # per login(); on_start and then each task while logged out
+LOGIN_BACKOFF_S = 0.5     # doubled per attempt, never below the server's Retry-After
+LOGIN_BACKOFF_MAX_S = 8.0
+LOGIN_REJECTED_WAIT_S = 30.0  # after a non-shed failure (bad credentials, 5xx)
+
+# Same accounts as /api/init-db; the part before @ is the region
+REGIONS = [
+    "johor", "kedah", "kelantan", "malacca", "negerisembilan", "pahang", "penang", "perak",
+    "perlis", "sabah", "sarawak", "selangor", "terengganu", "kl", "labuan", "putrajaya",
+]
+
+# Request name -> {p50, p95, p99 (ms), fail_ratio}. "*" applies to any other name.
+SLOS = {
+    "/api/login":                  {"p50": 1000, "p95": 3000, "p99": 5000, "fail_ratio": 0.01},
+    "/api/payment-success":        {"p50": 800, "p95": 2000, "p99": 3000, "fail_ratio": 0.01},
+    "/api/dashboard-data":         {"p50": 200, "p95": 800, "p99": 1500, "fail_ratio": 0.0},
+    "/api/transactions?page=[n]":  {"p50": 200, "p95": 800, "p99": 1500, "fail_ratio": 0.0},
+    "/api/batch":                  {"p50": 300, "p95": 1000, "p99": 2000, "fail_ratio": 0.0},
+    "/api/system-data":            {"p50": 300, "p95": 1000, "p99": 2000, "fail_ratio": 0.0},
+    "*":                           {"p50": 300, "p95": 1000, "p99": 2000, "fail_ratio": 0.0},
+}
 
-import sqlite3
 
-class BankEdgeUser(HttpUser):
-    wait_time = between(1, 3) # Simulated user think time
+@events.init_command_line_parser.add_listener
+def _(parser):
+    parser.add_argument("--check-slo", action="store_true", default=False,
+                        help="Check per-endpoint p50/p95/p99 and failure ratio SLOs at the end; exit 1 on a miss")
+    parser.add_argument("--slo-file", type=str, default="",
+                        help="JSON file with SLOs in the same form as SLOS (replaces the built-in ones)")
+    parser.add_argument("--slo-min-requests", type=int, default=20,
+                        help="Endpoints with fewer requests are reported but not checked")
+    parser.add_argument("--shape-users", type=int, default=150, help="LOAD_SHAPE: peak users")
+    parser.add_argument("--shape-ramp-seconds", type=int, default=120, help="LOAD_SHAPE=ramp: ramp-up time")
+    parser.add_argument("--shape-hold-seconds", type=int, default=60, help="LOAD_SHAPE: time held at peak")
+    parser.add_argument("--shape-step-users", type=int, default=25, help="LOAD_SHAPE=step: users added per step")
+    parser.add_argument("--shape-step-seconds", type=int, default=30, help="LOAD_SHAPE=step: length of a step")
+
+
+# =====================================================================
+# USERS
+# =====================================================================
+class BankEdgeBase(HttpUser):
+    abstract = True
+    wait_time = between(1, 3)  # Simulated user think time
+    accounts = None  # itertools.cycle of (username, password), one per class
+    load_test = False  # send X-Load-Test (LOADTEST_ROUTING=header keeps pi_sim_ rows in the load-test table)
+
     token = None
     headers = {}
-
-    def get_latest_user_from_db(self):
-        """Fetches the most recently logged-in user from the local database."""
-        try:
-            # Connect to DB (assuming running from project root)
-            db_path = "bankedge.db"
-            if not os.path.exists(db_path):
-                # Fallback if running from scripts folder
-                db_path = "../bankedge.db"
-            
-            if not os.path.exists(db_path):
-                print("Warning: bankedge.db not found. Using default user.")
-                return None
-
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            # Get the user who logged in most recently
-            cursor.execute("SELECT username FROM user ORDER BY last_login DESC LIMIT 1")
-            result = cursor.fetchone()
-            conn.close()
-            
-            if result:
-                return result[0]
-        except Exception as e:
-            print(f"DB Read Error: {e}")
-        return None
+    next_login_at = 0.0
 
     def on_start(self):
         """Login once at the start of the session"""
-        
-        # --- STRATEGY 1: BEST PRACTICE (Uncomment or use Env Var) ---
-        # For AWS testing, it is best to be explicit.
-        target_user = "admin.kl@bankedge.com" 
-        # target_user = os.environ.get("LOCUST_USER")
-        
-        # --- STRATEGY 2: CONVENIENCE (DISABLED for Cloud Testing) ---
-        if not target_user:
-            active_user = self.get_latest_user_from_db()
-            if active_user:
-                print(f"Auto-detected active dashboard user: {active_user}")
-                target_user = active_user
-        
-        # --- STRATEGY 3: FALLBACK ---
-        if not target_user:
-            target_user = "admin.johor@bankedge.com"
-
-        try:
-            response = self.client.post("/api/login", json={
-                "username": target_user,
-                "password": "Admin@123"
-            })
-            if response.status_code == 200:
-                self.token = response.json().get('access_token')
-                self.headers = {"Authorization": f"Bearer {self.token}"}
-                print(f"--> Locust simulating traffic for: {target_user}")
+        pinned = os.environ.get("LOCUST_USER")
+        if pinned:
+            self.username, self.password = pinned, os.environ.get("LOCUST_PASSWORD", ADMIN_PASSWORD)
+        else:
+            self.username, self.password = next(self.accounts)
+        self.login()
+
+    def login(self):
+        """Up to LOGIN_ATTEMPTS tries; a shed login (429/503) backs off for max(Retry-After, backoff)."""
+        for attempt in range(LOGIN_ATTEMPTS):
+            with self.client.post("/api/login", json={"username": self.username, "password": self.password},
+                                  catch_response=True) as response:
+                if response.status_code == 200:
+                    self.token = response.json().get("access_token")
+                    self.headers = {"Authorization": f"Bearer {self.token}"}
+                    if self.load_test:
+                        self.headers["X-Load-Test"] = "1"
+                    return True
+                if response.status_code not in (429, 503):
+                    response.failure(f"Login failed for {self.username}: {response.status_code}")
+                    self.next_login_at = time.monotonic() + LOGIN_REJECTED_WAIT_S
+                    return False
+                # Shed: counted against the login error-rate SLO, then retried
+                response.failure(f"Login shed ({response.status_code})")
+                try:
+                    retry_after = float(response.headers.get("Retry-After", 0))
+                except ValueError:
+                    retry_after = 0.0
+            delay = max(retry_after, min(LOGIN_BACKOFF_S * 2 ** attempt, LOGIN_BACKOFF_MAX_S))
+            if attempt == LOGIN_ATTEMPTS - 1:
+                self.next_login_at = time.monotonic() + delay
             else:
-                print(f"Login failed for {target_user}:", response.text)
-        except Exception as e:
-            print("Login error:", e)
+                time.sleep(delay * random.uniform(1.0, 1.5))  # jitter spreads out the retries
+        return False
+
+    def logged_in(self):
+        """Tasks call this first: a user whose login was shed logs in again instead of staying idle."""
+        if self.token is None and time.monotonic() >= self.next_login_at:
+            self.login()
+        return self.token is not None
+
+    def get(self, path, name=None):
+        with self.client.get(path, headers=self.headers, name=name, catch_response=True) as response:
+            if response.status_code != 200:
+                response.failure(f"Failed with {response.status_code}: {response.text[:200]}")
+            return response
+
+
+def regional_accounts():
+    return itertools.cycle([(f"admin.{region}@bankedge.com", ADMIN_PASSWORD) for region in REGIONS])
+
+
+class BankEdgeUser(BankEdgeBase):
+    """Makes payments."""
+    weight = 6
+    accounts = regional_accounts()
+    load_test = True
 
     @task
     def process_transaction(self):
-        if not self.token:
+        if not self.logged_in():
             return
 
         # Randomize amount to trigger both Cloud (>5k) and Edge (<5k) logic
         # 70% chance of Edge (Low amount), 30% chance of Cloud (High amount)
         if random.random() < 0.7:
-             amount = random.randint(100, 4999) # Edge
+            amount = random.randint(100, 4999)  # Edge
         else:
-             amount = random.randint(5001, 15000) # Cloud
+            amount = random.randint(5001, 15000)  # Cloud
 
         # Fake PaymentIntent ID
         fake_pi_id = f"pi_sim_{int(time.time()*1000)}_{random.randint(1000,9999)}"
@@ -89,23 +170,166 @@ class BankEdgeUser(HttpUser):
         payload = {
             "amount": amount,
             "merchant": "Locust Load Test",
-            "region": "KL",
+            "region": self.username.split("@")[0].split(".")[-1].upper(),
             "payment_intent": fake_pi_id,
-            "recipient_account": "1234567890", 
+            "recipient_account": "1234567890",
             "reference": "LoadTest",
-            
+
             # --- UT-07 PROOF: Inject Latency ---
             # 10% of traffic mimics high network delay (>300ms) to trigger Cloud Offloading
             "latency": random.randint(300, 500) if random.random() < 0.1 else random.randint(5, 20)
         }
 
-        # We assume the decision logic (Edge/Cloud) happens on the server 
-        # based on the 'amount' and other factors.
-        # We just measure how long it takes.
-        
         with self.client.post("/api/payment-success", json=payload, headers=self.headers, catch_response=True) as response:
-            if response.status_code == 200:
-                # You can assert checks here if needed
-                pass
-            else:
-                response.failure(f"Failed with {response.status_code}: {response.text}")
+            if response.status_code in (429, 503):
+                # Shed by admission control: counted against the error-rate SLO
+                response.failure(f"Shed ({response.status_code})")
+            elif response.status_code != 200:
+                response.failure(f"Failed with {response.status_code}: {response.text[:200]}")
+
+
+class DashboardPoller(BankEdgeBase):
+    """A regional Dashboard (every 30 s in the browser) or ML Insights tab (10 s), refreshing faster."""
+    weight = 3
+    wait_time = between(3, 6)
+    accounts = regional_accounts()
+
+    @task(3)
+    def dashboard(self):
+        if self.logged_in():
+            self.get("/api/dashboard-data?format=columnar", name="/api/dashboard-data")
+
+    @task(1)
+    def ml_insights(self):
+        if self.logged_in():
+            self.get("/api/batch?include=devices,ml-data", name="/api/batch")
+
+
+class TransactionPager(BankEdgeBase):
+    """Opens the Transactions page, then pages through it a few pages at a time."""
+    weight = 2
+    accounts = regional_accounts()
+    page = 1
+
+    @task(1)
+    def open_page(self):
+        if self.logged_in():
+            self.page = 1
+            self.get("/api/batch?include=transactions,dashboard&page=1&per_page=5", name="/api/batch")
+
+    @task(4)
+    def next_page(self):
+        if not self.logged_in():
+            return
+        self.page += 1
+        response = self.get(f"/api/transactions?page={self.page}&per_page=5&format=columnar",
+                            name="/api/transactions?page=[n]")
+        if response.ok and self.page >= response.json().get("pages", 0):
+            self.page = 0  # past the last page: start over
+
+
+class SystemViewer(BankEdgeBase):
+    """The superadmin on the system-management pages."""
+    weight = 1
+    wait_time = between(2, 5)
+    accounts = itertools.repeat(SUPERADMIN)
+
+    @task(3)
+    def system_data(self):
+        if self.logged_in():
+            self.get("/api/system-data")
+
+    @task(2)
+    def devices(self):
+        if self.logged_in():
+            self.get("/api/devices")
+
+    @task(1)
+    def metrics(self):
+        if self.logged_in():
+            self.get("/api/db-metrics")
+            self.get("/api/admission-metrics")
+
+
+# =====================================================================
+# LOAD SHAPES (LOAD_SHAPE=ramp|step; locust uses any non-abstract shape it finds)
+# =====================================================================
+LOAD_SHAPE = os.environ.get("LOAD_SHAPE", "").lower()
+
+
+class RampShape(LoadTestShape):
+    abstract = LOAD_SHAPE != "ramp"
+
+    def tick(self):
+        opts = self.runner.environment.parsed_options
+        run_time = self.get_run_time()
+        if run_time > opts.shape_ramp_seconds + opts.shape_hold_seconds:
+            return None
+        ramp = min(run_time / max(opts.shape_ramp_seconds, 1), 1.0)
+        users = max(1, math.ceil(opts.shape_users * ramp))
+        return users, max(opts.shape_users / max(opts.shape_ramp_seconds, 1), 1)
+
+
+class StepShape(LoadTestShape):
+    abstract = LOAD_SHAPE != "step"
+
+    def tick(self):
+        opts = self.runner.environment.parsed_options
+        steps = math.ceil(opts.shape_users / opts.shape_step_users)
+        run_time = self.get_run_time()
+        if run_time > steps * opts.shape_step_seconds + opts.shape_hold_seconds:
+            return None
+        step = min(int(run_time // opts.shape_step_seconds) + 1, steps)
+        return min(step * opts.shape_step_users, opts.shape_users), opts.shape_step_users
+
+
+# =====================================================================
+# SLO CHECK (headless runs)
+# =====================================================================
+def check_slos(stats, slos, min_requests):
+    """Prints one line per endpoint; returns the list of misses."""
+    misses = []
+    print(f"\n{'SLO check':<32}{'reqs':>7}{'p50':>8}{'p95':>8}{'p99':>8}{'fail%':>8}")
+    for (name, method), entry in sorted(stats.entries.items()):
+        slo = slos.get(name) or slos.get("*")
+        if slo is None:
+            continue
+        observed = {
+            "p50": entry.get_response_time_percentile(0.50),
+            "p95": entry.get_response_time_percentile(0.95),
+            "p99": entry.get_response_time_percentile(0.99),
+            "fail_ratio": entry.fail_ratio,
+        }
+        over = [key for key in ("p50", "p95", "p99", "fail_ratio")
+                if key in slo and observed[key] > slo[key]]
+        checked = entry.num_requests >= min_requests
+        status = "ok" if not over else ("MISS " + ",".join(over) if checked else "(too few requests)")
+        print(f"{method + ' ' + name:<32}{entry.num_requests:>7}{observed['p50']:>8.0f}{observed['p95']:>8.0f}"
+              f"{observed['p99']:>8.0f}{observed['fail_ratio'] * 100:>7.1f}%  {status}")
+        if over and checked:
+            misses.append((name, {key: (observed[key], slo[key]) for key in over}))
+    return misses
+
+
+@events.quitting.add_listener
+def _(environment, **kwargs):
+    opts = environment.parsed_options
+    if not opts or not opts.check_slo or isinstance(environment.runner, WorkerRunner):
+        return
+
+    slos = SLOS
+    if opts.slo_file:
+        with open(opts.slo_file) as f:
+            slos = json.load(f)
+
+    misses = check_slos(environment.stats, slos, opts.slo_min_requests)
+    if misses:
+        print(f"\nSLO check FAILED for {len(misses)} endpoint(s):", file=sys.stderr)
+        for name, over in misses:
+            details = ", ".join(f"{key} {value:.3g} > {limit:.3g}" for key, (value, limit) in over.items())
+            print(f"  {name}: {details}", file=sys.stderr)
+        environment.process_exit_code = 1
+    else:
+        # Failures within the SLOs' fail_ratio would otherwise exit with --exit-code-on-error
+        print("\nSLO check passed")
+        environment.process_exit_code = 0
@@ -0,0 +1,581 @@
+"""
+Versioned, online schema migration runner (SQLite).
+
+Replaces the ad-hoc update_db_schema.py / migrate_v2.py scripts, which held the
+database lock for the whole run. Table rebuilds are done online:
+
+  1. Create <table>_new and install triggers that log changed primary keys
+     into a delta table.
+  2. Copy rows in primary-key order, one short write transaction per chunk.
+     The high-water mark is saved in schema_migrations with each chunk, so an
+     interrupted run resumes where it stopped.
+  3. Catch up by replaying the delta table (rows written during the copy).
+  4. Cut over in one short transaction: rename the table to <table>_old and
+     <table>_new to <table>.
+  5. Delete <table>_old in chunks, then drop the empty table.
+
+Every write transaction is timed and the maximum lock hold time is reported.
+
+Usage:
+    python scripts/migrate.py                    # apply pending migrations
+    python scripts/migrate.py --status
+    python scripts/migrate.py --bench 2000000    # measure on a synthetic table
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+DB_PATH = os.path.join(os.path.dirname(__file__), '../bankedge.db')
+
+CHUNK_SIZE = 5000
+# Gap between chunks so application writers can take the lock
+PAUSE_MS = 20
+
+
+def table_columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+
+
+def table_exists(conn, table):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)
+    ).fetchone() is not None
+
+
+# =====================================================================
+# MIGRATION TYPES
+# =====================================================================
+class Migration:
+    def __init__(self, version, name):
+        self.version = version
+        self.name = name
+
+    def applies(self, conn):
+        return True
+
+    def run(self, runner):
+        raise NotImplementedError
+
+
+class AddColumns(Migration):
+    """ALTER TABLE ... ADD COLUMN for missing columns (metadata-only in SQLite)."""
+
+    def __init__(self, version, name, table, columns):
+        super().__init__(version, name)
+        self.table = table
+        self.columns = columns
+
+    def applies(self, conn):
+        return table_exists(conn, self.table)
+
+    def run(self, runner):
+        existing = table_columns(runner.conn, self.table)
+        for column, ddl in self.columns:
+            if column in existing:
+                print(f"'{column}' column already exists in '{self.table}' table.")
+                continue
+            with runner.write_txn():
+                runner.conn.execute(f'ALTER TABLE "{self.table}" ADD COLUMN {column} {ddl}')
+            print(f"Added '{column}' column to '{self.table}' table.")
+
+
+class CreateTable(Migration):
+    """CREATE TABLE for a new table (no-op when create_all already made it)."""
+
+    def __init__(self, version, name, table, create_sql):
+        super().__init__(version, name)
+        self.table = table
+        self.create_sql = create_sql
+
+    def run(self, runner):
+        if table_exists(runner.conn, self.table):
+            print(f"'{self.table}' table already exists.")
+            return
+        with runner.write_txn():
+            runner.conn.execute(self.create_sql)
+        print(f"Created '{self.table}' table.")
+
+
+class OnlineTableRebuild(Migration):
+    """
+    Rebuilds `table` with a new definition without holding the lock for the
+    whole copy. `column_map` maps new column -> old column.
+    """
+
+    def __init__(self, version, name, table, create_sql, column_map, pk='id',
+                 requires_column=None, post_sql=()):
+        super().__init__(version, name)
+        self.table = table
+        self.create_sql = create_sql
+        self.column_map = column_map
+        self.pk = pk
+        self.requires_column = requires_column
+        self.post_sql = post_sql
+
+    @property
+    def new_table(self):
+        return f"{self.table}_new"
+
+    @property
+    def old_table(self):
+        return f"{self.table}_old"
+
+    @property
+    def delta_table(self):
+        return f"_{self.table}_delta"
+
+    def applies(self, conn):
+        if not table_exists(conn, self.table):
+            return False
+        if self.requires_column:
+            return self.requires_column in table_columns(conn, self.table)
+        return True
+
+    def _copy_sql(self, where):
+        new_cols = ", ".join(self.column_map.keys())
+        old_cols = ", ".join(self.column_map.values())
+        return (
+            f'INSERT OR REPLACE INTO "{self.new_table}" ({new_cols}) '
+            f'SELECT {old_cols} FROM "{self.table}" WHERE {where}'
+        )
+
+    def _install_triggers(self, conn):
+        for op, ref in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            conn.execute(
+                f'CREATE TRIGGER IF NOT EXISTS "_{self.table}_delta_{op.lower()}" '
+                f'AFTER {op} ON "{self.table}" BEGIN '
+                f'INSERT INTO "{self.delta_table}" (pk) VALUES ({ref}.{self.pk}); END'
+            )
+
+    def _drop_triggers(self, conn):
+        for op in ("insert", "update", "delete"):
+            conn.execute(f'DROP TRIGGER IF EXISTS "_{self.table}_delta_{op}"')
+
+    def _replay_delta(self, conn, limit=None):
+        """Re-syncs changed keys from the delta table. Returns rows replayed."""
+        sql = f'SELECT seq, pk FROM "{self.delta_table}" ORDER BY seq'
+        if limit:
+            sql += f' LIMIT {int(limit)}'
+        batch = conn.execute(sql).fetchall()
+        if not batch:
+            return 0
+
+        max_seq = batch[-1][0]
+        keys = list({pk for _, pk in batch})
+        for i in range(0, len(keys), 500):
+            part = keys[i:i + 500]
+            marks = ", ".join("?" for _ in part)
+            conn.execute(f'DELETE FROM "{self.new_table}" WHERE {self.pk} IN ({marks})', part)
+            conn.execute(self._copy_sql(f'{self.pk} IN ({marks})'), part)
+        conn.execute(f'DELETE FROM "{self.delta_table}" WHERE seq <= ?', (max_seq,))
+        return len(batch)
+
+    def run(self, runner):
+        conn = runner.conn
+        state = runner.get_state(self.version)
+
+        # 1. Shadow table + change capture
+        if not state or state['state'] == 'pending':
+            with runner.write_txn():
+                conn.execute(self.create_sql.format(table=self.new_table))
+                conn.execute(
+                    f'CREATE TABLE IF NOT EXISTS "{self.delta_table}" '
+                    f'(seq INTEGER PRIMARY KEY AUTOINCREMENT, pk TEXT NOT NULL)'
+                )
+                self._install_triggers(conn)
+                runner.set_state(self, 'copying', high_water_mark=None, rows_copied=0)
+            state = runner.get_state(self.version)
+
+        # 2. Chunked copy in primary-key order
+        if state['state'] == 'copying':
+            hwm = state['high_water_mark']
+            rows = state['rows_copied'] or 0
+            if hwm is not None:
+                print(f"Resuming copy after {self.pk}={hwm} ({rows} rows already copied)")
+
+            while True:
+                with runner.write_txn():
+                    lower = f'{self.pk} > ?' if hwm is not None else '1=1'
+                    params = (hwm,) if hwm is not None else ()
+                    upper = conn.execute(
+                        f'SELECT {self.pk} FROM "{self.table}" WHERE {lower} '
+                        f'ORDER BY {self.pk} LIMIT 1 OFFSET ?',
+                        params + (runner.chunk_size - 1,)
+                    ).fetchone()
+
+                    if upper is not None:
+                        cur = conn.execute(self._copy_sql(f'{lower} AND {self.pk} <= ?'), params + (upper[0],))
+                        hwm = upper[0]
+                    else:
+                        cur = conn.execute(self._copy_sql(lower), params)
+
+                    rows += max(cur.rowcount, 0)
+                    done = upper is None
+                    runner.set_state(self, 'catching_up' if done else 'copying',
+                                     high_water_mark=hwm, rows_copied=rows)
+
+                if done:
+                    break
+                print(f"  copied {rows} rows (hwm={hwm})")
+                runner.pause()
+
+        # 3. Catch up on rows written during the copy
+        while state['state'] != 'cut_over':
+            with runner.write_txn():
+                replayed = self._replay_delta(conn, limit=runner.chunk_size)
+            if replayed < runner.chunk_size:
+                break
+            print(f"  replayed {replayed} changed rows")
+            runner.pause()
+
+        # 4. Cut over (drains whatever was written since the last replay).
+        #    The old table is renamed, not dropped: DROP TABLE frees every page
+        #    and would hold the lock for O(rows).
+        if state['state'] != 'cut_over':
+            with runner.write_txn():
+                self._replay_delta(conn)
+                self._drop_triggers(conn)
+                conn.execute(f'DROP TABLE "{self.delta_table}"')
+                conn.execute(f'ALTER TABLE "{self.table}" RENAME TO "{self.old_table}"')
+                conn.execute(f'ALTER TABLE "{self.new_table}" RENAME TO "{self.table}"')
+                for sql in self.post_sql:
+                    conn.execute(sql)
+                runner.set_state(self, 'cut_over')
+            print(f"Cut over '{self.table}' ({runner.last_lock_ms:.1f} ms lock).")
+
+        # 5. Drop the old table in chunks (deletes cost ~5x a copied row).
+        #    Already gone when resuming after the final DROP.
+        drop_chunk = max(runner.chunk_size // 5, 1)
+        while table_exists(conn, self.old_table):
+            with runner.write_txn():
+                cur = conn.execute(
+                    f'DELETE FROM "{self.old_table}" WHERE {self.pk} IN '
+                    f'(SELECT {self.pk} FROM "{self.old_table}" ORDER BY {self.pk} LIMIT ?)', (drop_chunk,)
+                )
+                if cur.rowcount < drop_chunk:
+                    conn.execute(f'DROP TABLE "{self.old_table}"')
+                    break
+            runner.pause()
+
+
+# =====================================================================
+# MIGRATIONS (in version order)
+# =====================================================================
+TRANSACTION_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS "{table}" (
+        id VARCHAR(100) NOT NULL,
+        amount FLOAT NOT NULL,
+        stripe_status VARCHAR(20) NOT NULL,
+        processing_decision VARCHAR(20),
+        timestamp DATETIME NOT NULL,
+        old_balance_org FLOAT,
+        new_balance_org FLOAT,
+        is_fraud BOOLEAN,
+        recipient_account VARCHAR(150),
+        reference VARCHAR(200),
+        merchant_name VARCHAR(100),
+        device_id VARCHAR(50),
+        type VARCHAR(50),
+        customer_id VARCHAR(150),
+        confidence FLOAT,
+        latency FLOAT,
+        PRIMARY KEY (id),
+        FOREIGN KEY(device_id) REFERENCES device (id)
+    )
+'''
+
+OFFLOADING_SCORE_TABLE_SQL = '''
+    CREATE TABLE offloading_score (
+        transaction_id VARCHAR(100) NOT NULL,
+        model_version VARCHAR(100) NOT NULL,
+        decision VARCHAR(20) NOT NULL,
+        previous_decision VARCHAR(20),
+        txn_count_last_30d FLOAT,
+        scored_at DATETIME,
+        PRIMARY KEY (transaction_id, model_version)
+    )
+'''
+
+CUSTOMER_FEATURES_TABLE_SQL = '''
+    CREATE TABLE customer_features (
+        customer_id VARCHAR(150) NOT NULL,
+        txn_count_total INTEGER NOT NULL,
+        amount_sum_total FLOAT NOT NULL,
+        first_seen DATETIME,
+        last_seen DATETIME,
+        PRIMARY KEY (customer_id)
+    )
+'''
+
+CUSTOMER_FEATURE_BUCKETS_TABLE_SQL = '''
+    CREATE TABLE customer_feature_buckets (
+        customer_id VARCHAR(150) NOT NULL,
+        day DATE NOT NULL,
+        txn_count INTEGER NOT NULL,
+        amount_sum FLOAT NOT NULL,
+        PRIMARY KEY (customer_id, day)
+    )
+'''
+
+MIGRATIONS = [
+    AddColumns(1, "add_balance_columns", "user", [
+        ("balance", "FLOAT DEFAULT 100000.0"),
+    ]),
+    AddColumns(2, "add_transaction_ml_columns", "transaction", [
+        ("old_balance_org", "FLOAT DEFAULT 0.0"),
+        ("new_balance_org", "FLOAT DEFAULT 0.0"),
+        ("is_fraud", "BOOLEAN DEFAULT 0"),
+    ]),
+    # processed_at -> processing_decision, ml_prediction dropped
+    OnlineTableRebuild(3, "rename_processed_at", "transaction", TRANSACTION_TABLE_SQL, {
+        "id": "id", "amount": "amount", "stripe_status": "stripe_status",
+        "processing_decision": "processed_at", "timestamp": "timestamp",
+        "old_balance_org": "old_balance_org", "new_balance_org": "new_balance_org",
+        "is_fraud": "is_fraud", "recipient_account": "recipient_account",
+        "reference": "reference", "merchant_name": "merchant_name",
+        "device_id": "device_id", "type": "type", "customer_id": "customer_id",
+        "confidence": "confidence", "latency": "latency",
+    }, requires_column="processed_at"),
+    CreateTable(4, "create_offloading_score", "offloading_score", OFFLOADING_SCORE_TABLE_SQL),
+    # Backfill afterwards with scripts/rebuild_customer_features.py
+    CreateTable(5, "create_customer_features", "customer_features", CUSTOMER_FEATURES_TABLE_SQL),
+    CreateTable(6, "create_customer_feature_buckets", "customer_feature_buckets",
+                CUSTOMER_FEATURE_BUCKETS_TABLE_SQL),
+]
+
+
+# =====================================================================
+# RUNNER
+# =====================================================================
+class MigrationRunner:
+    def __init__(self, db_path, chunk_size=CHUNK_SIZE, pause_ms=PAUSE_MS):
+        # Autocommit mode: transactions are opened explicitly and kept short
+        self.conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.chunk_size = chunk_size
+        self.pause_ms = pause_ms
+        self.max_lock_ms = 0.0
+        self.last_lock_ms = 0.0
+        self.lock_count = 0
+        self._ensure_version_table()
+
+    def _ensure_version_table(self):
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(100) NOT NULL,
+                state VARCHAR(20) NOT NULL,
+                high_water_mark TEXT,
+                rows_copied INTEGER DEFAULT 0,
+                max_lock_ms FLOAT,
+                applied_at DATETIME
+            )
+        ''')
+
+    @contextmanager
+    def write_txn(self):
+        # Lock hold time is measured from acquiring the RESERVED lock to COMMIT
+        self.conn.execute("BEGIN IMMEDIATE")
+        start = time.perf_counter()
+        try:
+            yield
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        finally:
+            self.last_lock_ms = (time.perf_counter() - start) * 1000.0
+            self.max_lock_ms = max(self.max_lock_ms, self.last_lock_ms)
+            self.lock_count += 1
+
+    def pause(self):
+        if self.pause_ms:
+            time.sleep(self.pause_ms / 1000.0)
+
+    def get_state(self, version):
+        row = self.conn.execute(
+            "SELECT state, high_water_mark, rows_copied FROM schema_migrations WHERE version = ?",
+            (version,)
+        ).fetchone()
+        if not row:
+            return None
+        return {"state": row[0], "high_water_mark": row[1], "rows_copied": row[2]}
+
+    def set_state(self, migration, state, high_water_mark=None, rows_copied=None):
+        self.conn.execute('''
+            INSERT INTO schema_migrations (version, name, state, high_water_mark, rows_copied, max_lock_ms, applied_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(version) DO UPDATE SET
+                state = excluded.state,
+                high_water_mark = excluded.high_water_mark,
+                rows_copied = COALESCE(excluded.rows_copied, schema_migrations.rows_copied),
+                max_lock_ms = MAX(COALESCE(schema_migrations.max_lock_ms, 0), excluded.max_lock_ms),
+                applied_at = excluded.applied_at
+        ''', (migration.version, migration.name, state, high_water_mark, rows_copied,
+              round(self.max_lock_ms, 3), datetime.now().isoformat() if state in ('applied', 'skipped') else None))
+
+    def pending(self):
+        return [m for m in MIGRATIONS
+                if (self.get_state(m.version) or {}).get("state") not in ('applied', 'skipped')]
+
+    def migrate(self):
+        for migration in self.pending():
+            print(f"Applying {migration.version:03d}_{migration.name}...")
+            self.max_lock_ms = 0.0
+
+            # An interrupted run resumes even if the schema no longer looks like it applies
+            # (e.g. after the cut-over of a rebuild)
+            in_progress = (self.get_state(migration.version) or {}).get("state") not in (None, 'pending')
+            if not in_progress and not migration.applies(self.conn):
+                self.set_state(migration, 'skipped')
+                print("  nothing to do (schema already up to date)")
+                continue
+
+            started = time.perf_counter()
+            migration.run(self)
+            with self.write_txn():
+                state = self.get_state(migration.version) or {}
+                self.set_state(migration, 'applied', state.get("high_water_mark"), state.get("rows_copied"))
+            print(f"  done in {time.perf_counter() - started:.2f}s, max lock hold {self.max_lock_ms:.1f} ms")
+
+    def lock_ms(self, version):
+        """Max lock hold recorded for one migration (migrate() resets max_lock_ms per migration)."""
+        row = self.conn.execute("SELECT max_lock_ms FROM schema_migrations WHERE version = ?", (version,)).fetchone()
+        return row[0] if row and row[0] is not None else 0.0
+
+    def status(self):
+        for m in MIGRATIONS:
+            state = self.get_state(m.version) or {"state": "pending"}
+            print(f"{m.version:03d}_{m.name:<30} {state['state']:<12} "
+                  f"rows={state.get('rows_copied') or 0} hwm={state.get('high_water_mark')}")
+
+
+# =====================================================================
+# BENCHMARK: Rebuild a synthetic old-schema table under concurrent writes
+# =====================================================================
+REBUILD_VERSION = 3  # rename_processed_at, the migration the benchmark measures
+
+
+def bench(rows, chunk_size, pause_ms):
+    db_path = os.path.join(tempfile.mkdtemp(), 'migrate_bench.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute('''
+        CREATE TABLE "transaction" (
+            id VARCHAR(100) NOT NULL, amount FLOAT NOT NULL, stripe_status VARCHAR(20) NOT NULL,
+            processed_at VARCHAR(20), ml_prediction VARCHAR(20), timestamp DATETIME NOT NULL,
+            old_balance_org FLOAT, new_balance_org FLOAT, is_fraud BOOLEAN,
+            recipient_account VARCHAR(150), reference VARCHAR(200), merchant_name VARCHAR(100),
+            device_id VARCHAR(50), type VARCHAR(50), customer_id VARCHAR(150),
+            confidence FLOAT, latency FLOAT, PRIMARY KEY (id)
+        )
+    ''')
+
+    print(f"Seeding {rows} rows into {db_path}...")
+    base = datetime(2025, 1, 1)
+    batch = []
+    for i in range(rows):
+        batch.append((
+            f"pi_{random.getrandbits(64):016x}", round(random.uniform(1, 15000), 2), "succeeded",
+            random.choice(("edge", "cloud")), None, (base + timedelta(seconds=i)).isoformat(sep=' '),
+            0.0, 0.0, 0, "1234567890", "Bench", "card", f"edge-{random.randint(1, 16)}",
+            "Transfer", f"admin{i % 500}@bankedge.com", 0.9, 10.0
+        ))
+        if len(batch) == 50000:
+            conn.executemany('INSERT INTO "transaction" VALUES (' + ",".join("?" * 17) + ')', batch)
+            conn.commit()
+            batch = []
+    if batch:
+        conn.executemany('INSERT INTO "transaction" VALUES (' + ",".join("?" * 17) + ')', batch)
+        conn.commit()
+    conn.close()
+
+    # Concurrent writer: mimics payment traffic during the migration
+    stop = threading.Event()
+    writer_stats = {"writes": 0, "max_wait_ms": 0.0}
+
+    def writer():
+        wconn = sqlite3.connect(db_path, timeout=30)
+        decision_col = "processed_at"
+        n = 0
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                wconn.execute(
+                    f'INSERT INTO "transaction" (id, amount, stripe_status, {decision_col}, timestamp) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (f"pi_sim_{n}", 100.0, "succeeded", "edge", datetime.now().isoformat(sep=' '))
+                )
+            except sqlite3.OperationalError:
+                # Table was cut over to the new schema
+                decision_col = "processing_decision"
+                continue
+            wconn.commit()
+            writer_stats["max_wait_ms"] = max(writer_stats["max_wait_ms"], (time.perf_counter() - t0) * 1000.0)
+            writer_stats["writes"] += 1
+            n += 1
+            time.sleep(0.005)
+        wconn.close()
+
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+
+    runner = MigrationRunner(db_path, chunk_size=chunk_size, pause_ms=pause_ms)
+    started = time.perf_counter()
+    runner.migrate()
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    thread.join()
+
+    check = sqlite3.connect(db_path)
+    final_rows = check.execute('SELECT COUNT(*) FROM "transaction"').fetchone()[0]
+    columns = table_columns(check, "transaction")
+    check.close()
+
+    expected = rows + writer_stats["writes"]
+    print("\n" + "=" * 50)
+    print(f" Rows: {rows} seeded + {writer_stats['writes']} written during migration")
+    print(f" Final row count: {final_rows} ({'OK' if final_rows == expected else 'MISMATCH'})")
+    print(f" processing_decision present: {'processing_decision' in columns}")
+    print(f" Total time: {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s)")
+    print(f" Write transactions: {runner.lock_count}")
+    print(f" Max lock hold (table rebuild): {runner.lock_ms(REBUILD_VERSION):.1f} ms")
+    print(f" Max concurrent writer latency: {writer_stats['max_wait_ms']:.1f} ms")
+    print("=" * 50)
+    return final_rows == expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply versioned schema migrations online.")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--pause-ms", type=int, default=PAUSE_MS, help="sleep between chunks to let writers in")
+    parser.add_argument("--status", action="store_true")
+    parser.add_argument("--bench", type=int, metavar="ROWS", help="benchmark on a synthetic table")
+    args = parser.parse_args()
+
+    if args.bench:
+        ok = bench(args.bench, args.chunk_size, args.pause_ms)
+        raise SystemExit(0 if ok else 1)
+
+    if not os.path.exists(args.db):
+        print(f"Database not found at {args.db}")
+        return
+
+    runner = MigrationRunner(args.db, chunk_size=args.chunk_size, pause_ms=args.pause_ms)
+    if args.status:
+        runner.status()
+    else:
+        runner.migrate()
+        print("Database migration completed successfully.")
+
+
+if __name__ == "__main__":
+    main()
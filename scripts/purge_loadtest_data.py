@@ -0,0 +1,47 @@
+import sys
+import os
+import argparse
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app
+from models import db
+from services.loadtest_store import purge_expired_synthetic
+
+def enable_incremental_vacuum():
+    """One-time switch of the primary SQLite file to auto_vacuum=INCREMENTAL (full VACUUM, run offline)."""
+    engine = db.engines[None]
+    if engine.dialect.name != 'sqlite':
+        print("Incremental vacuum only applies to SQLite.")
+        return
+
+    raw = engine.raw_connection()
+    try:
+        conn = raw.driver_connection
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        print("Running VACUUM (this rewrites the whole file)...")
+        conn.execute("VACUUM")
+        print(f"auto_vacuum is now {conn.execute('PRAGMA auto_vacuum').fetchone()[0]} (2 = incremental)")
+    finally:
+        raw.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Purge expired load-test (pi_sim_) transactions.")
+    parser.add_argument("--hours", type=float, default=None, help="retention window (default: LOADTEST_RETENTION_HOURS)")
+    parser.add_argument("--batch", type=int, default=None, help="rows deleted per transaction")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true")
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.enable_incremental_vacuum:
+            enable_incremental_vacuum()
+
+        stats = purge_expired_synthetic(
+            db,
+            retention_hours=args.hours if args.hours is not None else app.config['LOADTEST_RETENTION_HOURS'],
+            batch_size=args.batch or app.config['LOADTEST_RETENTION_BATCH']
+        )
+        print(f"Deleted {stats['loadtest_deleted']} load-test rows, "
+              f"{stats['legacy_deleted']} legacy pi_sim_ rows from 'transaction'.")
+        print(f"Incremental vacuum ran on: {', '.join(stats['vacuumed']) or 'none'}")
@@ -0,0 +1,29 @@
+import sys
+import os
+import argparse
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app
+from models import db
+from services.customer_features import compact_buckets, rebuild_from_transactions
+from services.offloading_features import WINDOW_DAYS
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill or compact the customer feature store.")
+    parser.add_argument("--compact-only", action="store_true",
+                        help="only delete buckets that fell out of the 30-day window")
+    parser.add_argument("--all-history", action="store_true",
+                        help="keep daily buckets for the whole history, not just the window")
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        if not args.compact_only:
+            stats = rebuild_from_transactions(db, since_days=None if args.all_history else WINDOW_DAYS)
+            print(f"Rebuilt customer_features: {stats['customers']} customers, {stats['buckets']} daily buckets.")
+
+        deleted = compact_buckets(db) if not args.all_history else {}
+        if deleted:
+            print(f"Compacted buckets: {deleted}")
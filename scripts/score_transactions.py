@@ -0,0 +1,236 @@
+"""
+Batch re-scoring of historical transactions with an offloading model.
+
+Rows are streamed in timestamp order in large chunks, txn_count_last_30d is
+computed vectorised (carried across chunk boundaries), and feature batches
+are scored in a process pool where every worker loads the model once.
+
+Results go to the offloading_score side table (one row per transaction and
+model version, so policies can be compared), or with --write-back straight
+into transaction.processing_decision. CSV inputs are written to a CSV.
+
+Usage:
+    python scripts/score_transactions.py                                  # bankedge.db -> offloading_score
+    python scripts/score_transactions.py --model ml_models/offloading_policy.json
+    python scripts/score_transactions.py --write-back
+    python scripts/score_transactions.py --source "ml_data/*.csv" --out-dir ml_data/scored
+"""
+import sys
+import os
+import glob
+import time
+import argparse
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone, timedelta
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import OffloadingScore, Transaction
+from services.offloading_features import FEATURES, TARGET
+from services.offloading_stream import RollingWindowCounter, chunk_stream
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_MODEL = os.path.join(ROOT, 'ml_models', 'offloading_model.pkl')
+
+CHUNK_SIZE = 200_000
+BATCH_SIZE = 20_000
+
+# Loaded once per pool worker
+_model = None
+
+
+def default_db_url():
+    url = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(ROOT, 'bankedge.db')
+    return url.replace("postgres://", "postgresql://", 1) if url.startswith("postgres://") else url
+
+
+def model_version(path):
+    mtime = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+    return f"{os.path.basename(path)}@{mtime:%Y%m%d%H%M%S}"
+
+
+def _load_model(path):
+    global _model
+    if path.endswith('.json'):
+        from services.offloading_policy import OffloadingPolicy
+        _model = OffloadingPolicy.load(path)
+    else:
+        import joblib
+        _model = joblib.load(path)
+
+
+def _score(X):
+    if hasattr(_model, 'decide_batch'):
+        return _model.decide_batch(X)[0]
+    return np.asarray(_model.predict(X)).astype(str)
+
+
+# =====================================================================
+# WRITERS
+# =====================================================================
+class SideTableWriter:
+    """Replaces this model version's rows for each batch in one short transaction."""
+
+    def __init__(self, engine, version):
+        self.engine = engine
+        self.version = version
+        self.table = OffloadingScore.__table__
+        self.table.create(engine, checkfirst=True)
+        self.delete_stmt = self.table.delete().where(
+            self.table.c.transaction_id == sa.bindparam('_id'),
+            self.table.c.model_version == version
+        )
+
+    def write(self, ids, decisions, previous, counts):
+        scored_at = datetime.now(timezone(timedelta(hours=8))).replace(tzinfo=None)
+        rows = [{"transaction_id": i, "model_version": self.version, "decision": d,
+                 "previous_decision": p, "txn_count_last_30d": float(c), "scored_at": scored_at}
+                for i, d, p, c in zip(ids, decisions, previous, counts)]
+        with self.engine.begin() as conn:
+            conn.execute(self.delete_stmt, [{"_id": i} for i in ids])
+            conn.execute(self.table.insert(), rows)
+
+
+class WriteBackWriter:
+    """Bulk UPDATE of transaction.processing_decision (executemany per batch)."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        table = Transaction.__table__
+        self.stmt = table.update().where(table.c.id == sa.bindparam('_id')).values(
+            processing_decision=sa.bindparam('_decision'))
+
+    def write(self, ids, decisions, previous, counts):
+        changed = [{"_id": i, "_decision": d} for i, d, p in zip(ids, decisions, previous) if d != p]
+        if changed:
+            with self.engine.begin() as conn:
+                conn.execute(self.stmt, changed)
+
+
+class CsvWriter:
+    def __init__(self, path):
+        self.path = path
+        self.header = True
+
+    def write(self, ids, decisions, previous, counts):
+        pd.DataFrame({"id": ids, "decision": decisions, "previous_decision": previous,
+                      "txn_count_last_30d": counts}).to_csv(self.path, mode='w' if self.header else 'a',
+                                                            header=self.header, index=False)
+        self.header = False
+
+
+# =====================================================================
+# PIPELINE
+# =====================================================================
+def score_stream(chunks, writer, model_path, workers, batch_size):
+    counter = RollingWindowCounter()
+    transitions = Counter()
+    timings = Counter()
+    rows = 0
+    in_flight = deque()
+
+    def drain(limit):
+        nonlocal rows
+        while len(in_flight) > limit:
+            future, ids, previous, counts = in_flight.popleft()
+            start = time.perf_counter()
+            decisions = future.result()
+            timings["wait_s"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            writer.write(ids, decisions, previous, counts)
+            timings["write_s"] += time.perf_counter() - start
+
+            transitions.update(zip(previous, decisions))
+            rows += len(ids)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_load_model, initargs=(model_path,)) as pool:
+        read_start = time.perf_counter()
+        for chunk in chunks:
+            chunk = counter.add_counts(chunk)
+            timings["read_features_s"] += time.perf_counter() - read_start
+
+            for start in range(0, len(chunk), batch_size):
+                batch = chunk.iloc[start:start + batch_size]
+                future = pool.submit(_score, batch[FEATURES])
+                previous = batch[TARGET].astype(object).where(batch[TARGET].notna(), None).tolist()
+                in_flight.append((future, batch['id'].tolist(), previous,
+                                  batch['txn_count_last_30d'].to_numpy()))
+                # Bounded backlog: at most two batches per worker waiting
+                drain(workers * 2)
+
+            print(f"   scored {rows} rows so far (window carry {counter.carried_rows})")
+            read_start = time.perf_counter()
+        drain(0)
+
+    return rows, transitions, timings
+
+
+def print_report(rows, elapsed, transitions, timings, version, workers):
+    changed = sum(n for (old, new), n in transitions.items() if old != new)
+    print("\n" + "="*60)
+    print(f" BATCH SCORING REPORT ({version}, {workers} workers)")
+    print(f"   Rows scored: {rows} in {elapsed:.2f}s -> {rows / elapsed if elapsed else 0:,.0f} rows/sec")
+    print(f"   Read + features: {timings['read_features_s']:.2f}s, "
+          f"waiting on pool: {timings['wait_s']:.2f}s, writing: {timings['write_s']:.2f}s")
+    print(f"   Decisions changed vs stored: {changed} ({changed / rows if rows else 0:.2%})")
+    for (old, new), n in sorted(transitions.items(), key=lambda kv: -kv[1]):
+        print(f"      {str(old):<10} -> {new:<10} {n}")
+    print("="*60 + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score historical transactions with an offloading model.")
+    parser.add_argument("--source", default=None,
+                        help="database URL (default: DATABASE_URL / bankedge.db) or a CSV path/glob")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="offloading_model.pkl or offloading_policy.json")
+    parser.add_argument("--write-back", action="store_true",
+                        help="update transaction.processing_decision instead of the offloading_score table")
+    parser.add_argument("--out-dir", default=None, help="where scored CSVs go (default: next to the input)")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=0, help="pool size (0 = all cores)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"Error: {args.model} not found.")
+        return
+
+    workers = args.workers or os.cpu_count() or 1
+    version = model_version(args.model)
+    source = args.source or default_db_url()
+
+    if '://' in source:
+        engine = sa.create_engine(source)
+        writer = WriteBackWriter(engine) if args.write_back else SideTableWriter(engine, version)
+        jobs = [(source, writer)]
+    else:
+        paths = sorted(p for p in glob.glob(source) if not p.endswith('_scored.csv'))
+        if not paths:
+            print(f"Error: no CSV files match {source}")
+            return
+        if args.out_dir and not os.path.exists(args.out_dir):
+            os.makedirs(args.out_dir)
+        jobs = []
+        for path in paths:
+            name = os.path.splitext(os.path.basename(path))[0] + '_scored.csv'
+            jobs.append((path, CsvWriter(os.path.join(args.out_dir or os.path.dirname(path), name))))
+
+    for job_source, writer in jobs:
+        print(f"Scoring {job_source} with {version}...")
+        start = time.perf_counter()
+        rows, transitions, timings = score_stream(
+            chunk_stream(job_source, args.chunksize), writer, args.model, workers, args.batch_size)
+        print_report(rows, time.perf_counter() - start, transitions, timings, version, workers)
+        if isinstance(writer, CsvWriter):
+            print(f"Scores written to {writer.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Startup profile and budget check.
+
+Imports the app in a fresh interpreter with `python -X importtime`, prints
+the heaviest import subtrees, then (optionally) times the first
+payment_success through the test client using the per-stage histograms,
+with the simulated network sleep excluded.
+
+Exits non-zero when the median `import app` time exceeds --budget-ms, when
+the first payment exceeds --first-request-budget-ms, or when a module that
+must stay deferred (services.warmup) was imported, so it can gate CI/builds.
+
+Usage:
+    python scripts/startup_profile.py
+    python scripts/startup_profile.py --runs 5 --budget-ms 1500 --first-request-budget-ms 500
+    python scripts/startup_profile.py --preload          # profile the PRELOAD_ML=1 master instead
+"""
+import sys
+import os
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Add project root to path
+sys.path.append(ROOT)
+
+from services.warmup import DEFERRED_MODULES, PRELOAD_MODULES
+
+# Runs in the child interpreter; last stdout line is the JSON result
+CHILD = r"""
+import json, sys, time
+started = time.perf_counter()
+from app import app
+import_ms = (time.perf_counter() - started) * 1000.0
+result = {"import_ms": import_ms, "modules": sorted(m for m in sys.modules if '.' not in m)}
+
+if FIRST_REQUEST:
+    from services.stage_timing import stage_timing_snapshot
+    c = app.test_client()
+    c.get('/api/init-db')
+    token = c.post('/api/login', json={'username': 'admin.kl@bankedge.com', 'password': 'Admin@123'}).json['access_token']
+    c.post('/api/payment-success', json={'payment_intent': 'pi_sim_startup', 'amount': 100, 'latency': 10},
+           headers={'Authorization': 'Bearer ' + token})
+    stages = stage_timing_snapshot().get('transactions_api.payment_success', {})
+    result["first_request_ms"] = stages["total"]["max_ms"] - stages.get("simulated_sleep", {}).get("max_ms", 0.0)
+    result["first_request_stages"] = {k: v["max_ms"] for k, v in stages.items()}
+    result["modules_after_request"] = sorted(m for m in sys.modules if '.' not in m)
+
+print(json.dumps(result))
+"""
+
+
+def run_child(env, first_request):
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"FIRST_REQUEST = {first_request!r}\n" + CHILD],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        print(proc.stderr[-3000:])
+        raise SystemExit("Error: importing the app failed.")
+    return json.loads(proc.stdout.strip().splitlines()[-1]), proc.stderr
+
+
+def parse_importtime(stderr):
+    """-X importtime lines -> [(depth, self_us, cumulative_us, module)] in import order."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative, name = line[len('import time:'):].split('|')
+        name = name[1:]  # one separator space, the rest is nesting indent
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        rows.append((depth, int(self_us), int(cumulative), name.strip()))
+    return rows
+
+
+def print_tree(rows, max_depth, min_ms):
+    print(f"\n Import tree (cumulative >= {min_ms}ms, depth <= {max_depth})")
+    # importtime prints children before their parent; reverse for a top-down view
+    for depth, _, cumulative, name in reversed(rows):
+        if depth <= max_depth and cumulative >= min_ms * 1000:
+            print(f"   {cumulative / 1000:8.1f} ms  {'  ' * depth}{name}")
+
+
+def print_heaviest(rows, top):
+    print(f"\n Heaviest modules by self time (top {top})")
+    for _, self_us, _, name in sorted(rows, key=lambda r: -r[1])[:top]:
+        print(f"   {self_us / 1000:8.1f} ms  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile app startup and enforce a startup time budget.")
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters to time (median is checked)")
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get('STARTUP_BUDGET_MS', 0)) or None,
+                        help="fail if median `import app` time exceeds this (default: STARTUP_BUDGET_MS)")
+    parser.add_argument("--first-request-budget-ms", type=float,
+                        default=float(os.environ.get('FIRST_REQUEST_BUDGET_MS', 0)) or None,
+                        help="fail if the first payment_success (minus simulated sleep) exceeds this")
+    parser.add_argument("--preload", action="store_true", help="profile with PRELOAD_ML=1")
+    parser.add_argument("--depth", type=int, default=2, help="import tree depth to print")
+    parser.add_argument("--min-ms", type=float, default=20.0, help="hide subtrees cheaper than this")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    # The children's SQLite files (startup.db, its _loadtest sibling, WAL) go with the directory
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, PRELOAD_ML='1' if args.preload else '0',
+                   DATABASE_URL='sqlite:///' + os.path.join(tmp, 'startup.db'),
+                   LOADTEST_RETENTION_INTERVAL='0', CUSTOMER_FEATURES_COMPACT_INTERVAL='0')
+        for i in range(args.runs):
+            result, stderr = run_child(env, first_request=(i == 0))
+            results.append(result)
+            if i == 0:
+                rows = parse_importtime(stderr)
+    import_ms = statistics.median(r["import_ms"] for r in results)
+    first = results[0]
+
+    print("\n" + "="*60)
+    print(f" STARTUP PROFILE (PRELOAD_ML={'1' if args.preload else '0'}, {args.runs} runs)")
+    print_tree(rows, args.depth, args.min_ms)
+    print_heaviest(rows, args.top)
+
+    runs = ', '.join(f"{r['import_ms']:.0f}" for r in results)
+    print(f"\n   import app: median {import_ms:.0f} ms (runs: {runs})")
+    print(f"   first payment_success (excl. simulated sleep): {first['first_request_ms']:.1f} ms")
+    for stage, ms in sorted(first["first_request_stages"].items(), key=lambda kv: -kv[1])[:8]:
+        print(f"      {stage:<24} {ms:8.1f} ms")
+
+    # Budget checks
+    failures = []
+    deferred = [m for m in DEFERRED_MODULES if m in first["modules_after_request"]]
+    if deferred:
+        failures.append(f"deferred modules imported by the app: {', '.join(deferred)}")
+    if not args.preload:
+        eager = [m for m in {p.split('.')[0] for p in PRELOAD_MODULES} if m in first["modules"]]
+        if eager:
+            failures.append(f"ML modules imported at startup without PRELOAD_ML: {', '.join(sorted(eager))}")
+    if args.budget_ms and import_ms > args.budget_ms:
+        failures.append(f"import app {import_ms:.0f} ms > budget {args.budget_ms:.0f} ms")
+    if args.first_request_budget_ms and first["first_request_ms"] > args.first_request_budget_ms:
+        failures.append(f"first request {first['first_request_ms']:.0f} ms > budget {args.first_request_budget_ms:.0f} ms")
+
+    print("="*60)
+    if failures:
+        for f in failures:
+            print(f" BUDGET FAILED: {f}")
+        print()
+        sys.exit(1)
+    print(" Startup budget OK\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
+import sys
+import os
+import time
+import argparse
+import tracemalloc
 import pandas as pd
 import joblib
-import os
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import classification_report, accuracy_score
@@ -8,77 +12,178 @@ from sklearn.preprocessing import OneHotEncoder
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 
-def train_model():
-    input_file = 'ml_data/transactions_dataset_500k_latest.csv'
-    if not os.path.exists(input_file):
-        print(f"Error: {input_file} not found.")
-        return
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.offloading_features import (
+    FEATURES, NUMERICAL_FEATURES, CATEGORICAL_FEATURES, TARGET,
+    load_transactions, add_txn_count_last_30d, legacy_txn_count_last_30d
+)
+from services.offloading_stream import chunk_stream, train_streaming
+from services.offloading_policy import (
+    POLICY_FILENAME, OffloadingPolicy, distill, fidelity_report, save_policy
+)
 
+DEFAULT_INPUT = 'ml_data/transactions_dataset_500k_latest.csv'
+MODEL_PATH = 'ml_models/offloading_model.pkl'
+
+def build_features(input_file):
     print(f"Loading data from {input_file}...")
-    df = pd.read_csv(input_file)
+    df = load_transactions(input_file)
     print(f"Total records: {len(df)}")
 
     # --- Feature Engineering ---
     print("Calculating engineered features (txn_count_last_30d)...")
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    # Sort by customer and time
-    df = df.sort_values(['customer_id', 'timestamp'])
-
-    # Calculate rolling count per user (past 30 days)
-    # Using 'amount' as a dummy column to count
-    df_indexed = df.set_index('timestamp')
-    df['txn_count_last_30d'] = df_indexed.groupby('customer_id')['amount'].rolling('30D', closed='left').count().values
-    
-    # Fill defaults
-    df['txn_count_last_30d'] = df['txn_count_last_30d'].fillna(0)
+    return add_txn_count_last_30d(df)
+
+def train_model(input_file=DEFAULT_INPUT):
+    if not os.path.exists(input_file):
+        print(f"Error: {input_file} not found.")
+        return
+
+    df = build_features(input_file)
 
     # Features (X) and Target (y)
-    features = ['amount', 'type', 'latency', 'txn_count_last_30d']
-    target = 'processing_decision'
-    
-    print(f"Features: {features}")
-    
-    X = df[features]
-    y = df[target]
-    
+    print(f"Features: {FEATURES}")
+
+    X = df[FEATURES]
+    y = df[TARGET].astype(str)
+
     # Define Preprocessing
-    numerical_features = ['amount', 'latency', 'txn_count_last_30d']
-    categorical_features = ['type']
-    
     preprocessor = ColumnTransformer(
         transformers=[
-            ('num', 'passthrough', numerical_features),
-            ('cat', OneHotEncoder(handle_unknown='ignore'), categorical_features)
+            ('num', 'passthrough', NUMERICAL_FEATURES),
+            ('cat', OneHotEncoder(handle_unknown='ignore'), CATEGORICAL_FEATURES)
         ])
-    
+
     # Define Pipeline
     clf = Pipeline(steps=[
         ('preprocessor', preprocessor),
         ('classifier', RandomForestClassifier(n_estimators=100, random_state=42))
     ])
-    
+
     # Split
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    
+
     # Train
     print("Training Random Forest Classifier...")
     clf.fit(X_train, y_train)
-    
+
     # Evaluate
     print("Evaluating...")
     y_pred = clf.predict(X_test)
     print("Accuracy:", accuracy_score(y_test, y_pred))
     print("\nClassification Report:\n", classification_report(y_test, y_pred))
-    
+
+    save_model(clf)
+    distill_policy(clf, X_train, X_test, y_test)
+
+def distill_policy(clf, X_train, X_test, y_test, policy_path=os.path.join('ml_models', POLICY_FILENAME)):
+    """Fits the compact lookup-grid student to the forest and reports its fidelity."""
+    print("Distilling compact offloading policy...")
+    artifact = distill(clf, X_train)
+    policy = OffloadingPolicy(artifact)
+    artifact["fidelity"] = report = fidelity_report(policy, clf, X_test, y_test)
+
+    print("\n" + "="*50)
+    print(" DISTILLED POLICY FIDELITY (vs Random Forest, test split)")
+    print(f"   Agreement (all rows):        {report['agreement_all']:.4f}")
+    print(f"   Coverage (confident cells):  {report['coverage']:.4f}")
+    print(f"   Agreement (confident cells): {report['agreement_confident']}")
+    print(f"   Agreement with fallback:     {report['agreement_with_fallback']:.4f}")
+    print(f"   Accuracy teacher / student / fast path: {report['teacher_accuracy']:.4f} / "
+          f"{report['student_accuracy']:.4f} / {report['fast_path_accuracy']:.4f}")
+    print(f"   Student scoring cost: {report['score_ns']:.0f} ns/row (pure Python)")
+    print("="*50 + "\n")
+
+    save_policy(artifact, policy_path)
+    print(f"Policy saved to {policy_path} ({os.path.getsize(policy_path) / 1024:.1f} KB)")
+
+def save_model(clf, model_path=MODEL_PATH):
     # Save Model (Compressed)
     if not os.path.exists('ml_models'):
         os.makedirs('ml_models')
-        
-    model_path = 'ml_models/offloading_model.pkl'
+
     # Use compression=3 to reduce size < 100MB for GitHub
     joblib.dump(clf, model_path, compress=3)
-        
+
     print(f"Model saved to {model_path} (Compressed)")
 
+def train_model_streaming(source=DEFAULT_INPUT, chunksize=250_000, holdout=0.2, presorted=False):
+    """Out-of-core mode: CSV path or DB URL, read in chunks, bounded memory."""
+    if '://' not in source and not os.path.exists(source):
+        print(f"Error: {source} not found.")
+        return
+
+    print(f"Streaming data from {source} (chunks of {chunksize} rows, {holdout:.0%} held out)...")
+    if '://' not in source and not presorted:
+        print("Sorting by timestamp (external merge sort)...")
+
+    start = time.perf_counter()
+    clf, metrics = train_streaming(chunk_stream(source, chunksize, presorted=presorted), holdout=holdout)
+
+    print(f"\nTrained in {time.perf_counter() - start:.1f}s")
+    print("Held-out evaluation (streamed):\n" + metrics.report())
+
+    save_model(clf)
+
+def _measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def compare_feature_pipelines(input_file=DEFAULT_INPUT):
+    """Timing + peak-memory report: original pandas rolling vs compact dtypes + two-pointer counts."""
+    if not os.path.exists(input_file):
+        print(f"Error: {input_file} not found.")
+        return
+
+    def legacy():
+        df = pd.read_csv(input_file)
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        return legacy_txn_count_last_30d(df)
+
+    def current():
+        # exact=True: same sliding window as the rolling code, so the outputs must match
+        return add_txn_count_last_30d(load_transactions(input_file), exact=True)
+
+    old_df, old_time, old_peak = _measure(legacy)
+    new_df, new_time, new_peak = _measure(current)
+
+    match = (old_df['txn_count_last_30d'].sort_index().to_numpy() == new_df['txn_count_last_30d'].to_numpy()).all()
+
+    print("\n" + "="*50)
+    print(f" FEATURE PIPELINE REPORT ({len(new_df)} rows)")
+    print(f"   {'':<22}{'time (s)':>10}{'peak (MB)':>12}{'frame (MB)':>12}")
+    print(f"   {'pandas rolling':<22}{old_time:>10.2f}{old_peak / 1e6:>12.1f}"
+          f"{old_df.memory_usage(deep=True).sum() / 1e6:>12.1f}")
+    print(f"   {'compact + two-pointer':<22}{new_time:>10.2f}{new_peak / 1e6:>12.1f}"
+          f"{new_df.memory_usage(deep=True).sum() / 1e6:>12.1f}")
+    print(f"   Speedup: {old_time / new_time:.1f}x, peak memory: {old_peak / max(new_peak, 1):.1f}x lower")
+    print(f"   txn_count_last_30d identical: {bool(match)}")
+    print("="*50 + "\n")
+
 if __name__ == "__main__":
-    train_model()
+    parser = argparse.ArgumentParser(description="Train the edge/cloud offloading model.")
+    parser.add_argument("--input", default=DEFAULT_INPUT,
+                        help="CSV path, or a database URL (e.g. sqlite:///bankedge.db) with --stream")
+    parser.add_argument("--stream", action="store_true",
+                        help="out-of-core training: chunked reads + incremental model")
+    parser.add_argument("--chunksize", type=int, default=250_000)
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--presorted", action="store_true",
+                        help="CSV is already ordered by timestamp; skip the external sort")
+    parser.add_argument("--compare-features", action="store_true",
+                        help="report time/peak memory of the old vs new feature pipeline and exit")
+    args = parser.parse_args()
+
+    if args.compare_features:
+        compare_feature_pipelines(args.input)
+    elif args.stream:
+        train_model_streaming(args.input, args.chunksize, args.holdout, args.presorted)
+    else:
+        train_model(args.input)
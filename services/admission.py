@@ -0,0 +1,296 @@
+"""
+Admission control for POST /api/payment-success.
+
+Three checks run before a payment does any work:
+
+  1. Per-device token bucket. ADMISSION_RATE payments/s (per worker
+     process) are split across devices in proportion to TXN_CAPACITY_MAP,
+     with ADMISSION_BURST_SECONDS worth of burst. An empty bucket gets a
+     429 whose Retry-After is the time until the next token. A payment
+     that is then shed from the queue (or cancelled while waiting) gives
+     its token back, so shed traffic does not push later payments into 429s.
+  2. Global concurrency limit. At most ADMISSION_MAX_CONCURRENT payments
+     run at once; the rest wait in a FIFO queue.
+  3. Queue-time shedding. A payment that has waited ADMISSION_MAX_QUEUE_MS
+     without getting a slot, or that arrives when ADMISSION_MAX_QUEUE are
+     already waiting, gets a 503 with Retry-After.
+
+A finishing payment hands its slot straight to the oldest waiter, so under
+overload the admitted payments keep their normal latency and the excess is
+rejected in microseconds instead of waiting behind everyone else.
+Thread-based views use admission_controlled; the asyncio view awaits
+admit_async. Both kinds of waiter share one queue.
+
+Counts are per process, like the stage timings (GET /api/admission-metrics).
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+from flask import jsonify
+
+from services.request_context import current_identity
+from services.stage_timing import lap
+
+# Payments without a device scope (superadmin, unknown region)
+UNASSIGNED = 'unassigned'
+DEFAULT_CAPACITY = 1000000  # same default as get_hybrid_devices
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    def response(self):
+        return jsonify({"error": str(self)}), self.status, {"Retry-After": str(self.retry_after)}
+
+
+# =====================================================================
+# TOKEN BUCKET
+# =====================================================================
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now):
+        """0.0 when a token was taken, otherwise seconds until one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def give_back(self):
+        """Returns a token taken by a payment that never ran."""
+        self.tokens = min(self.burst, self.tokens + 1.0)
+
+
+# =====================================================================
+# WAITERS (one per queued payment)
+# =====================================================================
+class _ThreadWaiter:
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+        self.since = time.monotonic()
+
+    def wake(self):
+        self.event.set()
+
+
+class _AsyncWaiter:
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+        self.since = time.monotonic()
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+    def wake(self):
+        # release() may run on another thread than the waiter's event loop
+        self.loop.call_soon_threadsafe(self._resolve)
+
+
+# =====================================================================
+# CONTROLLER
+# =====================================================================
+class AdmissionController:
+    def __init__(self, rates, burst_seconds=2.0, max_concurrent=64, max_queue=128, max_queue_ms=250):
+        """rates: {device_id: payments/s}; UNASSIGNED is used for any other key."""
+        self.buckets = {key: TokenBucket(rate, max(rate * burst_seconds, 1.0)) for key, rate in rates.items()}
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_s = max_queue_ms / 1000.0
+        self.in_flight = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _key(self, device_id):
+        return device_id if device_id in self.buckets else UNASSIGNED
+
+    def _device_stats(self, key):
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = {"accepted": 0, "queued": 0, "rate_limited": 0, "queue_full": 0,
+                                        "queue_timeout": 0, "queue_ms_total": 0.0, "queue_ms_max": 0.0}
+        return stats
+
+    def _enter(self, key, waiter):
+        """Under the lock: admits now (returns None), queues the waiter (returns it) or raises."""
+        with self._lock:
+            stats = self._device_stats(key)
+            if self.in_flight >= self.max_concurrent and len(self._waiters) >= self.max_queue:
+                stats["queue_full"] += 1
+                raise AdmissionRejected("Payment service is overloaded, please retry", 503, 1)
+
+            wait_s = self.buckets[key].take(time.monotonic())
+            if wait_s:
+                stats["rate_limited"] += 1
+                raise AdmissionRejected(f"Payment rate limit reached for {key}, please retry", 429,
+                                        max(1, math.ceil(wait_s)))
+
+            if self.in_flight < self.max_concurrent:
+                self.in_flight += 1
+                stats["accepted"] += 1
+                return None
+
+            stats["queued"] += 1
+            self._waiters.append(waiter)
+            return waiter
+
+    def _after_wait(self, key, waiter):
+        """Admitted if release() handed the waiter a slot, otherwise shed."""
+        with self._lock:
+            stats = self._device_stats(key)
+            waited_ms = (time.monotonic() - waiter.since) * 1000.0
+            if waiter.granted:
+                stats["accepted"] += 1
+                stats["queue_ms_total"] += waited_ms
+                stats["queue_ms_max"] = max(stats["queue_ms_max"], waited_ms)
+                return waited_ms
+            self._waiters.remove(waiter)
+            self.buckets[key].give_back()
+            stats["queue_timeout"] += 1
+        raise AdmissionRejected("Payment service is overloaded, please retry", 503, 1)
+
+    def admit(self, device_id):
+        """Blocks for a slot; returns the time spent queued (ms) or raises AdmissionRejected."""
+        key = self._key(device_id)
+        waiter = self._enter(key, _ThreadWaiter())
+        if waiter is None:
+            return 0.0
+        waiter.event.wait(self.max_queue_s)
+        return self._after_wait(key, waiter)
+
+    async def admit_async(self, device_id):
+        """admit() for coroutines: the queued payment waits on a future, not a thread."""
+        key = self._key(device_id)
+        waiter = self._enter(key, _AsyncWaiter(asyncio.get_running_loop()))
+        if waiter is None:
+            return 0.0
+        try:
+            await asyncio.wait_for(waiter.future, self.max_queue_s)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # Client went away while queued: give back a slot that was already handed over
+            with self._lock:
+                if waiter.granted:
+                    self._release_locked()
+                else:
+                    self._waiters.remove(waiter)
+                    self.buckets[key].give_back()
+            raise
+        return self._after_wait(key, waiter)
+
+    def _release_locked(self):
+        if self._waiters:
+            waiter = self._waiters.popleft()
+            waiter.granted = True  # the slot passes to the waiter; in_flight is unchanged
+            waiter.wake()
+        else:
+            self.in_flight -= 1
+
+    def release(self):
+        with self._lock:
+            self._release_locked()
+
+    def snapshot(self):
+        """
+        Per device: accepted (admitted, with or without queueing), queued
+        (had to wait for a slot) and shed by reason (429 rate_limited, 503
+        queue_full / queue_timeout).
+        """
+        with self._lock:
+            devices = {}
+            for key, stats in sorted(self._stats.items()):
+                bucket = self.buckets[key]
+                admitted_after_wait = stats["queued"] - stats["queue_timeout"]
+                devices[key] = {
+                    "accepted": stats["accepted"],
+                    "queued": stats["queued"],
+                    "shed": {"rate_limited": stats["rate_limited"], "queue_full": stats["queue_full"],
+                             "queue_timeout": stats["queue_timeout"]},
+                    "avg_queue_ms": round(stats["queue_ms_total"] / admitted_after_wait, 3) if admitted_after_wait else 0.0,
+                    "max_queue_ms": round(stats["queue_ms_max"], 3),
+                    "rate_per_s": round(bucket.rate, 3),
+                    "burst": round(bucket.burst, 1),
+                }
+            return {
+                "in_flight": self.in_flight,
+                "waiting": len(self._waiters),
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "max_queue_ms": self.max_queue_s * 1000.0,
+                "devices": devices,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+
+# =====================================================================
+# APP WIRING
+# =====================================================================
+_controller = None
+
+
+def admission():
+    """This process's controller (None when ADMISSION_CONTROL is off)."""
+    return _controller
+
+
+def device_rates(capacity_map, total_rate):
+    """Splits total_rate across devices in proportion to their capacity; UNASSIGNED gets DEFAULT_CAPACITY's share."""
+    capacities = dict(capacity_map, **{UNASSIGNED: DEFAULT_CAPACITY})
+    total_capacity = sum(capacities.values())
+    return {key: total_rate * capacity / total_capacity for key, capacity in capacities.items()}
+
+
+def init_admission(app, capacity_map):
+    global _controller
+    if not app.config.get('ADMISSION_CONTROL', True):
+        _controller = None
+        return None
+
+    _controller = AdmissionController(
+        device_rates(capacity_map, app.config.get('ADMISSION_RATE', 1000)),
+        burst_seconds=app.config.get('ADMISSION_BURST_SECONDS', 2.0),
+        max_concurrent=app.config.get('ADMISSION_MAX_CONCURRENT', 64),
+        max_queue=app.config.get('ADMISSION_MAX_QUEUE', 128),
+        max_queue_ms=app.config.get('ADMISSION_MAX_QUEUE_MS', 250),
+    )
+    return _controller
+
+
+def admission_controlled(view):
+    """For thread-based views, below @jwt_required(): admits the caller's device or returns the 429/503."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        controller = _controller
+        if controller is None:
+            return view(*args, **kwargs)
+        try:
+            controller.admit(current_identity().payment_device_id)
+        except AdmissionRejected as e:
+            return e.response()
+        lap('admission')
+        try:
+            return view(*args, **kwargs)
+        finally:
+            controller.release()
+    return wrapper
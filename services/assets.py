@@ -0,0 +1,152 @@
+"""
+Fingerprinted static assets.
+
+BUNDLES maps a logical asset name to the source files under static/ that
+make it up. build_assets() concatenates each bundle, minifies CSS, and
+writes it to static/dist/ under a content-hashed name
+(css/app.3f9c1e0a7b.css), plus dist/manifest.json mapping logical names to
+those files. Templates reference assets through asset_url('css/app.css'),
+so a changed file gets a new URL, and the hashed files can be served with
+a year-long `immutable` Cache-Control (static_cache_control).
+
+The manifest is built by scripts/build_assets.py (Docker build) or at
+startup when it is missing or older than a source. With ASSETS_WATCH=1
+(local development) sources are re-checked on every asset_url call.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+
+from flask import current_app, url_for
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 10
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+BUNDLES = {
+    'css/app.css': ['css/style.css', 'css/header-fix.css', 'css/tabs-fix.css'],
+    'js/main.js': ['js/main.js'],
+}
+
+
+# =====================================================================
+# BUILD
+# =====================================================================
+# Quoted strings and url(...) are copied as written; comments are dropped
+_CSS_STRING = r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\''
+_CSS_LITERAL = re.compile(rf'({_CSS_STRING}|url\(\s*(?:{_CSS_STRING}|[^)]*)\s*\))|/\*.*?\*/', re.S | re.I)
+
+
+def _minify_css_code(code):
+    code = re.sub(r'\s+', ' ', code)
+    code = re.sub(r'\s*([{};,])\s*', r'\1', code)
+    return code.replace(';}', '}')
+
+
+def minify_css(css):
+    """
+    Drops comments and collapses whitespace outside quoted strings and
+    url(...); selectors and values are otherwise left as written.
+    """
+    parts = _CSS_LITERAL.split(css)
+    out, code = [], ''
+    # split() alternates code, literal (None for a comment), code, ...
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            code += part
+        elif part is not None:
+            out += [_minify_css_code(code), part]
+            code = ''
+    out.append(_minify_css_code(code))
+    return ''.join(out).strip()
+
+
+def bundle_sources(static_folder, sources):
+    return [os.path.join(static_folder, source) for source in sources]
+
+
+def newest_source_mtime(static_folder):
+    return max(os.path.getmtime(path) for sources in BUNDLES.values()
+               for path in bundle_sources(static_folder, sources))
+
+
+def build_assets(static_folder, minify=True):
+    """Writes every bundle to static/dist/ and returns the manifest; files from older builds are removed."""
+    dist = os.path.join(static_folder, DIST_DIR)
+    manifest = {}
+    for name, sources in BUNDLES.items():
+        parts = []
+        for path in bundle_sources(static_folder, sources):
+            with open(path, encoding='utf-8') as f:
+                parts.append(f.read())
+        content = '\n'.join(parts)
+        if minify and name.endswith('.css'):
+            content = minify_css(content)
+        data = content.encode('utf-8')
+
+        stem, ext = os.path.splitext(name)
+        hashed = f"{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}"
+        path = os.path.join(dist, hashed)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path):
+            tmp = path + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        manifest[name] = f"{DIST_DIR}/{hashed}"
+
+    tmp = os.path.join(dist, MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(dist, MANIFEST))
+
+    # Stale fingerprints from earlier builds
+    current = {os.path.normpath(os.path.join(static_folder, p)) for p in manifest.values()}
+    for root, _, files in os.walk(dist):
+        for filename in files:
+            path = os.path.normpath(os.path.join(root, filename))
+            if filename != MANIFEST and path not in current:
+                os.remove(path)
+    return manifest
+
+
+# =====================================================================
+# APP WIRING
+# =====================================================================
+_manifest = {}
+_manifest_lock = threading.Lock()
+
+
+def load_manifest(static_folder, rebuild_if_stale=True):
+    """Reads dist/manifest.json, building it first when missing or older than a source."""
+    global _manifest
+    path = os.path.join(static_folder, DIST_DIR, MANIFEST)
+    with _manifest_lock:
+        if rebuild_if_stale and (not os.path.exists(path) or os.path.getmtime(path) < newest_source_mtime(static_folder)):
+            _manifest = build_assets(static_folder)
+        else:
+            with open(path) as f:
+                _manifest = json.load(f)
+    return _manifest
+
+
+def asset_url(name):
+    """URL of the fingerprinted build of a logical asset (BUNDLES key)."""
+    if current_app.config.get('ASSETS_WATCH'):
+        load_manifest(current_app.static_folder)
+    return url_for('static', filename=_manifest[name])
+
+
+def static_cache_control(filename):
+    """Cache-Control for a static file: immutable for fingerprinted builds, None (revalidate) otherwise."""
+    if filename and filename.startswith(DIST_DIR + '/') and filename != f"{DIST_DIR}/{MANIFEST}":
+        return IMMUTABLE
+    return None
+
+
+def init_assets(app):
+    load_manifest(app.static_folder)
+    app.jinja_env.globals['asset_url'] = asset_url
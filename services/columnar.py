@@ -0,0 +1,87 @@
+"""
+Columnar JSON for transaction listings (opt-in with ?format=columnar).
+
+A row listing repeats every key name in every row. The columnar form sends
+one array per field instead, and dictionary-encodes the enum-like fields
+(each value is an index into a short list of distinct values):
+
+    {"format": "columnar", "length": 2,
+     "columns": {"id": ["pi_1", "pi_2"], "amount": [10.0, 25.5], "device_id": [0, 0], ...},
+     "dictionaries": {"device_id": ["edge-14"], ...}}
+
+Rows come in as tuples (column queries, no ORM objects) and are transposed
+with zip(), so no per-row dict is built. static/js/main.js turns a block
+back into row objects with fromColumnar().
+"""
+from flask import request
+from sqlalchemy import func
+
+from models import Device, Transaction
+
+ENUM_FIELDS = frozenset(('processing_decision', 'stripe_status', 'type', 'device_id'))
+
+# Fields of the transaction listings and the column each one is read from
+TRANSACTION_COLUMNS = {
+    "id": Transaction.id,
+    "amount": Transaction.amount,
+    "type": Transaction.type,
+    "stripe_status": Transaction.stripe_status,
+    "processing_decision": Transaction.processing_decision,
+    "merchant_name": Transaction.merchant_name,
+    "device_id": Transaction.device_id,
+    "device_name": func.coalesce(Device.name, "Unknown"),
+    "latency": Transaction.latency,
+    "confidence": Transaction.confidence,
+    "customer_id": Transaction.customer_id,
+    "recipient_account": Transaction.recipient_account,
+    "reference": Transaction.reference,
+    "timestamp": Transaction.timestamp,
+}
+
+
+def wants_columnar():
+    return request.args.get('format') == 'columnar'
+
+
+def isoformat(ts):
+    return ts.isoformat() if ts else None
+
+
+def dictionary_encode(values):
+    """(distinct values in first-seen order, index of each value)."""
+    index = {}
+    codes = [index.setdefault(v, len(index)) for v in values]
+    return list(index), codes
+
+
+def columnar(names, rows, converters=None, enum_fields=ENUM_FIELDS):
+    """
+    names: field names, in the order of each row tuple. converters: {name:
+    fn} applied to that column (e.g. isoformat). enum_fields: names to
+    dictionary-encode.
+    """
+    converters = converters or {}
+    values_by_column = zip(*rows) if rows else [()] * len(names)
+
+    columns = {}
+    dictionaries = {}
+    for name, values in zip(names, values_by_column):
+        if name in converters:
+            values = map(converters[name], values)
+        if name in enum_fields:
+            dictionaries[name], values = dictionary_encode(values)
+        columns[name] = list(values)
+
+    return {"format": "columnar", "length": len(rows), "columns": columns, "dictionaries": dictionaries}
+
+
+# =====================================================================
+# TRANSACTION LISTINGS
+# =====================================================================
+def transaction_rows(query):
+    """A filtered/ordered Transaction query narrowed to TRANSACTION_COLUMNS tuples (paginate or limit it next)."""
+    return query.outerjoin(Device, Device.id == Transaction.device_id).with_entities(*TRANSACTION_COLUMNS.values())
+
+
+def transaction_columns(rows):
+    return columnar(list(TRANSACTION_COLUMNS), rows, converters={"timestamp": isoformat})
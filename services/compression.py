@@ -0,0 +1,88 @@
+"""
+Negotiated gzip for API responses and pages.
+
+init_compression registers an after_request hook before every other hook,
+so it runs last and compresses the final body. A response is left as is
+when the client does not accept gzip (Accept-Encoding, q-values honored),
+when its type is not text-like, when it is smaller than COMPRESS_MIN_SIZE,
+and when it is already encoded or passed through from a file (send_file).
+
+Bodies of COMPRESS_STREAM_THRESHOLD bytes or more (and responses that are
+already generators) are compressed in COMPRESS_CHUNK_SIZE pieces while the
+server sends them, without a Content-Length, so the first bytes go out
+before the whole body is compressed. Smaller bodies are compressed in one
+call. COMPRESS_LEVEL trades CPU for size; see scripts/benchmark_compression.py.
+"""
+import zlib
+
+from flask import request
+
+COMPRESSIBLE_MIMETYPES = frozenset((
+    'application/json', 'text/html', 'text/css', 'text/plain', 'text/csv',
+    'application/javascript', 'text/javascript', 'image/svg+xml',
+))
+GZIP_WBITS = 31  # zlib container = gzip
+
+
+def gzip_bytes(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def gzip_stream(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def split_chunks(data, size):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def accepts_gzip():
+    return request.accept_encodings['gzip'] > 0
+
+
+def init_compression(app):
+    """Call before registering any other after_request hook."""
+    if not app.config.get('COMPRESSION', True):
+        return
+
+    level = app.config.get('COMPRESS_LEVEL', 6)
+    min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+    stream_threshold = app.config.get('COMPRESS_STREAM_THRESHOLD', 256 * 1024)
+    chunk_size = app.config.get('COMPRESS_CHUNK_SIZE', 64 * 1024)
+
+    @app.after_request
+    def _compress(response):
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+        # Caches must key on Accept-Encoding whether or not this one was compressed
+        response.vary.add('Accept-Encoding')
+
+        if (response.direct_passthrough or request.method == 'HEAD'
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers or not accepts_gzip()):
+            return response
+
+        if response.is_streamed:
+            response.response = gzip_stream(response.response, level)
+        else:
+            data = response.get_data()
+            if len(data) < min_size:
+                return response
+            if len(data) >= stream_threshold:
+                response.response = gzip_stream(split_chunks(data, chunk_size), level)
+            else:
+                response.set_data(gzip_bytes(data, level))
+
+        if response.is_streamed:
+            response.headers.pop('Content-Length', None)
+        response.headers['Content-Encoding'] = 'gzip'
+        return response
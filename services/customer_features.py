@@ -0,0 +1,218 @@
+"""
+Incremental per-customer feature store.
+
+Every new transaction bumps the customer's totals (customer_features) and
+its daily bucket (customer_feature_buckets) with atomic upserts in the
+same DB transaction as the payment row. Rolling features are the sum of
+the last WINDOW_DAYS buckets (today included), read with primary-key
+lookups instead of a COUNT over the transaction history.
+
+Offline, services.offloading_features.window_starts() uses the same
+day-bucket window, so training features match what the app reads here.
+WINDOW_DAYS is repeated below rather than imported from there, which would
+pull numpy and pandas into every web worker at startup.
+Buckets older than the window are compacted away periodically.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import (
+    db, CustomerFeature, CustomerFeatureBucket, LoadTestCustomerFeature, LoadTestCustomerFeatureBucket,
+    Transaction
+)
+
+UTC8 = timezone(timedelta(hours=8))
+WINDOW_DAYS = 30  # == services.offloading_features.WINDOW_DAYS
+
+
+def feature_models(load_test=False):
+    if load_test:
+        return LoadTestCustomerFeature, LoadTestCustomerFeatureBucket
+    return CustomerFeature, CustomerFeatureBucket
+
+
+def bucket_day(ts):
+    """Calendar day (UTC+8) a timestamp falls in; naive timestamps are already UTC+8 wall clock."""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(UTC8)
+    return ts.date()
+
+
+# =====================================================================
+# ONLINE READ
+# =====================================================================
+def lookup_features(customer_id, as_of, load_test=False):
+    """Feature vector for `customer_id` before a transaction at `as_of`."""
+    features = {"txn_count_last_30d": 0, "amount_sum_last_30d": 0.0,
+                "txn_count_total": 0, "last_seen": None}
+    if not customer_id:
+        return features
+
+    Feature, Bucket = feature_models(load_test)
+    row = db.session.get(Feature, customer_id)
+    if row is None:
+        return features
+
+    day = bucket_day(as_of)
+    count, amount = db.session.query(
+        sa.func.coalesce(sa.func.sum(Bucket.txn_count), 0),
+        sa.func.coalesce(sa.func.sum(Bucket.amount_sum), 0.0)
+    ).filter(
+        Bucket.customer_id == customer_id,
+        Bucket.day >= day - timedelta(days=WINDOW_DAYS - 1),
+        Bucket.day <= day
+    ).one()
+
+    features.update(txn_count_last_30d=int(count), amount_sum_last_30d=float(amount),
+                    txn_count_total=row.txn_count_total, last_seen=row.last_seen)
+    return features
+
+
+# =====================================================================
+# INCREMENTAL WRITE
+# =====================================================================
+def _upsert(model, values, increments, keys):
+    """INSERT ... ON CONFLICT DO UPDATE col = col + excluded.col (atomic, no read-modify-write)."""
+    table = model.__table__
+    dialect = db.session.get_bind(mapper=model).dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        insert = (sqlite if dialect == 'sqlite' else postgresql).insert(table).values(**values)
+        updates = {col: table.c[col] + insert.excluded[col] for col in increments}
+        if 'last_seen' in values:
+            updates['last_seen'] = sa.case(
+                (table.c.last_seen.is_(None), insert.excluded.last_seen),
+                (table.c.last_seen < insert.excluded.last_seen, insert.excluded.last_seen),
+                else_=table.c.last_seen)
+        stmt = insert.on_conflict_do_update(index_elements=keys, set_=updates)
+        db.session.execute(stmt, bind_arguments={"mapper": model})
+        return
+
+    # Other databases: UPDATE first, INSERT when no row was there
+    where = [table.c[k] == values[k] for k in keys]
+    updates = {col: table.c[col] + values[col] for col in increments}
+    if 'last_seen' in values:
+        updates['last_seen'] = values['last_seen']
+    result = db.session.execute(table.update().where(*where).values(**updates), bind_arguments={"mapper": model})
+    if not result.rowcount:
+        db.session.execute(table.insert().values(**values), bind_arguments={"mapper": model})
+
+
+def record_transaction(customer_id, amount, ts, load_test=False):
+    """Applies one new transaction to the store. Call inside the request's session, before commit."""
+    if not customer_id:
+        return
+    Feature, Bucket = feature_models(load_test)
+    seen = ts.astimezone(UTC8).replace(tzinfo=None) if ts.tzinfo is not None else ts
+    amount = float(amount or 0.0)
+
+    _upsert(Feature,
+            {"customer_id": customer_id, "txn_count_total": 1, "amount_sum_total": amount,
+             "first_seen": seen, "last_seen": seen},
+            ("txn_count_total", "amount_sum_total"), ["customer_id"])
+    _upsert(Bucket,
+            {"customer_id": customer_id, "day": bucket_day(ts), "txn_count": 1, "amount_sum": amount},
+            ("txn_count", "amount_sum"), ["customer_id", "day"])
+
+
+# =====================================================================
+# COMPACTION + REBUILD
+# =====================================================================
+def compact_buckets(db, today=None, batch_size=1000, pause=0.05):
+    """Deletes buckets that fell out of the window, in small batches (one short transaction each)."""
+    today = today or datetime.now(UTC8).date()
+    cutoff = today - timedelta(days=WINDOW_DAYS - 1)
+    deleted = {}
+
+    for name, Bucket in (("primary", CustomerFeatureBucket), ("loadtest", LoadTestCustomerFeatureBucket)):
+        table = Bucket.__table__
+        engine = db.engines[table.metadata.info.get("bind_key")]
+        oldest = sa.select(table.c.customer_id, table.c.day).where(table.c.day < cutoff).limit(batch_size)
+        total = 0
+        while True:
+            with engine.begin() as conn:
+                keys = conn.execute(oldest).all()
+                if keys:
+                    conn.execute(table.delete().where(
+                        table.c.customer_id == sa.bindparam('_cid'), table.c.day == sa.bindparam('_day')
+                    ), [{"_cid": cid, "_day": day} for cid, day in keys])
+            total += len(keys)
+            if len(keys) < batch_size:
+                break
+            time.sleep(pause)
+        deleted[name] = total
+    return deleted
+
+
+def rebuild_from_transactions(db, since_days=WINDOW_DAYS):
+    """
+    Recomputes the production store from the transaction table with two
+    GROUP BY queries (initial backfill, or repair after bulk imports).
+    Only buckets still inside the window are written unless since_days=None.
+    """
+    txn = Transaction.__table__
+    features, buckets = CustomerFeature.__table__, CustomerFeatureBucket.__table__
+    day = sa.func.date(txn.c.timestamp)
+    cutoff = datetime.now(UTC8).date() - timedelta(days=since_days - 1) if since_days else None
+
+    with db.engines[None].begin() as conn:
+        conn.execute(buckets.delete())
+        conn.execute(features.delete())
+        conn.execute(features.insert().from_select(
+            ["customer_id", "txn_count_total", "amount_sum_total", "first_seen", "last_seen"],
+            sa.select(txn.c.customer_id, sa.func.count(), sa.func.coalesce(sa.func.sum(txn.c.amount), 0.0),
+                      sa.func.min(txn.c.timestamp), sa.func.max(txn.c.timestamp))
+            .where(txn.c.customer_id.isnot(None)).group_by(txn.c.customer_id)
+        ))
+        bucket_query = (sa.select(txn.c.customer_id, day, sa.func.count(),
+                                  sa.func.coalesce(sa.func.sum(txn.c.amount), 0.0))
+                        .where(txn.c.customer_id.isnot(None)))
+        if cutoff:
+            bucket_query = bucket_query.where(day >= cutoff.isoformat())
+        conn.execute(buckets.insert().from_select(
+            ["customer_id", "day", "txn_count", "amount_sum"],
+            bucket_query.group_by(txn.c.customer_id, day)
+        ))
+        return {
+            "customers": conn.execute(sa.select(sa.func.count()).select_from(features)).scalar(),
+            "buckets": conn.execute(sa.select(sa.func.count()).select_from(buckets)).scalar(),
+        }
+
+
+# =====================================================================
+# STARTUP
+# =====================================================================
+def init_feature_store(app, db):
+    """
+    Creates the feature-store tables on a primary database made before the
+    store existed (SQLite or Postgres; existing tables are left alone). The
+    load-test copies are created with the load-test bind.
+    """
+    with app.app_context():
+        db.metadata.create_all(db.engines[None], tables=[CustomerFeature.__table__, CustomerFeatureBucket.__table__])
+
+
+def start_compaction_worker(app, db):
+    """Background thread that runs compact_buckets every N seconds."""
+    interval = app.config.get('CUSTOMER_FEATURES_COMPACT_INTERVAL', 3600)
+    if not interval:
+        return None
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                with app.app_context():
+                    deleted = compact_buckets(db)
+                if any(deleted.values()):
+                    app.logger.info("Customer feature compaction: %s", deleted)
+            except Exception:
+                app.logger.exception("Customer feature compaction failed")
+
+    worker = threading.Thread(target=loop, name="customer-feature-compaction", daemon=True)
+    worker.start()
+    return worker
@@ -0,0 +1,168 @@
+import threading
+import time
+from functools import wraps
+
+import sqlalchemy as sa
+from flask import g, has_app_context, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+# Bind key used for the read pool / replica in SQLALCHEMY_BINDS
+READ_BIND_KEY = 'read'
+
+ROUTE_PRIMARY = 'primary'
+ROUTE_READ = 'read'
+
+_metrics_lock = threading.Lock()
+_route_stats = {}
+_endpoint_routes = {}
+_read_fallbacks = 0
+
+
+# =====================================================================
+# CONFIG: Build the read bind from the primary URL (or a replica URL)
+# =====================================================================
+def build_read_bind(primary_url, replica_url=None, pool_size=10):
+    """
+    Returns the SQLALCHEMY_BINDS entry for the read engine, or None when
+    reads should stay on the primary.
+
+    - Postgres: uses the replica URL when one is configured.
+    - SQLite: opens a separate pool on the same WAL file; connections are
+      switched to query_only on connect.
+    """
+    if replica_url:
+        if replica_url.startswith("postgres://"):
+            replica_url = replica_url.replace("postgres://", "postgresql://", 1)
+        return {"url": replica_url, "pool_size": pool_size, "pool_pre_ping": True}
+
+    if not primary_url or not primary_url.startswith("sqlite"):
+        return None
+
+    # In-memory databases cannot be shared between two engines
+    if primary_url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in primary_url:
+        return None
+
+    return {"url": primary_url, "pool_size": pool_size, "max_overflow": pool_size}
+
+
+# =====================================================================
+# ROUTING: Session that sends read-only views to the read bind
+# =====================================================================
+def _read_requested():
+    return has_app_context() and g.get('db_route') == ROUTE_READ
+
+
+def _uses_default_bind(mapper, clause):
+    """Only tables on the primary database have a read replica."""
+    table = None
+    if mapper is not None:
+        table = sa.inspect(mapper).local_table
+    elif isinstance(clause, sa.Table):
+        table = clause
+    return table is None or table.metadata.info.get("bind_key") is None
+
+
+class RoutingSession(Session):
+    """
+    Session that uses the read bind for statements issued inside views marked
+    with @use_read_replica. Flushes and UPDATE/DELETE statements always go to
+    the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _read_requested() \
+                and not isinstance(clause, sa.UpdateBase) and _uses_default_bind(mapper, clause):
+            engine = self._db.engines.get(READ_BIND_KEY)
+            if engine is not None:
+                return engine
+            _record_fallback()
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_read_replica(view):
+    """Marks a view as read-only so its queries are served by the read bind."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_route = ROUTE_READ
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# =====================================================================
+# METRICS: Per-route query counts and timings
+# =====================================================================
+def _record_fallback():
+    global _read_fallbacks
+    with _metrics_lock:
+        _read_fallbacks += 1
+
+
+def _record_query(route, elapsed_ms):
+    endpoint = request.endpoint if has_request_context() else None
+    with _metrics_lock:
+        stats = _route_stats.setdefault(route, {"queries": 0, "total_ms": 0.0, "max_ms": 0.0})
+        stats["queries"] += 1
+        stats["total_ms"] += elapsed_ms
+        if elapsed_ms > stats["max_ms"]:
+            stats["max_ms"] = elapsed_ms
+
+        if endpoint:
+            routes = _endpoint_routes.setdefault(endpoint, {})
+            routes[route] = routes.get(route, 0) + 1
+
+
+def _instrument_engine(engine, route):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('query_start')
+        if starts:
+            _record_query(route, (time.perf_counter() - starts.pop()) * 1000.0)
+
+
+def _set_sqlite_query_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+def _set_postgres_read_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+    cursor.close()
+    dbapi_connection.commit()
+
+
+def init_db_routing(app, db):
+    """Attach query metrics to every engine and lock the read engine down."""
+    with app.app_context():
+        for key, engine in db.engines.items():
+            route = key or ROUTE_PRIMARY
+            _instrument_engine(engine, route)
+
+            if key == READ_BIND_KEY:
+                if engine.dialect.name == 'sqlite':
+                    event.listen(engine, "connect", _set_sqlite_query_only)
+                elif engine.dialect.name == 'postgresql':
+                    event.listen(engine, "connect", _set_postgres_read_only)
+
+
+def query_metrics_snapshot():
+    with _metrics_lock:
+        routes = {}
+        for route, stats in _route_stats.items():
+            routes[route] = {
+                "queries": stats["queries"],
+                "total_ms": round(stats["total_ms"], 3),
+                "avg_ms": round(stats["total_ms"] / stats["queries"], 3) if stats["queries"] else 0.0,
+                "max_ms": round(stats["max_ms"], 3),
+            }
+        return {
+            "routes": routes,
+            "endpoints": {ep: dict(r) for ep, r in _endpoint_routes.items()},
+            "readFallbacks": _read_fallbacks,
+        }
@@ -0,0 +1,158 @@
+"""
+Cross-worker device counters in shared memory.
+
+One int64 array (multiprocessing.shared_memory) with a slot per device in
+TXN_CAPACITY_MAP. Each slot holds the payment count and latency sum since
+startup, plus a ring of WINDOW_SECONDS one-second buckets (second, count,
+latency sum) for the device's last-minute load and latency. Every worker
+bumps it after a payment commits, and get_hybrid_devices reads it instead of
+running a COUNT/AVG over the transactions table per device.
+
+Each slot has its own lock (one stripe per device), so payments on
+different devices never contend. The segment and the locks are created by
+the process that imports the app and are inherited by forked workers, which
+is what gunicorn's preload_app does; without preload each worker would get
+its own segment. Latencies are stored as integer microseconds.
+"""
+import atexit
+import multiprocessing
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from multiprocessing import shared_memory
+
+from models import db, Transaction
+
+UTC8 = timezone(timedelta(hours=8))
+WINDOW_SECONDS = 60
+
+# Slot layout: [total_count, total_latency_us] + WINDOW_SECONDS x [second, count, latency_us]
+_HEADER = 2
+_BUCKET = 3
+
+
+class DeviceCounters:
+    def __init__(self, device_ids, window=WINDOW_SECONDS):
+        self.device_ids = list(device_ids)
+        self.slots = {device_id: i for i, device_id in enumerate(self.device_ids)}
+        self.window = window
+        self.stride = _HEADER + _BUCKET * window
+        self._shm = shared_memory.SharedMemory(create=True, size=max(len(self.device_ids), 1) * self.stride * 8)
+        self._q = self._shm.buf.cast('q')  # a new segment is zero-filled
+        self._locks = [multiprocessing.Lock() for _ in self.device_ids]
+        self._owner_pid = os.getpid()
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def record(self, device_id, latency_ms, now=None, total=True):
+        """Counts one payment for `device_id` (total=False: window only); False for devices without a slot."""
+        slot = self.slots.get(device_id)
+        if slot is None:
+            return False
+
+        second = int(now if now is not None else time.time())
+        latency_us = int(round((latency_ms or 0.0) * 1000.0))
+        q = self._q
+        base = slot * self.stride
+        bucket = base + _HEADER + _BUCKET * (second % self.window)
+        with self._locks[slot]:
+            if total:
+                q[base] += 1
+                q[base + 1] += latency_us
+            if q[bucket] != second:
+                # Bucket still holds a second from a previous lap of the ring
+                q[bucket] = second
+                q[bucket + 1] = 0
+                q[bucket + 2] = 0
+            q[bucket + 1] += 1
+            q[bucket + 2] += latency_us
+        return True
+
+    def window_stats(self, device_id, now=None):
+        """(count, avg latency ms) over the last `window` seconds, or None for devices without a slot."""
+        slot = self.slots.get(device_id)
+        if slot is None:
+            return None
+
+        now = int(now if now is not None else time.time())
+        q = self._q
+        base = slot * self.stride + _HEADER
+        count = 0
+        latency_us = 0
+        with self._locks[slot]:
+            for i in range(self.window):
+                bucket = base + _BUCKET * i
+                if now - self.window < q[bucket] <= now:
+                    count += q[bucket + 1]
+                    latency_us += q[bucket + 2]
+        return count, (latency_us / count / 1000.0 if count else 0.0)
+
+    def totals(self):
+        """{device_id: (count, latency ms sum)} since startup (or the last reset)."""
+        result = {}
+        for device_id, slot in self.slots.items():
+            base = slot * self.stride
+            with self._locks[slot]:
+                result[device_id] = (self._q[base], self._q[base + 1] / 1000.0)
+        return result
+
+    def reset(self):
+        for slot in self.slots.values():
+            base = slot * self.stride
+            with self._locks[slot]:
+                for i in range(base, base + self.stride):
+                    self._q[i] = 0
+
+    def close(self):
+        """Detaches this process; the creating process also removes the segment."""
+        if self._q is None:
+            return
+        self._q.release()
+        self._q = None
+        self._shm.close()
+        if os.getpid() == self._owner_pid:
+            self._shm.unlink()
+
+
+# =====================================================================
+# APP WIRING
+# =====================================================================
+_counters = None
+
+
+def device_counters():
+    """The app's DeviceCounters, or None when DEVICE_COUNTERS is off."""
+    return _counters
+
+
+def seed_window(counters):
+    """Loads the last window of production payments from the DB (server restart)."""
+    since = datetime.now(UTC8) - timedelta(seconds=counters.window)
+    rows = db.session.query(Transaction.device_id, Transaction.timestamp, Transaction.latency).filter(
+        Transaction.device_id.in_(counters.device_ids),
+        Transaction.timestamp >= since
+    ).all()
+    for device_id, ts, latency in rows:
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=UTC8)  # stored as UTC+8 wall clock
+        # Only the window is seeded; totals count from startup
+        counters.record(device_id, latency, now=ts.timestamp(), total=False)
+    return len(rows)
+
+
+def init_device_counters(app, device_ids):
+    global _counters
+    if not app.config.get('DEVICE_COUNTERS', True):
+        return None
+
+    _counters = DeviceCounters(device_ids)
+    atexit.register(_counters.close)
+    try:
+        with app.app_context():
+            seed_window(_counters)
+    except Exception as e:
+        # Fresh DB (tables not created yet): the window fills as payments arrive
+        app.logger.info("Device counters not seeded: %s", e)
+    return _counters
@@ -0,0 +1,287 @@
+"""
+In-process holder for the live offloading forest.
+
+The model is deserialised once per worker process (and again only when the
+artifact's mtime changes), so payment_success no longer pays a joblib.load
+per request and /api/ml-diagnosis can report on the object actually serving
+traffic: when and how fast it loaded, the artifact hash, the resident memory
+it added, predictions served and rolling inference latency. A worker that has
+only served the distilled fast path never loads the forest, so the artifact
+itself (size, mtime, sha256) is reported from disk, and `loadable` falls back
+to the last validation of that same file.
+
+Re-validating the artifact on disk is a separate, rate-limited operation
+that loads it in a child process (python services/live_model.py <path>),
+so a corrupt or huge file never touches the web worker's memory. It runs in
+a background thread; the result is written next to the model
+(model_validation.json) so every worker reports it.
+"""
+import hashlib
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+LATENCY_SAMPLES = 1000
+VALIDATE_TIMEOUT_S = 60
+
+UTC8 = timezone(timedelta(hours=8))
+
+
+def _rss_bytes():
+    """Current resident set size of this process (Linux /proc; None elsewhere)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _load_artifact(path):
+    """Reads the file once: hashes the bytes and unpickles them from memory."""
+    import joblib
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    return joblib.load(io.BytesIO(data)), hashlib.sha256(data).hexdigest(), len(data)
+
+
+# =====================================================================
+# LIVE MODEL CACHE (one per worker process)
+# =====================================================================
+_lock = threading.Lock()
+_state = {"path": None, "mtime": None, "model": None, "info": None}
+_stats_lock = threading.Lock()
+_predictions = {"count": 0}
+_latency = deque(maxlen=LATENCY_SAMPLES)
+
+
+def get_model(path):
+    """Returns the loaded model for `path`, or None when the file is missing/unloadable."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if _state["path"] != path or _state["mtime"] != mtime:
+        with _lock:
+            if _state["path"] != path or _state["mtime"] != mtime:
+                rss_before = _rss_bytes()
+                started = time.perf_counter()
+                try:
+                    model, sha256, size = _load_artifact(path)
+                    error = None
+                except Exception as e:
+                    model, sha256, size, error = None, None, None, str(e)
+                load_ms = (time.perf_counter() - started) * 1000.0
+                rss_after = _rss_bytes()
+
+                # Drop the previous model before publishing the new one
+                _state.update(path=path, mtime=mtime, model=model, info={
+                    "loaded_at": datetime.now(UTC8).isoformat(),
+                    "load_ms": round(load_ms, 2),
+                    "sha256": sha256,
+                    "size_bytes": size,
+                    "rss_delta_bytes": rss_after - rss_before if rss_before and rss_after else None,
+                    "error": error,
+                })
+                with _stats_lock:
+                    _predictions["count"] = 0
+                    _latency.clear()
+    return _state["model"]
+
+
+def record_prediction(elapsed_ms):
+    with _stats_lock:
+        _predictions["count"] += 1
+        _latency.append(elapsed_ms)
+
+
+def _percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(int(len(ordered) * q), len(ordered) - 1)], 4)
+    return {
+        "count": len(ordered),
+        "avg_ms": round(sum(ordered) / len(ordered), 4),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1], 4),
+    }
+
+
+_artifact_hash = {"key": None, "sha256": None}
+
+
+def artifact_state(path):
+    """The file on disk, whatever this worker has loaded (hash cached per mtime)."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return {"exists": False, "size_bytes": 0, "mtime": None, "sha256": None}
+    key = (path, st.st_mtime, st.st_size)
+    if _artifact_hash["key"] != key:
+        digest = hashlib.sha256()
+        try:
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+            _artifact_hash.update(key=key, sha256=digest.hexdigest())
+        except OSError:
+            return {"exists": False, "size_bytes": 0, "mtime": None, "sha256": None}
+    return {
+        "exists": True,
+        "size_bytes": st.st_size,
+        "mtime": datetime.fromtimestamp(st.st_mtime, UTC8).isoformat(),
+        "sha256": _artifact_hash["sha256"],
+    }
+
+
+def live_model_stats(path):
+    """
+    The artifact on disk plus what this worker is serving. `loaded` is this
+    worker only; `loadable` comes from this worker's load of the current file,
+    else from the last validation with the same sha256, else None (unknown).
+    """
+    artifact = artifact_state(path)
+    exists = artifact["exists"]
+    loaded = _state["path"] == path and _state["model"] is not None
+    with _stats_lock:
+        stats = {
+            "model_path": path,
+            "exists": exists,
+            "size_bytes": artifact["size_bytes"],
+            "artifact": artifact,
+            "loaded": loaded,
+            "pid": os.getpid(),
+            "process_rss_bytes": _rss_bytes(),
+            "predictions": _predictions["count"],
+            "latency": _percentiles(_latency),
+        }
+    info = _state["info"] if _state["path"] == path else None
+    stats.update(info or {"loaded_at": None, "load_ms": None, "sha256": None,
+                          "rss_delta_bytes": None, "error": None})
+    # Artifact replaced on disk since this worker loaded it (picked up on the next prediction)
+    stats["stale"] = bool(loaded and exists and os.path.getmtime(path) != _state["mtime"])
+
+    validation = last_validation(path)
+    if info and exists and _state["mtime"] == os.path.getmtime(path):
+        stats["loadable"] = info["error"] is None
+    elif validation and "loadable" in validation and validation.get("sha256") == artifact["sha256"]:
+        stats["loadable"] = validation["loadable"]
+    else:
+        stats["loadable"] = None
+    return stats
+
+
+# =====================================================================
+# RELOAD VALIDATION (child process in a background thread, rate-limited)
+# =====================================================================
+_validate_lock = threading.Lock()
+_last_validation = {"at": 0.0}
+
+
+class ValidationRateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"validation ran recently; retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+def validation_path(path):
+    return os.path.join(os.path.dirname(path), 'model_validation.json')
+
+
+def _write_validation(path, result):
+    # Replace atomically: other workers read it for /api/ml-diagnosis
+    target = validation_path(path)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp, target)
+    except OSError:
+        pass
+
+
+def last_validation(path):
+    """The last validation of `path` by any worker (None if never run)."""
+    try:
+        with open(validation_path(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _run_validation(path, artifact):
+    started = time.perf_counter()
+    try:
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), path],
+                              capture_output=True, text=True, timeout=VALIDATE_TIMEOUT_S)
+        if proc.returncode == 0:
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+        else:
+            result = {"loadable": False, "error": (proc.stderr.strip().splitlines() or ["failed"])[-1]}
+    except subprocess.TimeoutExpired:
+        result = {"loadable": False, "error": f"timed out after {VALIDATE_TIMEOUT_S}s"}
+    except (OSError, ValueError, IndexError) as e:
+        result = {"loadable": False, "error": str(e)}
+
+    # A failed load has no hash of its own: tie it to the file that was tried
+    result.setdefault("sha256", artifact["sha256"])
+    result.update(status="done", validated_at=datetime.now(UTC8).isoformat(),
+                  wall_ms=round((time.perf_counter() - started) * 1000.0, 2))
+    live = _state["info"] if _state["path"] == path else None
+    if live and live["sha256"] and result.get("sha256"):
+        result["matches_live"] = result["sha256"] == live["sha256"]
+    _write_validation(path, result)
+
+
+def start_validation(path, min_interval):
+    """
+    Starts loading `path` in a fresh interpreter (hash, load time, memory,
+    model shape) on a background thread and returns the pending record; the
+    result appears in last_validation(). Raises ValidationRateLimited if the
+    last run in this worker started less than `min_interval` seconds ago.
+    """
+    with _validate_lock:
+        wait = _last_validation["at"] + min_interval - time.monotonic()
+        if _last_validation["at"] and wait > 0:
+            raise ValidationRateLimited(int(wait) + 1)
+        _last_validation["at"] = time.monotonic()
+
+    artifact = artifact_state(path)
+    pending = {"status": "running", "started_at": datetime.now(UTC8).isoformat(),
+               "sha256": artifact["sha256"], "timeout_s": VALIDATE_TIMEOUT_S}
+    _write_validation(path, pending)
+    threading.Thread(target=_run_validation, args=(path, artifact), daemon=True,
+                     name="model-validate").start()
+    return pending
+
+
+def _validate_main(path):
+    rss_before = _rss_bytes()
+    started = time.perf_counter()
+    model, sha256, size = _load_artifact(path)
+    load_ms = (time.perf_counter() - started) * 1000.0
+    rss_after = _rss_bytes()
+    print(json.dumps({
+        "loadable": True,
+        "error": None,
+        "sha256": sha256,
+        "size_bytes": size,
+        "load_ms": round(load_ms, 2),
+        "rss_delta_bytes": rss_after - rss_before if rss_before and rss_after else None,
+        "model_type": type(model).__name__,
+        "classes": [str(c) for c in getattr(model, 'classes_', [])],
+        "n_features_in": int(getattr(model, 'n_features_in_', 0)) or None,
+    }))
+
+
+if __name__ == "__main__":
+    _validate_main(sys.argv[1])
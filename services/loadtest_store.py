@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, request
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+
+# Bind key for synthetic (Locust) transactions in SQLALCHEMY_BINDS
+LOADTEST_BIND_KEY = 'loadtest'
+
+LOADTEST_HEADER = 'X-Load-Test'
+SIM_PREFIX = 'pi_sim_'
+
+UTC8 = timezone(timedelta(hours=8))
+
+
+# =====================================================================
+# CONFIG: Where load-test traffic is stored
+# =====================================================================
+def build_loadtest_bind(primary_url, loadtest_url=None):
+    """
+    Returns the SQLALCHEMY_BINDS entry for load-test rows.
+
+    - LOADTEST_DATABASE_URL wins when set.
+    - SQLite file: a sibling file (bankedge_loadtest.db) so bankedge.db never grows.
+    - Anything else: the primary database (separate loadtest_transaction table).
+    """
+    if loadtest_url:
+        return loadtest_url
+
+    url = make_url(primary_url)
+    if url.get_backend_name() == 'sqlite' and url.database and url.database != ':memory:':
+        root, ext = os.path.splitext(url.database)
+        return url.set(database=f"{root}_loadtest{ext or '.db'}").render_as_string(hide_password=False)
+    return primary_url
+
+
+def is_load_test_request(pi_id=None):
+    """
+    Only simulated (pi_sim_) payment intents are ever load-test traffic: they
+    skip Stripe and the balance deduction, so purging them loses nothing. A
+    real intent goes to the production table whatever the headers say.
+
+    LOADTEST_ROUTING:
+      'auto'   (default) every pi_sim_ payment intent
+      'header' pi_sim_ payment intents on requests carrying the X-Load-Test header
+      'off'    everything goes to the production table
+    """
+    mode = current_app.config.get('LOADTEST_ROUTING', 'auto')
+    if mode == 'off' or not (pi_id and pi_id.startswith(SIM_PREFIX)):
+        return False
+
+    if mode == 'header':
+        return request.headers.get(LOADTEST_HEADER, '').lower() in ('1', 'true', 'yes')
+    return True
+
+
+def _set_incremental_vacuum(dbapi_connection, connection_record):
+    # auto_vacuum can only change on an empty file (the WAL pragma has already
+    # written the header, so VACUUM applies it - instant while empty).
+    cursor = dbapi_connection.cursor()
+    mode = cursor.execute("PRAGMA auto_vacuum").fetchone()[0]
+    empty = cursor.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0
+    if mode != 2 and empty:
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cursor.execute("VACUUM")
+    cursor.close()
+
+
+def init_loadtest_store(app, db):
+    with app.app_context():
+        engine = db.engines[LOADTEST_BIND_KEY]
+        if engine.dialect.name == 'sqlite' and engine is not db.engines[None]:
+            event.listen(engine, "connect", _set_incremental_vacuum)
+        db.create_all(bind_key=LOADTEST_BIND_KEY)
+
+
+# =====================================================================
+# RETENTION: Batched purge of expired synthetic rows + incremental vacuum
+# =====================================================================
+def _purge_batches(conn_factory, delete_sql, params, batch_size, pause):
+    deleted = 0
+    while True:
+        with conn_factory() as conn:
+            result = conn.execute(text(delete_sql), dict(params, batch=batch_size))
+            count = result.rowcount or 0
+        deleted += count
+        if count < batch_size:
+            return deleted
+        time.sleep(pause)
+
+
+def _incremental_vacuum(engine, pages):
+    if engine.dialect.name != 'sqlite':
+        return False
+    raw = engine.raw_connection()
+    try:
+        conn = raw.driver_connection
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if mode != 2:  # 2 = INCREMENTAL
+            return False
+        # executescript steps the pragma to completion; execute() frees one page
+        conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+    finally:
+        raw.close()
+    return True
+
+
+def purge_expired_synthetic(db, retention_hours=24, batch_size=1000, vacuum_pages=2000, pause=0.05):
+    """
+    Deletes synthetic rows older than `retention_hours` in small batches
+    (one short transaction each), from both the load-test table and any
+    legacy pi_sim_ rows still sitting in the production table.
+    Must be called inside an app context.
+    """
+    # Timestamps are stored as naive UTC+8 wall-clock values
+    cutoff = datetime.now(UTC8).replace(tzinfo=None) - timedelta(hours=retention_hours)
+    cutoff = cutoff.strftime('%Y-%m-%d %H:%M:%S.%f')
+    primary = db.engines[None]
+    loadtest = db.engines[LOADTEST_BIND_KEY]
+
+    stats = {"loadtest_deleted": 0, "legacy_deleted": 0, "vacuumed": []}
+
+    stats["loadtest_deleted"] = _purge_batches(
+        loadtest.begin,
+        'DELETE FROM loadtest_transaction WHERE id IN '
+        '(SELECT id FROM loadtest_transaction WHERE timestamp < :cutoff LIMIT :batch)',
+        {"cutoff": cutoff}, batch_size, pause
+    )
+
+    # pi_sim_ range scan on the primary key index ('`' sorts right after '_')
+    stats["legacy_deleted"] = _purge_batches(
+        primary.begin,
+        'DELETE FROM "transaction" WHERE id IN '
+        '(SELECT id FROM "transaction" WHERE id >= :lo AND id < :hi AND timestamp < :cutoff LIMIT :batch)',
+        {"lo": SIM_PREFIX, "hi": SIM_PREFIX[:-1] + '`', "cutoff": cutoff}, batch_size, pause
+    )
+
+    for name, engine in (("loadtest", loadtest), ("primary", primary)):
+        if name == "primary" and engine is loadtest:
+            continue
+        if _incremental_vacuum(engine, vacuum_pages):
+            stats["vacuumed"].append(name)
+
+    return stats
+
+
+def start_retention_worker(app, db):
+    """Background thread that runs purge_expired_synthetic every N seconds."""
+    interval = app.config.get('LOADTEST_RETENTION_INTERVAL', 300)
+    if not interval:
+        return None
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                with app.app_context():
+                    stats = purge_expired_synthetic(
+                        db,
+                        retention_hours=app.config.get('LOADTEST_RETENTION_HOURS', 24),
+                        batch_size=app.config.get('LOADTEST_RETENTION_BATCH', 1000)
+                    )
+                if stats["loadtest_deleted"] or stats["legacy_deleted"]:
+                    app.logger.info("Load-test retention: %s", stats)
+            except Exception:
+                app.logger.exception("Load-test retention failed")
+
+    worker = threading.Thread(target=loop, name="loadtest-retention", daemon=True)
+    worker.start()
+    return worker
@@ -0,0 +1,210 @@
+"""
+Compact offloading policy distilled from the RandomForest.
+
+The student is a lookup grid over amount x latency x txn_count_last_30d:
+three bisects and one list index, plain Python, no sklearn. Each cell
+stores the teacher's majority decision and how pure that cell was; the app
+only trusts cells at or above the artifact's min_confidence and falls back
+to the forest otherwise.
+
+numpy/pandas are only needed for distillation and batch scoring, so they
+are imported inside those functions; the app imports this module at startup.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_right
+
+POLICY_FEATURES = ['amount', 'latency', 'txn_count_last_30d']
+POLICY_FILENAME = 'offloading_policy.json'
+
+DEFAULT_BINS = {'amount': 4, 'latency': 32, 'txn_count_last_30d': 4}
+DEFAULT_MIN_CONFIDENCE = 0.95
+DEFAULT_MIN_SUPPORT = 20
+SYNTHETIC_ROWS_PER_CELL = 100
+
+
+class OffloadingPolicy:
+    """Runtime side: loads the JSON artifact and scores one transaction."""
+
+    def __init__(self, artifact):
+        self.artifact = artifact
+        self.classes = artifact['classes']
+        self.min_confidence = artifact['min_confidence']
+        self.decide = self._compile(artifact)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def _compile(self, artifact):
+        """Builds decide(amount, latency, txn_count) -> (decision, confidence) with everything bound locally."""
+        amount_edges, latency_edges, count_edges = (artifact['edges'][f] for f in POLICY_FEATURES)
+        n_latency, n_count = len(latency_edges) + 1, len(count_edges) + 1
+        cells = [(self.classes[label], conf) for label, conf in zip(artifact['labels'], artifact['confidence'])]
+
+        def decide(amount, latency, txn_count, _b=bisect_right, _a=amount_edges, _l=latency_edges,
+                   _c=count_edges, _nl=n_latency, _nc=n_count, _cells=cells):
+            return _cells[(_b(_a, amount) * _nl + _b(_l, latency)) * _nc + _b(_c, txn_count)]
+
+        return decide
+
+    def confident(self, confidence):
+        return confidence >= self.min_confidence
+
+    def decide_batch(self, X):
+        """Vectorised decide() over a DataFrame; returns (decisions, confidences) arrays."""
+        import numpy as np
+
+        cells = _cell_index(X, self.artifact['edges'])
+        labels = np.asarray(self.classes)[np.asarray(self.artifact['labels'])[cells]]
+        return labels, np.asarray(self.artifact['confidence'])[cells]
+
+
+# =====================================================================
+# APP-SIDE CACHE (reloaded when the artifact file changes)
+# =====================================================================
+_cache_lock = threading.Lock()
+_cached = {"path": None, "mtime": None, "policy": None}
+_stats_lock = threading.Lock()
+_stats = {"fast_path": 0, "fallback": 0}
+
+
+def get_policy(path):
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if _cached["path"] != path or _cached["mtime"] != mtime:
+        with _cache_lock:
+            if _cached["path"] != path or _cached["mtime"] != mtime:
+                try:
+                    policy = OffloadingPolicy.load(path)
+                except (OSError, ValueError, KeyError) as e:
+                    print("Offloading policy could not be loaded:", e)
+                    policy = None
+                _cached.update(path=path, mtime=mtime, policy=policy)
+    return _cached["policy"]
+
+
+def record_decision(fast_path):
+    with _stats_lock:
+        _stats["fast_path" if fast_path else "fallback"] += 1
+
+
+def policy_stats():
+    with _stats_lock:
+        total = _stats["fast_path"] + _stats["fallback"]
+        return {**_stats, "fast_path_ratio": round(_stats["fast_path"] / total, 4) if total else 0.0}
+
+
+# =====================================================================
+# DISTILLATION (training side)
+# =====================================================================
+def _quantile_edges(values, n_bins):
+    import numpy as np
+
+    edges = np.unique(np.quantile(values, np.linspace(0, 1, n_bins + 1)[1:-1]))
+    return [float(e) for e in edges]
+
+
+def _cell_index(X, edges):
+    import numpy as np
+
+    idx = np.zeros(len(X), dtype=np.int64)
+    for f in POLICY_FEATURES:
+        e = np.asarray(edges[f])
+        idx = idx * (len(e) + 1) + np.searchsorted(e, X[f].to_numpy(dtype=np.float64), side='right')
+    return idx
+
+
+def distill(teacher, X_transfer, bins=None, min_confidence=DEFAULT_MIN_CONFIDENCE,
+            min_support=DEFAULT_MIN_SUPPORT, synthetic_rows=None, random_state=42):
+    """
+    Fits the grid to the teacher's decisions on a transfer set: the training
+    rows plus synthetic rows made by permuting each feature independently,
+    so cells between observed combinations still get teacher labels.
+    """
+    import numpy as np
+    import pandas as pd
+
+    bins = {**DEFAULT_BINS, **(bins or {})}
+    rng = np.random.default_rng(random_state)
+
+    X = X_transfer.reset_index(drop=True)
+    n_cells = int(np.prod([bins[f] for f in POLICY_FEATURES]))
+    n_synthetic = synthetic_rows if synthetic_rows is not None else max(len(X), n_cells * SYNTHETIC_ROWS_PER_CELL)
+    if n_synthetic:
+        synthetic = X.iloc[rng.integers(0, len(X), n_synthetic)].reset_index(drop=True)
+        for f in POLICY_FEATURES:
+            synthetic[f] = rng.permutation(synthetic[f].to_numpy())
+        X = pd.concat([X, synthetic], ignore_index=True)
+
+    teacher_labels = np.asarray(teacher.predict(X)).astype(str)
+    classes = sorted(set(teacher_labels))
+    label_idx = np.searchsorted(classes, teacher_labels)
+
+    edges = {f: _quantile_edges(X[f].to_numpy(dtype=np.float64), bins[f]) for f in POLICY_FEATURES}
+    n_cells = int(np.prod([len(edges[f]) + 1 for f in POLICY_FEATURES]))
+    cells = _cell_index(X, edges)
+
+    counts = np.zeros((n_cells, len(classes)), dtype=np.int64)
+    np.add.at(counts, (cells, label_idx), 1)
+    support = counts.sum(axis=1)
+
+    # Empty cells inherit the overall majority with zero confidence (always fall back)
+    labels = np.where(support > 0, counts.argmax(axis=1), np.bincount(label_idx).argmax())
+    confidence = np.where(support >= min_support, counts.max(axis=1) / np.maximum(support, 1), 0.0)
+
+    return {
+        "version": 1,
+        "features": POLICY_FEATURES,
+        "classes": classes,
+        "edges": edges,
+        "labels": labels.tolist(),
+        "confidence": [round(float(c), 4) for c in confidence],
+        "min_confidence": min_confidence,
+        "min_support": min_support,
+        "transfer_rows": int(len(X)),
+    }
+
+
+def fidelity_report(policy, teacher, X_eval, y_eval=None):
+    """Agreement of the student (and of the student-with-fallback system) with the teacher."""
+    import numpy as np
+
+    teacher_labels = np.asarray(teacher.predict(X_eval)).astype(str)
+    decided = [policy.decide(a, l, c) for a, l, c in
+               zip(*(X_eval[f].to_numpy(dtype=np.float64).tolist() for f in POLICY_FEATURES))]
+    student = np.array([d for d, _ in decided])
+    confident = np.array([policy.confident(c) for _, c in decided])
+    combined = np.where(confident, student, teacher_labels)
+
+    report = {
+        "rows": int(len(X_eval)),
+        "agreement_all": round(float((student == teacher_labels).mean()), 4),
+        "coverage": round(float(confident.mean()), 4),
+        "agreement_confident": round(float((student[confident] == teacher_labels[confident]).mean()), 4)
+        if confident.any() else None,
+        "agreement_with_fallback": round(float((combined == teacher_labels).mean()), 4),
+    }
+    if y_eval is not None:
+        y = np.asarray(y_eval).astype(str)
+        report["teacher_accuracy"] = round(float((teacher_labels == y).mean()), 4)
+        report["student_accuracy"] = round(float((student == y).mean()), 4)
+        report["fast_path_accuracy"] = round(float((combined == y).mean()), 4)
+
+    # Scoring cost of the student alone, pure Python
+    args = list(zip(*(X_eval[f].to_numpy(dtype=np.float64).tolist() for f in POLICY_FEATURES)))[:10000]
+    start = time.perf_counter()
+    for a, l, c in args:
+        policy.decide(a, l, c)
+    report["score_ns"] = round((time.perf_counter() - start) * 1e9 / max(len(args), 1), 1)
+    return report
+
+
+def save_policy(artifact, path):
+    with open(path, 'w') as f:
+        json.dump(artifact, f, separators=(',', ':'))
@@ -0,0 +1,268 @@
+"""
+Out-of-core training support for the offloading model.
+
+Rows are streamed in time order (an external merge sort is used for CSVs
+that are not already sorted), the 30-day trailing count is carried across
+chunk boundaries, and the model is updated chunk by chunk with
+partial_fit. Memory is bounded by the chunk size plus one 30-day window of
+(customer, timestamp) pairs.
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+from sklearn.compose import ColumnTransformer
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import confusion_matrix
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import KBinsDiscretizer, OneHotEncoder
+
+from services.offloading_features import (
+    CATEGORICAL_FEATURES, CSV_DTYPES, FEATURES, NUMERICAL_FEATURES, TARGET, WINDOW,
+    load_transactions, trailing_counts, window_starts
+)
+
+CLASSES = ['cloud', 'edge', 'flagged']
+TXN_TYPES = ['Transfer']
+STREAM_COLUMNS = ['id', 'amount', 'latency', 'type', 'customer_id', 'processing_decision', 'timestamp']
+
+DB_QUERY = (
+    'SELECT id, amount, latency, type, customer_id, processing_decision, timestamp '
+    'FROM "transaction" ORDER BY timestamp'
+)
+
+
+# =====================================================================
+# SOURCES
+# =====================================================================
+def iter_csv_chunks(path, chunksize):
+    return load_transactions(path, usecols=STREAM_COLUMNS, chunksize=chunksize)
+
+
+def iter_db_chunks(db_url, chunksize):
+    """Streams the transaction table in timestamp order (server-side cursor where supported)."""
+    engine = sa.create_engine(db_url)
+    dtypes = {k: v for k, v in CSV_DTYPES.items() if k in STREAM_COLUMNS}
+    try:
+        with engine.connect().execution_options(stream_results=True) as conn:
+            for chunk in pd.read_sql_query(DB_QUERY, conn, chunksize=chunksize, parse_dates=['timestamp']):
+                yield chunk.astype(dtypes)
+    finally:
+        engine.dispose()
+
+
+def time_ordered_chunks(chunks, chunksize, tmp_dir=None):
+    """
+    External merge sort by timestamp: each input chunk is sorted and spilled
+    to disk as a run, then the runs are merged block by block. Only one
+    block per run is held in memory during the merge.
+    """
+    work_dir = tempfile.mkdtemp(prefix='offload_sort_', dir=tmp_dir)
+    try:
+        runs = []
+        for i, chunk in enumerate(chunks):
+            path = os.path.join(work_dir, f'run_{i:05d}.csv')
+            chunk.sort_values('timestamp', kind='stable').to_csv(path, index=False)
+            runs.append(path)
+
+        block = max(chunksize // max(len(runs), 1), 1000)
+        readers = [iter_csv_chunks(path, block) for path in runs]
+        buffers = {}
+        for i, reader in enumerate(readers):
+            buf = next(reader, None)
+            if buf is not None and len(buf):
+                buffers[i] = buf
+
+        pending, pending_rows = [], 0
+        while buffers:
+            # Everything still on disk is >= the smallest per-run buffer maximum
+            frontier = min(buf['timestamp'].iloc[-1] for buf in buffers.values())
+            for i in list(buffers):
+                buf = buffers[i]
+                cut = int(np.searchsorted(buf['timestamp'].to_numpy(), np.datetime64(frontier), side='right'))
+                if cut:
+                    pending.append(buf.iloc[:cut])
+                    pending_rows += cut
+                if cut == len(buf):
+                    nxt = next(readers[i], None)
+                    if nxt is None or not len(nxt):
+                        del buffers[i]
+                    else:
+                        buffers[i] = nxt
+                else:
+                    buffers[i] = buf.iloc[cut:]
+
+            if pending_rows >= chunksize or (not buffers and pending_rows):
+                yield _concat_sorted(pending)
+                pending, pending_rows = [], 0
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _concat_sorted(frames):
+    # Categories differ per run; union them so the merged frame stays compact
+    df = pd.concat([f.astype({c: object for c in f.columns if isinstance(f[c].dtype, pd.CategoricalDtype)})
+                    for f in frames], ignore_index=True)
+    dtypes = {k: v for k, v in CSV_DTYPES.items() if k in df.columns}
+    return df.sort_values('timestamp', kind='stable', ignore_index=True).astype(dtypes)
+
+
+# =====================================================================
+# ROLLING FEATURES ACROSS CHUNK BOUNDARIES
+# =====================================================================
+class RollingWindowCounter:
+    """
+    Computes txn_count_last_30d for a time-ordered stream of chunks. Keeps
+    the (customer, timestamp) pairs of the last window so rows near a chunk
+    boundary still see their predecessors in the previous chunk. Uses the
+    customer_features day buckets unless exact=True.
+    """
+
+    def __init__(self, window=WINDOW, exact=False):
+        self.window = window
+        self.window_ns = np.int64(np.timedelta64(window, 'ns').astype(np.int64))
+        self.exact = exact
+        self._customers = np.empty(0, dtype=object)
+        self._ts = np.empty(0, dtype=np.int64)
+        self._max_ts = None
+
+    @property
+    def carried_rows(self):
+        return len(self._ts)
+
+    def add_counts(self, chunk):
+        ts = chunk['timestamp'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        if not len(ts):
+            chunk['txn_count_last_30d'] = np.zeros(0, dtype=np.float32)
+            return chunk
+        if self._max_ts is not None and ts.min() < self._max_ts:
+            raise ValueError("input is not ordered by timestamp; stream it through time_ordered_chunks()")
+
+        customers = np.concatenate([self._customers, chunk['customer_id'].astype(object).to_numpy()])
+        all_ts = np.concatenate([self._ts, ts])
+        codes, _ = pd.factorize(customers, use_na_sentinel=False)
+        starts = None if self.exact else window_starts(all_ts.astype('datetime64[ns]'))
+        counts = trailing_counts(codes, all_ts.astype('datetime64[ns]'), self.window, starts=starts)
+        chunk['txn_count_last_30d'] = counts[len(self._ts):].astype(np.float32)
+
+        # Later rows are >= max_ts, so nothing before its window start is needed again
+        self._max_ts = int(all_ts.max())
+        if self.exact:
+            horizon = self._max_ts - self.window_ns
+        else:
+            horizon = int(window_starts(np.array([self._max_ts], dtype='datetime64[ns]'))[0])
+        keep = all_ts >= horizon
+        self._customers, self._ts = customers[keep], all_ts[keep]
+        return chunk
+
+
+# =====================================================================
+# HELD-OUT PARTITION + STREAMING METRICS
+# =====================================================================
+def holdout_mask(ids, fraction):
+    """Stable hash split on transaction id, so a row lands in the same partition on every run."""
+    buckets = pd.util.hash_pandas_object(pd.Series(ids, dtype=object), index=False).to_numpy() % 10000
+    return buckets < int(fraction * 10000)
+
+
+class StreamingMetrics:
+    """Confusion matrix accumulated over the held-out rows of every chunk."""
+
+    def __init__(self, classes=CLASSES):
+        self.classes = list(classes)
+        self.matrix = np.zeros((len(self.classes), len(self.classes)), dtype=np.int64)
+
+    def update(self, y_true, y_pred):
+        self.matrix += confusion_matrix(y_true, y_pred, labels=self.classes)
+
+    @property
+    def rows(self):
+        return int(self.matrix.sum())
+
+    @property
+    def accuracy(self):
+        return float(np.trace(self.matrix)) / self.rows if self.rows else 0.0
+
+    def report(self):
+        lines = [f"{'':<10}{'precision':>10}{'recall':>10}{'support':>10}"]
+        for i, label in enumerate(self.classes):
+            predicted, support = self.matrix[:, i].sum(), self.matrix[i, :].sum()
+            precision = self.matrix[i, i] / predicted if predicted else 0.0
+            recall = self.matrix[i, i] / support if support else 0.0
+            lines.append(f"{label:<10}{precision:>10.3f}{recall:>10.3f}{support:>10}")
+        lines.append(f"{'accuracy':<10}{self.accuracy:>20.3f}{self.rows:>10}")
+        return "\n".join(lines)
+
+
+# =====================================================================
+# INCREMENTAL MODEL
+# =====================================================================
+def build_streaming_model(n_bins=32):
+    """
+    Histogram-binned features + SGD logistic regression. Bin edges are fixed
+    from the first chunk with training rows; the linear model is then updated with partial_fit.
+    Accepts the same input frame as the RandomForest pipeline.
+    """
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ('num', KBinsDiscretizer(n_bins=n_bins, encode='onehot', strategy='quantile'), NUMERICAL_FEATURES),
+            ('cat', OneHotEncoder(categories=[TXN_TYPES], handle_unknown='ignore'), CATEGORICAL_FEATURES)
+        ])
+    return Pipeline(steps=[
+        ('preprocessor', preprocessor),
+        ('classifier', SGDClassifier(loss='log_loss', alpha=1e-5, random_state=42))
+    ])
+
+
+def train_streaming(chunks, holdout=0.2, n_bins=32, log=print):
+    """
+    Trains on a time-ordered chunk stream. Rows in the held-out partition
+    are never passed to partial_fit; they are scored as each chunk goes by.
+    Returns (model, metrics).
+    """
+    model = build_streaming_model(n_bins)
+    preprocessor = model.named_steps['preprocessor']
+    classifier = model.named_steps['classifier']
+    counter = RollingWindowCounter()
+    metrics = StreamingMetrics()
+    fitted = False
+    trained_rows = 0
+
+    for n, chunk in enumerate(chunks, start=1):
+        chunk = counter.add_counts(chunk)
+        chunk = chunk[chunk[TARGET].isin(CLASSES)]
+        if not len(chunk):
+            continue
+
+        X = chunk[FEATURES]
+        y = chunk[TARGET].astype(str).to_numpy()
+        test = holdout_mask(chunk['id'].to_numpy(), holdout)
+        train = ~test
+
+        if train.any():
+            if not fitted:
+                preprocessor.fit(X[train])
+            classifier.partial_fit(preprocessor.transform(X[train]), y[train], classes=CLASSES)
+            trained_rows += int(train.sum())
+            fitted = True
+
+        if fitted and test.any():
+            metrics.update(y[test], model.predict(X[test]))
+
+        log(f"   chunk {n}: trained={trained_rows} held_out={metrics.rows} "
+            f"running_accuracy={metrics.accuracy:.4f} window_carry={counter.carried_rows}")
+
+    if not fitted:
+        raise ValueError("no training rows in input")
+    return model, metrics
+
+
+def chunk_stream(source, chunksize, presorted=False):
+    """CSV path or SQLAlchemy URL -> time-ordered chunk iterator."""
+    if '://' in source:
+        return iter_db_chunks(source, chunksize)
+    chunks = iter_csv_chunks(source, chunksize)
+    return chunks if presorted else time_ordered_chunks(chunks, chunksize)
@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+import bcrypt as _bcrypt
+from flask import current_app
+
+from services.worker_pool import WorkerPool
+
+DEFAULT_ROUNDS = 12
+DEFAULT_MAX_PENDING = 16  # gunicorn.conf.py's default WEB_THREADS
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing pool is saturated; callers answer 503."""
+
+
+# =====================================================================
+# WORKER FUNCTIONS (run in the pool processes)
+# =====================================================================
+def _hash_in_worker(password, rounds):
+    start = time.perf_counter()
+    hashed = _bcrypt.hashpw(password.encode('utf-8'), _bcrypt.gensalt(rounds)).decode('utf-8')
+    return hashed, (time.perf_counter() - start) * 1000.0
+
+
+def _verify_in_worker(pw_hash, password):
+    start = time.perf_counter()
+    ok = _bcrypt.checkpw(password.encode('utf-8'), pw_hash.encode('utf-8'))
+    return ok, (time.perf_counter() - start) * 1000.0
+
+
+# =====================================================================
+# POOL
+# =====================================================================
+_slots = None
+
+_metrics_lock = threading.Lock()
+_metrics = {}
+
+
+def _new_pool():
+    global _slots
+    workers = current_app.config.get('BCRYPT_POOL_WORKERS') or min(2, os.cpu_count() or 1)
+    _slots = threading.BoundedSemaphore(current_app.config.get('BCRYPT_POOL_MAX_PENDING') or DEFAULT_MAX_PENDING)
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+_pool = WorkerPool(_new_pool)
+
+
+def start_pool():
+    """Forks the hashing workers up front (server worker startup) instead of inside the first login."""
+    _pool.start()
+
+
+def shutdown_pool(wait=True):
+    _pool.shutdown(wait=wait)
+
+
+def _op_metrics(op):
+    return _metrics.setdefault(op, {"count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                    "work_ms": 0.0, "queue_ms": 0.0, "rejected": 0})
+
+
+def _record(op, wall_ms, work_ms):
+    with _metrics_lock:
+        m = _op_metrics(op)
+        m["count"] += 1
+        m["total_ms"] += wall_ms
+        m["work_ms"] += work_ms
+        m["queue_ms"] += max(wall_ms - work_ms, 0.0)
+        m["max_ms"] = max(m["max_ms"], wall_ms)
+
+
+def _record_rejected(op):
+    with _metrics_lock:
+        _op_metrics(op)["rejected"] += 1
+
+
+def _run(op, fn, *args):
+    pool = _pool.get()
+    slots = _slots
+    timeout = current_app.config.get('BCRYPT_TIMEOUT', 10)
+    start = time.perf_counter()
+    # Bounded backlog: beyond it a login waits for a slot, and only gets a 503
+    # once BCRYPT_TIMEOUT (slot wait + hashing) runs out
+    if not slots.acquire(timeout=timeout):
+        _record_rejected(op)
+        raise PasswordHasherBusy(f"password {op} pool is saturated")
+
+    try:
+        future = pool.submit(fn, *args)
+    except Exception:
+        slots.release()
+        raise
+    # The slot is held until the job itself finishes, not until this caller stops
+    # waiting: a job that outlives BCRYPT_TIMEOUT still occupies a worker
+    future.add_done_callback(lambda _: slots.release())
+
+    try:
+        result, work_ms = future.result(timeout=max(timeout - (time.perf_counter() - start), 0))
+    except FutureTimeout:
+        _record_rejected(op)
+        raise PasswordHasherBusy(f"password {op} timed out")
+
+    _record(op, (time.perf_counter() - start) * 1000.0, work_ms)
+    return result
+
+
+# =====================================================================
+# PUBLIC API
+# =====================================================================
+def configured_rounds():
+    return current_app.config.get('BCRYPT_LOG_ROUNDS', DEFAULT_ROUNDS)
+
+
+def hash_password(password, op='hash'):
+    return _run(op, _hash_in_worker, password, configured_rounds())
+
+
+def verify_password(pw_hash, password):
+    if not pw_hash or password is None:
+        return False
+    return _run('verify', _verify_in_worker, pw_hash, password)
+
+
+def hash_rounds(pw_hash):
+    """Work factor encoded in a bcrypt hash ($2b$<rounds>$...)."""
+    try:
+        return int(pw_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def needs_rehash(pw_hash):
+    return hash_rounds(pw_hash) != configured_rounds()
+
+
+def hashing_metrics():
+    with _metrics_lock:
+        out = {}
+        for op, m in _metrics.items():
+            count = m["count"] or 1
+            out[op] = {
+                "count": m["count"],
+                "rejected": m["rejected"],
+                "avg_ms": round(m["total_ms"] / count, 3),
+                "avg_work_ms": round(m["work_ms"] / count, 3),
+                "avg_queue_ms": round(m["queue_ms"] / count, 3),
+                "max_ms": round(m["max_ms"], 3),
+            }
+        return {"rounds": configured_rounds(), "operations": out}
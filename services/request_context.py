@@ -0,0 +1,81 @@
+import copy
+
+from flask import g
+from flask_jwt_extended import get_jwt, get_jwt_identity
+
+from models import User
+
+# canonical mapping region -> edge device (same as frontend)
+LOCATION_DEVICE_MAP = {
+    "JOHOR": "edge-1", "KEDAH": "edge-2", "KELANTAN": "edge-3",
+    "MALACCA": "edge-4", "NEGERISEMBILAN": "edge-5", "PAHANG": "edge-6",
+    "PENANG": "edge-7", "PERAK": "edge-8", "PERLIS": "edge-9",
+    "SABAH": "edge-10", "SARAWAK": "edge-11", "SELANGOR": "edge-12",
+    "TERENGGANU": "edge-13", "KL": "edge-14", "LABUAN": "edge-15",
+    "PUTRAJAYA": "edge-16"
+}
+
+
+def get_device_for_user(username):
+    """
+    Convert admin.<region>@bankedge.com to the correct device_id.
+    Always reliable.
+    """
+    if not username or "@bankedge.com" not in username:
+        return None
+
+    prefix = username.split("@")[0]  # admin.kl
+    if "." not in prefix:
+        return None
+
+    region_code = prefix.split(".")[1].strip().upper()
+    return LOCATION_DEVICE_MAP.get(region_code, None)
+
+
+# =====================================================================
+# REQUEST-SCOPED IDENTITY
+# =====================================================================
+_UNSET = object()
+
+
+class RequestIdentity:
+    """JWT identity, role, device scope and User row, resolved once per request."""
+
+    def __init__(self):
+        self.claims = get_jwt() or {}
+        self.username = get_jwt_identity()
+        self.role = self.claims.get("role")
+        self.user_location = (self.claims.get("userLocation") or "").upper()
+        # Read scope (listings, dashboard, device actions) comes from the userLocation claim only
+        self.device_id = LOCATION_DEVICE_MAP.get(self.user_location)
+        # Payments are attributed to the device in the username (admin.<region>@...)
+        self.payment_device_id = get_device_for_user(self.username)
+        self._user = _UNSET
+
+    def copy(self):
+        """Same claims and scope for another thread; its User row is loaded again in that thread's session."""
+        twin = copy.copy(self)
+        twin._user = _UNSET
+        return twin
+
+    @property
+    def is_superadmin(self):
+        return self.role == 'superadmin'
+
+    @property
+    def user(self):
+        if self._user is _UNSET:
+            self._user = self._load_user()
+        return self._user
+
+    def _load_user(self):
+        if not self.username:
+            return None
+        return User.query.filter_by(username=self.username).first()
+
+
+def current_identity():
+    identity = g.get('_identity')
+    if identity is None:
+        identity = g._identity = RequestIdentity()
+    return identity
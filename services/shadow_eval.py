@@ -0,0 +1,266 @@
+"""
+Shadow evaluation of a candidate offloading model.
+
+The candidate scores the same feature vector as the live decision, in a
+background process pool, and only after the response has been sent
+(response.call_on_close). Nothing here runs on the payment_success path
+except appending a callback. Disagreements go to a size-capped log file
+(shared by all workers); agreement and latency aggregates are kept per
+worker process and served, labelled with the pid, by /api/ml-diagnosis.
+"""
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from flask import after_this_request, current_app
+
+from services.worker_pool import WorkerPool
+
+CANDIDATE_FILENAME = 'shadow_candidate.json'
+LATENCY_SAMPLES = 1000
+
+
+# =====================================================================
+# WORKER SIDE (runs in the pool processes)
+# =====================================================================
+_worker_models = {}
+
+
+def _load_candidate(path):
+    mtime = os.path.getmtime(path)
+    cached = _worker_models.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    if path.endswith('.json'):
+        from services.offloading_policy import OffloadingPolicy
+        model = OffloadingPolicy.load(path)
+    else:
+        import joblib
+        model = joblib.load(path)
+    _worker_models[path] = (mtime, model)
+    return model
+
+
+def _score_candidate(path, features):
+    model = _load_candidate(path)
+    start = time.perf_counter()
+    if hasattr(model, 'decide'):
+        decision = model.decide(features['amount'], features['latency'], features['txn_count_last_30d'])[0]
+    else:
+        import pandas as pd
+        decision = str(model.predict(pd.DataFrame([features]))[0])
+    return decision, (time.perf_counter() - start) * 1000.0
+
+
+# =====================================================================
+# CANDIDATE REGISTRATION (file next to the models, shared by all workers)
+# =====================================================================
+def _models_dir():
+    return os.path.join(current_app.root_path, 'ml_models')
+
+
+def resolve_model_path(name):
+    """Candidates must live in ml_models/; returns None for anything else."""
+    if not name:
+        return None
+    path = os.path.realpath(os.path.join(_models_dir(), os.path.basename(name)))
+    if not path.startswith(os.path.realpath(_models_dir()) + os.sep) or not os.path.isfile(path):
+        return None
+    if not path.endswith(('.pkl', '.json')):
+        return None
+    return path
+
+
+_registration = {"mtime": None, "name": None}
+
+
+def register_candidate(name):
+    """Registers (or clears, with name=None) the shadow candidate. Returns the resolved path."""
+    marker = os.path.join(_models_dir(), CANDIDATE_FILENAME)
+    if not name:
+        if os.path.exists(marker):
+            os.remove(marker)
+        return None
+
+    path = resolve_model_path(name)
+    if path is None:
+        raise ValueError(f"candidate model '{name}' not found in ml_models/")
+    with open(marker, 'w') as f:
+        json.dump({"model": os.path.basename(path),
+                   "registered_at": datetime.now(timezone(timedelta(hours=8))).isoformat()}, f)
+    return path
+
+
+def candidate_path():
+    marker = os.path.join(_models_dir(), CANDIDATE_FILENAME)
+    try:
+        mtime = os.path.getmtime(marker)
+    except OSError:
+        return resolve_model_path(current_app.config.get('OFFLOADING_SHADOW_MODEL'))
+
+    if _registration["mtime"] != mtime:
+        try:
+            with open(marker) as f:
+                name = json.load(f).get("model")
+        except (OSError, ValueError):
+            name = None
+        _registration.update(mtime=mtime, name=name)
+    return resolve_model_path(_registration["name"])
+
+
+# =====================================================================
+# POOL + SUBMISSION
+# =====================================================================
+_slots = None
+
+
+def _new_pool():
+    global _slots
+    _slots = threading.BoundedSemaphore(current_app.config.get('SHADOW_MAX_PENDING', 64))
+    return ProcessPoolExecutor(max_workers=current_app.config.get('SHADOW_WORKERS', 1))
+
+
+_pool = WorkerPool(_new_pool)
+
+
+def start_pool():
+    _pool.start()
+
+
+def shutdown_pool(wait=True):
+    """Pending candidate scores are dropped, even with wait=True."""
+    _pool.shutdown(wait=wait, cancel_futures=True)
+
+
+def schedule_shadow(pi_id, features, live_decision, live_ms, live_model):
+    """
+    Queues candidate scoring for after the response is sent. No-op when no
+    candidate is registered. Must be called inside a request.
+    """
+    path = candidate_path()
+    if path is None:
+        return False
+
+    app = current_app._get_current_object()
+    log_path = app.config.get('SHADOW_LOG_PATH') or os.path.join(app.root_path, 'ml_proof', 'shadow_eval.log')
+    max_bytes = app.config.get('SHADOW_LOG_MAX_BYTES', 1_000_000)
+    candidate = os.path.basename(path)
+    _record_live(live_model, live_ms)
+
+    @after_this_request
+    def _defer(response):
+        def submit():
+            with app.app_context():
+                pool = _pool.get()
+            if not _slots.acquire(blocking=False):
+                _record_dropped()
+                return
+            future = pool.submit(_score_candidate, path, features)
+
+            def done(fut):
+                _slots.release()
+                try:
+                    decision, cand_ms = fut.result()
+                except Exception as e:
+                    _record_error(candidate, e)
+                    return
+                _record_result(pi_id, features, live_decision, live_model, live_ms,
+                               candidate, decision, cand_ms, log_path, max_bytes)
+
+            future.add_done_callback(done)
+
+        response.call_on_close(submit)
+        return response
+
+    return True
+
+
+# =====================================================================
+# AGGREGATES + COMPACT DISAGREEMENT LOG
+# =====================================================================
+_stats_lock = threading.Lock()
+_stats = {"scored": 0, "agreed": 0, "dropped": 0, "errors": 0, "last_error": None}
+_pairs = Counter()
+_candidates = Counter()
+_latency = {}
+
+
+def _latency_samples(model):
+    return _latency.setdefault(model, deque(maxlen=LATENCY_SAMPLES))
+
+
+def _record_live(live_model, live_ms):
+    with _stats_lock:
+        _latency_samples(live_model).append(live_ms)
+
+
+def _record_dropped():
+    with _stats_lock:
+        _stats["dropped"] += 1
+
+
+def _record_error(candidate, error):
+    with _stats_lock:
+        _stats["errors"] += 1
+        _stats["last_error"] = f"{candidate}: {error}"
+
+
+def _record_result(pi_id, features, live_decision, live_model, live_ms,
+                   candidate, decision, cand_ms, log_path, max_bytes):
+    agreed = decision == live_decision
+    with _stats_lock:
+        _stats["scored"] += 1
+        _stats["agreed"] += int(agreed)
+        _candidates[candidate] += 1
+        _pairs[(live_decision, decision)] += 1
+        _latency_samples(f"candidate:{candidate}").append(cand_ms)
+
+        if agreed:
+            return
+        # One CSV line per disagreement; rotated to .1 when it reaches max_bytes
+        try:
+            if os.path.exists(log_path) and os.path.getsize(log_path) >= max_bytes:
+                os.replace(log_path, log_path + '.1')
+            with open(log_path, 'a') as f:
+                f.write(f"{datetime.now(timezone(timedelta(hours=8))):%Y-%m-%dT%H:%M:%S},{pi_id},"
+                        f"{features['amount']:.2f},{features['latency']:.1f},{features['txn_count_last_30d']},"
+                        f"{live_model}:{live_decision}:{live_ms:.3f},{candidate}:{decision}:{cand_ms:.3f}\n")
+        except OSError:
+            pass
+
+
+def _summarise(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "avg_ms": round(sum(ordered) / len(ordered), 4),
+        "p50_ms": round(ordered[len(ordered) // 2], 4),
+        "p95_ms": round(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)], 4),
+    }
+
+
+def shadow_stats():
+    """Counts for the shadow jobs scheduled by this worker process only (pid), not the whole service."""
+    path = candidate_path()
+    with _stats_lock:
+        scored = _stats["scored"]
+        return {
+            "candidate": os.path.basename(path) if path else None,
+            "scope": "worker",
+            "pid": os.getpid(),
+            "scored": scored,
+            "agreed": _stats["agreed"],
+            "agreement_rate": round(_stats["agreed"] / scored, 4) if scored else None,
+            "dropped": _stats["dropped"],
+            "errors": _stats["errors"],
+            "last_error": _stats["last_error"],
+            "by_candidate": dict(_candidates),
+            "decision_pairs": {f"{live}->{cand}": n for (live, cand), n in _pairs.items()},
+            "latency": {model: _summarise(samples) for model, samples in _latency.items()},
+        }
@@ -0,0 +1,176 @@
+import threading
+from time import perf_counter
+
+from flask import g, has_request_context, request
+
+# Values below 2 x SUB_BUCKETS microseconds get exact buckets; above that each
+# power of two is split into SUB_BUCKETS buckets (~1.5% relative error).
+SUB_BUCKETS = 64
+
+
+# =====================================================================
+# HDR-STYLE HISTOGRAM (log-linear buckets, microseconds)
+# =====================================================================
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    @staticmethod
+    def bucket(value_us):
+        v = max(int(value_us), 0)
+        shift = v.bit_length() - (SUB_BUCKETS * 2).bit_length() + 1
+        if shift <= 0:
+            return v
+        return (v >> shift) << shift
+
+    def record(self, value_us):
+        b = self.bucket(value_us)
+        self.counts[b] = self.counts.get(b, 0) + 1
+        self.count += 1
+        self.total_us += value_us
+        if value_us > self.max_us:
+            self.max_us = value_us
+
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q / 100.0 * self.count
+        seen = 0
+        for b in sorted(self.counts):
+            seen += self.counts[b]
+            if seen >= rank:
+                return b
+        return self.max_us
+
+    def summary(self):
+        ms = lambda us: round(us / 1000.0, 3)
+        return {
+            "count": self.count,
+            "mean_ms": ms(self.total_us / self.count) if self.count else 0.0,
+            "p50_ms": ms(self.percentile(50)),
+            "p90_ms": ms(self.percentile(90)),
+            "p99_ms": ms(self.percentile(99)),
+            "p999_ms": ms(self.percentile(99.9)),
+            "max_ms": ms(self.max_us),
+        }
+
+
+_lock = threading.Lock()
+_histograms = {}  # endpoint -> stage -> LatencyHistogram
+
+
+def _record(endpoint, stage, elapsed_s):
+    with _lock:
+        hist = _histograms.setdefault(endpoint, {}).get(stage)
+        if hist is None:
+            hist = _histograms[endpoint][stage] = LatencyHistogram()
+        hist.record(elapsed_s * 1_000_000.0)
+
+
+# =====================================================================
+# REQUEST SPANS
+# =====================================================================
+class RequestSpans:
+    """
+    Per-request stage timer. lap(name) closes the stage that started at the
+    previous lap (or at the start of the request); span(name) times a block.
+    """
+
+    def __init__(self, start):
+        self.start = start
+        self.last = start
+        self.stages = []
+
+    def lap(self, name):
+        now = perf_counter()
+        self.stages.append((name, now - self.last))
+        self.last = now
+
+    def span(self, name):
+        return _Span(self, name)
+
+
+class _Span:
+    def __init__(self, spans, name):
+        self.spans = spans
+        self.name = name
+
+    def __enter__(self):
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        now = perf_counter()
+        self.spans.stages.append((self.name, now - self.started))
+        self.spans.last = now
+        return False
+
+
+class ConcurrentSpans(RequestSpans):
+    """
+    For requests whose stages overlap (the asyncio payment pipeline): there is
+    no single previous stage, so lap() is ignored and only span() blocks count.
+    """
+
+    def lap(self, name):
+        pass
+
+
+def concurrent_spans():
+    """Switches the current request to ConcurrentSpans (call after before_request hooks)."""
+    spans = g._spans = ConcurrentSpans(g.get('_request_started') or perf_counter())
+    return spans
+
+
+def request_spans():
+    spans = g.get('_spans')
+    if spans is None:
+        spans = g._spans = RequestSpans(g.get('_request_started') or perf_counter())
+    return spans
+
+
+def lap(name):
+    """Convenience wrapper: no-op outside a request."""
+    if has_request_context():
+        request_spans().lap(name)
+
+
+# =====================================================================
+# APP HOOKS + SNAPSHOT
+# =====================================================================
+def init_stage_timing(app):
+    @app.before_request
+    def _start_clock():
+        g._request_started = perf_counter()
+
+    @app.after_request
+    def _flush_spans(response):
+        spans = g.get('_spans')
+        if spans is None:
+            return response
+
+        endpoint = request.endpoint or request.path
+        total = perf_counter() - spans.start
+        for name, elapsed in spans.stages:
+            _record(endpoint, name, elapsed)
+        _record(endpoint, 'total', total)
+
+        if app.config.get('SERVER_TIMING_HEADER'):
+            parts = [f"{name};dur={elapsed * 1000.0:.2f}" for name, elapsed in spans.stages]
+            parts.append(f"total;dur={total * 1000.0:.2f}")
+            response.headers['Server-Timing'] = ", ".join(parts)
+        return response
+
+
+def stage_timing_snapshot():
+    with _lock:
+        return {endpoint: {stage: hist.summary() for stage, hist in stages.items()}
+                for endpoint, stages in _histograms.items()}
+
+
+def reset_stage_timing():
+    with _lock:
+        _histograms.clear()
@@ -0,0 +1,52 @@
+"""
+Startup import strategy.
+
+`import app` only loads what every request needs (Flask, SQLAlchemy, Stripe,
+bcrypt). The ML stack is handled in one of two ways:
+
+* PRELOAD_ML=1 (production, with a pre-forking server that loads the app in
+  the master): preload_ml() imports PRELOAD_MODULES and loads the policy and
+  forest once, then gc.freeze()s them, so every forked worker shares those
+  pages copy-on-write instead of paying the import and model load again.
+* PRELOAD_ML=0 (default: flask run, CLI scripts, migrations): nothing is
+  imported until the forest fallback first needs it.
+
+DEFERRED_MODULES are in requirements.txt for training and notebooks only and
+must never be imported by the web app; scripts/startup_profile.py fails CI
+if they (or, without preloading, PRELOAD_MODULES) show up after `import app`.
+"""
+import gc
+import importlib
+import os
+import time
+
+from services.live_model import get_model
+from services.offloading_policy import POLICY_FILENAME, get_policy
+
+PRELOAD_MODULES = ('numpy', 'pandas', 'joblib', 'sklearn.ensemble', 'sklearn.pipeline',
+                   'sklearn.compose', 'sklearn.preprocessing')
+DEFERRED_MODULES = ('tensorflow', 'matplotlib', 'seaborn')
+
+
+def preload_ml(app):
+    """Imports the ML stack and loads both offloading artifacts into this process."""
+    timings = {}
+    for name in PRELOAD_MODULES:
+        started = time.perf_counter()
+        importlib.import_module(name)
+        timings[name] = round((time.perf_counter() - started) * 1000.0, 1)
+
+    models_dir = os.path.join(app.root_path, 'ml_models')
+    started = time.perf_counter()
+    if app.config.get('OFFLOADING_FAST_PATH', True):
+        get_policy(os.path.join(models_dir, POLICY_FILENAME))
+    get_model(os.path.join(models_dir, 'offloading_model.pkl'))
+    timings['artifacts'] = round((time.perf_counter() - started) * 1000.0, 1)
+
+    # Move everything allocated so far out of the collector's reach, so GC
+    # passes in the workers don't touch (and un-share) the preloaded pages
+    gc.collect()
+    gc.freeze()
+
+    app.logger.info("Preloaded ML stack (ms): %s", timings)
+    return timings
@@ -0,0 +1,40 @@
+"""
+Executors owned by one server worker process.
+
+gunicorn forks its workers from a master that has already imported the app
+(preload_app, PRELOAD_ML), and neither a ProcessPoolExecutor's management
+thread nor a ThreadPoolExecutor's threads survive a fork. A WorkerPool
+therefore builds its executor lazily and again in every new PID, so each
+server worker gets its own. Used by password hashing, shadow evaluation,
+async forest scoring and /api/batch.
+"""
+import os
+import threading
+
+
+class WorkerPool:
+    def __init__(self, factory):
+        """`factory()` builds the executor; it runs under the pool's lock, in the caller's app context."""
+        self._factory = factory
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = self._factory()
+                    self._pid = os.getpid()
+        return self._executor
+
+    def start(self):
+        """Starts the workers now (server startup), before any client socket is open for them to inherit."""
+        self.get().submit(os.getpid).result()
+
+    def shutdown(self, wait=True, cancel_futures=None):
+        """Stops this process's executor (server worker exit); a new one is created on next use."""
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=wait, cancel_futures=not wait if cancel_futures is None else cancel_futures)
+            self._executor = None
@@ -50,6 +50,45 @@ function getAuthToken() {
     return sessionStorage.getItem('authToken');
 }
 
+// Listings are requested with ?format=columnar: one array per field, enum-like
+// fields as indexes into "dictionaries" (services/columnar.py). Rebuilds rows.
+function fromColumnar(block) {
+    if (!block || block.format !== 'columnar') return block;
+
+    const names = Object.keys(block.columns);
+    const columns = names.map(name => {
+        const dict = block.dictionaries[name];
+        return dict ? block.columns[name].map(code => dict[code]) : block.columns[name];
+    });
+
+    const rows = new Array(block.length);
+    for (let i = 0; i < block.length; i++) {
+        const row = {};
+        for (let j = 0; j < names.length; j++) {
+            row[names[j]] = columns[j][i];
+        }
+        rows[i] = row;
+    }
+    return rows;
+}
+
+// Several API resources in one request (/api/batch): the server checks the token
+// and resolves the user's scope once, then builds the resources concurrently.
+// Resolves to {devices, 'ml-data', dashboard, transactions} (those requested),
+// plus `errors` for any that failed; null when the session has expired.
+async function fetchBatch(resources, params = {}) {
+    const query = new URLSearchParams({ include: resources.join(','), format: 'columnar', ...params });
+    const res = await fetch(`/api/batch?${query}`, {
+        headers: { 'Authorization': `Bearer ${getAuthToken()}` }
+    });
+    if (res.status === 401) {
+        handleLogout();
+        return null;
+    }
+    if (!res.ok) throw new Error(`Batch request failed (${res.status})`);
+    return res.json();
+}
+
 // --- DASHBOARD LOGIC ---
 
 let dashboardChart = null;
@@ -59,7 +98,7 @@ async function fetchDashboardData() {
     if (!token) return;
 
     try {
-        const res = await fetch('/api/dashboard-data', {
+        const res = await fetch('/api/dashboard-data?format=columnar', {
             headers: { 'Authorization': `Bearer ${token}` }
         });
         if (res.status === 401) {
@@ -67,6 +106,7 @@ async function fetchDashboardData() {
             return;
         }
         const data = await res.json();
+        data.transactions = fromColumnar(data.transactions);
 
         // Update Header Box (Device Info)
         const deviceBox = document.getElementById('device-info-box');
@@ -769,27 +809,20 @@ function renderFeatureImportance() {
 
 async function initializeMLPage() {
     const userLocation = sessionStorage.getItem('userLocation');
-    const token = sessionStorage.getItem('authToken');
-
-    try {
-        const devRes = await fetch('/api/devices', {
-            headers: { 'Authorization': `Bearer ${token} ` }
-        });
-        if (devRes.ok) allDevicesData = await devRes.json();
-    } catch (e) { allDevicesData = []; }
-
     renderMLHeader(userLocation);
 
+    // Devices and ML data together, on first load and on every refresh
     async function fetchMLData() {
         try {
-            const res = await fetch('/api/ml-data', {
-                headers: { 'Authorization': `Bearer ${token} ` }
-            });
-            if (!res.ok) throw new Error('Failed to fetch ML data');
-            const data = await res.json();
+            const batch = await fetchBatch(['devices', 'ml-data']);
+            if (!batch) return;
+            if (batch.devices) allDevicesData = batch.devices;
+
+            const data = batch['ml-data'];
+            if (!data) throw new Error('Failed to fetch ML data');
 
             mlMetricsData = data.metrics || [];
-            allMlTransactions = data.transactions || [];
+            allMlTransactions = fromColumnar(data.transactions) || [];
             processingDecisionsData = data.decisions || [];
 
             // Backend already filters by user role/location.
@@ -1439,13 +1472,9 @@ function initializeTransactionsPage() {
                 }
                 messageDiv.style.display = "block";
             }
-            // Refresh list
-            loadTransactions();
-            // Refresh balance
-            fetchUserBalanceForTxnPage();
+            // Refresh list and balance
+            loadTransactionsAndBalance();
         });
-    } else {
-        loadTransactions();
     }
 
     // Initialize Stripe
@@ -1464,8 +1493,11 @@ function initializeTransactionsPage() {
         console.error("Payment form not found!");
     }
 
-    // Fetch Balance for Transactions Page (Must be AFTER form clone/replace)
-    fetchUserBalanceForTxnPage();
+    // List and balance (Must be AFTER form clone/replace); after a redirect
+    // they are loaded once the payment result has been recorded
+    if (!(paymentIntentId && redirectStatus)) {
+        loadTransactionsAndBalance();
+    }
 }
 
 let currentPage = 1;
@@ -1477,7 +1509,7 @@ async function handleRetryTransaction(txnId) {
 
 function loadTransactions(page = 1) {
     const token = getAuthToken();
-    fetch(`/api/transactions?page=${page}&per_page=5`, {
+    fetch(`/api/transactions?page=${page}&per_page=5&format=columnar`, {
         headers: { 'Authorization': `Bearer ${token}` }
     })
         .then(response => {
@@ -1490,30 +1522,44 @@ function loadTransactions(page = 1) {
         })
         .then(data => {
             if (!data) return; // Handled 401
+            renderTransactionsPage(data);
+        })
+        .catch(err => console.error("Error fetching transactions:", err));
+}
 
-            // Check if data is paginated format or list (fallback)
-            console.log("API Response Data:", data);
-            if (data.transactions) {
-                pageTransactions = data.transactions;
-                currentPage = data.current_page;
-                totalPages = data.pages;
-            } else {
-                pageTransactions = data;
-                currentPage = 1;
-                totalPages = 1;
-            }
-            console.log("Page Transactions:", pageTransactions);
-
-            renderTxnStatCards(pageTransactions);
-            renderTxnLocationChart(pageTransactions);
-            renderTxnStatusChart(pageTransactions); // Needs update to support 'flagged' if previously relying on 'mlPrediction'
-            renderTxnTable(pageTransactions);
-            renderTxnPipeline(pageTransactions);
-            renderPaginationControls();
+// First page and the balance (from the dashboard payload) in one request
+function loadTransactionsAndBalance() {
+    fetchBatch(['transactions', 'dashboard'], { page: 1, per_page: 5 })
+        .then(batch => {
+            if (!batch) return; // Handled 401
+            if (batch.transactions) renderTransactionsPage(batch.transactions);
+            renderUserBalance(batch.dashboard);
         })
         .catch(err => console.error("Error fetching transactions:", err));
 }
 
+function renderTransactionsPage(data) {
+    // Check if data is paginated format or list (fallback)
+    console.log("API Response Data:", data);
+    if (data.transactions) {
+        pageTransactions = fromColumnar(data.transactions);
+        currentPage = data.current_page;
+        totalPages = data.pages;
+    } else {
+        pageTransactions = data;
+        currentPage = 1;
+        totalPages = 1;
+    }
+    console.log("Page Transactions:", pageTransactions);
+
+    renderTxnStatCards(pageTransactions);
+    renderTxnLocationChart(pageTransactions);
+    renderTxnStatusChart(pageTransactions); // Needs update to support 'flagged' if previously relying on 'mlPrediction'
+    renderTxnTable(pageTransactions);
+    renderTxnPipeline(pageTransactions);
+    renderPaginationControls();
+}
+
 function renderPaginationControls() {
     const prevBtn = document.getElementById('prev-page-btn');
     const nextBtn = document.getElementById('next-page-btn');
@@ -1876,31 +1922,14 @@ function renderDashboardStatCards(data) {
     `;
 }
 
-function fetchUserBalanceForTxnPage() {
-    console.log("DEBUG: fetchUserBalanceForTxnPage called");
+function renderUserBalance(data) {
     const el = document.getElementById('user-balance-display');
-    console.log("DEBUG: Balance element found:", el);
     if (!el) return;
 
-    const token = getAuthToken();
-    console.log("DEBUG: Fetching balance from API...");
-    fetch('/api/dashboard-data', {
-        headers: { 'Authorization': `Bearer ${token}` }
-    })
-        .then(res => {
-            console.log("DEBUG: API Response Status:", res.status);
-            return res.json();
-        })
-        .then(data => {
-            console.log("DEBUG: API Data:", data);
-            if (data.userBalance != null) {
-                const formatted = `RM ${data.userBalance.toLocaleString('en-MY', { minimumFractionDigits: 2, maximumFractionDigits: 2 })}`;
-                console.log("DEBUG: Setting balance to:", formatted);
-                el.textContent = formatted;
-            } else {
-                console.error("DEBUG: userBalance is null or undefined in API response");
-            }
-        })
-        .catch(err => console.error("DEBUG: Error fetching balance:", err));
+    if (data && data.userBalance != null) {
+        el.textContent = `RM ${data.userBalance.toLocaleString('en-MY', { minimumFractionDigits: 2, maximumFractionDigits: 2 })}`;
+    } else {
+        console.error("userBalance is null or undefined in API response");
+    }
 }
 
@@ -0,0 +1,175 @@
+"""
+Fixtures for the hot-path benchmarks (pytest-benchmark).
+
+A temporary SQLite database is seeded once per session with BENCH_ROWS
+transactions (10k, 100k, 1M; default 10k) spread over the 16 edge devices
+in proportion to TXN_CAPACITY_MAP and over the last BENCH_DAYS days, and
+the customer feature store is rebuilt from them. Stripe is stubbed and the
+simulated edge/cloud sleep is disabled, so payment_success measures only
+the application's own work.
+
+    BENCH_ROWS=100k python -m pytest tests/benchmarks --benchmark-autosave
+    pytest-benchmark compare 0001 0002 --group-by=name
+
+Each run is saved under .benchmarks/ with the commit id and BENCH_ROWS
+("bench_rows" in the JSON), so runs at the same scale can be compared
+between commits. --benchmark-json=PATH writes a single file instead.
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+# Add project root to path
+sys.path.append(ROOT)
+
+UTC8 = timezone(timedelta(hours=8))
+SEED_CHUNK = 20000
+ADMIN_PASSWORD = 'Admin@123'
+SUPERADMIN = ('superadmin@bankedge.com', 'SuperAdmin@123')
+ADMIN = 'admin.kl@bankedge.com'
+
+
+def parse_rows(value):
+    """'10000', '100k', '1M' -> int."""
+    value = value.strip().lower()
+    scale = {'k': 1000, 'm': 1000000}.get(value[-1:], 1)
+    return int(float(value.rstrip('km')) * scale)
+
+
+BENCH_ROWS = parse_rows(os.environ.get('BENCH_ROWS', '10k'))
+BENCH_DAYS = int(os.environ.get('BENCH_DAYS', 30))
+
+
+def pytest_report_header(config):
+    return f"benchmarks: {BENCH_ROWS:,} transactions over {BENCH_DAYS} days (BENCH_ROWS / BENCH_DAYS)"
+
+
+def pytest_benchmark_update_json(config, benchmarks, output_json):
+    output_json['bench_rows'] = BENCH_ROWS
+    output_json['bench_days'] = BENCH_DAYS
+
+
+# =====================================================================
+# SEEDING
+# =====================================================================
+def seed_transactions(db, Transaction, capacity_map, customers, rows, days, rng):
+    """Chunked Core inserts in one DB transaction; device picked by capacity weight, time uniform over `days`."""
+    devices = list(capacity_map)
+    weights = [capacity_map[d] for d in devices]
+    now = datetime.now(UTC8)
+    span_s = days * 86400
+    table = Transaction.__table__
+
+    with db.engines[None].begin() as conn:
+        for start in range(0, rows, SEED_CHUNK):
+            chunk = []
+            for i in range(start, min(start + SEED_CHUNK, rows)):
+                decision = rng.choice(('edge', 'edge', 'edge', 'cloud', 'flagged'))
+                chunk.append({
+                    "id": f"pi_seed_{i}",
+                    "amount": round(rng.uniform(5, 15000), 2),
+                    "stripe_status": "succeeded" if rng.random() < 0.9 else "failed",
+                    "processing_decision": decision,
+                    "timestamp": now - timedelta(seconds=rng.uniform(0, span_s)),
+                    "old_balance_org": 0.0,
+                    "new_balance_org": 0.0,
+                    "is_fraud": False,
+                    "recipient_account": f"1234{i % 997:06d}",
+                    "reference": f"Invoice {i}",
+                    "merchant_name": rng.choice(("card", "grabpay", "fpx_maybank2u")),
+                    "type": "Transfer",
+                    "customer_id": rng.choice(customers),
+                    "device_id": rng.choices(devices, weights)[0],
+                    "confidence": 0.9 if decision == 'edge' else 0.7,
+                    "latency": round(rng.uniform(5, 15) if decision == 'edge' else rng.uniform(200, 500), 3),
+                })
+            conn.execute(table.insert(), chunk)
+
+
+# =====================================================================
+# APP + DATA (once per session)
+# =====================================================================
+@pytest.fixture(scope='session')
+def app(tmp_path_factory, app_env):
+    os.environ.update(app_env(
+        tmp_path_factory.mktemp('bench') / 'bench.db',
+        LOADTEST_ROUTING='off',
+        ADMISSION_CONTROL='0',  # measure the path itself, not the rate limits
+    ))
+    from app import app
+    from controllers.api_controller import TXN_CAPACITY_MAP
+    from models import db, Transaction, User
+    from services.customer_features import rebuild_from_transactions
+
+    assert app.test_client().get('/api/init-db').status_code == 200
+
+    started = time.perf_counter()
+    with app.app_context():
+        customers = [u.username for u in User.query.all()]
+        seed_transactions(db, Transaction, TXN_CAPACITY_MAP, customers, BENCH_ROWS, BENCH_DAYS, random.Random(42))
+        rebuild_from_transactions(db)
+        # Payments keep succeeding however many rounds run
+        User.query.update({User.balance: 1e12})
+        db.session.commit()
+    print(f"\nSeeded {BENCH_ROWS:,} transactions in {time.perf_counter() - started:.1f}s")
+    return app
+
+
+@pytest.fixture(scope='session')
+def bench_rows():
+    return BENCH_ROWS
+
+
+@pytest.fixture(scope='session')
+def client(app):
+    return app.test_client()
+
+
+def _token(client, username, password):
+    response = client.post('/api/login', json={'username': username, 'password': password})
+    assert response.status_code == 200
+    return {'Authorization': 'Bearer ' + response.json['access_token']}
+
+
+@pytest.fixture(scope='session')
+def superadmin_headers(client):
+    return _token(client, *SUPERADMIN)
+
+
+@pytest.fixture(scope='session')
+def admin_headers(client):
+    return _token(client, ADMIN, ADMIN_PASSWORD)
+
+
+# =====================================================================
+# STUBS
+# =====================================================================
+@pytest.fixture
+def stub_stripe(monkeypatch):
+    """PaymentIntent / PaymentMethod retrieve without the network; no simulated edge/cloud sleep."""
+    import stripe
+    import controllers.transactions_controller as transactions_controller
+
+    def retrieve_intent(pi_id, **kwargs):
+        return SimpleNamespace(id=pi_id, status='succeeded', amount=random.randint(500, 1500000),
+                               payment_method='pm_bench', charges=None,
+                               metadata={'recipient_account': '1234567890', 'reference': 'Benchmark'})
+
+    monkeypatch.setattr(stripe.PaymentIntent, 'retrieve', retrieve_intent)
+    monkeypatch.setattr(stripe.PaymentMethod, 'retrieve', lambda pm_id, **kwargs: SimpleNamespace(type='card'))
+    monkeypatch.setattr(transactions_controller, 'sleep', lambda seconds: None)
+
+
+@pytest.fixture(scope='session')
+def model_paths(app):
+    """(forest .pkl, distilled policy .json); tests that need one skip when it has not been trained."""
+    models_dir = os.path.join(app.root_path, 'ml_models')
+    from services.offloading_policy import POLICY_FILENAME
+    return os.path.join(models_dir, 'offloading_model.pkl'), os.path.join(models_dir, POLICY_FILENAME)
@@ -0,0 +1,113 @@
+"""
+Hot paths of the API at BENCH_ROWS transactions (see conftest.py).
+
+    BENCH_ROWS=10k python -m pytest tests/benchmarks --benchmark-autosave
+"""
+import itertools
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+UTC8 = timezone(timedelta(hours=8))
+PER_PAGE = 50
+CUSTOMER = 'admin.kl@bankedge.com'
+_payment_ids = itertools.count()
+
+
+# =====================================================================
+# PAYMENTS
+# =====================================================================
+@pytest.mark.benchmark(group='payment_success')
+def test_payment_success(benchmark, client, admin_headers, stub_stripe):
+    def pay():
+        pi_id = f"pi_bench_{os.getpid()}_{next(_payment_ids)}"
+        return client.post('/api/payment-success', json={'payment_intent': pi_id, 'latency': 10},
+                           headers=admin_headers)
+
+    response = benchmark(pay)
+    assert response.status_code == 200
+    assert response.json['stripe_status'] == 'succeeded'
+
+
+# =====================================================================
+# DEVICE + LATENCY AGGREGATES
+# =====================================================================
+@pytest.mark.benchmark(group='get_hybrid_devices')
+@pytest.mark.parametrize('source', ['counters', 'db'])
+def test_get_hybrid_devices(benchmark, app, monkeypatch, source):
+    import controllers.api_controller as api_controller
+    if source == 'db':
+        monkeypatch.setattr(api_controller, 'device_counters', lambda: None)
+
+    with app.app_context():
+        devices = benchmark(api_controller.get_hybrid_devices)
+    assert len(devices) == 16
+
+
+@pytest.mark.benchmark(group='generate_latency_history')
+@pytest.mark.parametrize('device_id', [None, 'edge-14'], ids=['all', 'device'])
+def test_generate_latency_history(benchmark, app, device_id):
+    from controllers.api_controller import generate_latency_history
+
+    with app.app_context():
+        history = benchmark(generate_latency_history, device_id)
+    assert len(history) == 20
+
+
+# =====================================================================
+# API READS
+# =====================================================================
+@pytest.mark.benchmark(group='ml_data')
+@pytest.mark.parametrize('scope', ['superadmin', 'admin'])
+def test_ml_data(benchmark, client, superadmin_headers, admin_headers, scope):
+    headers = superadmin_headers if scope == 'superadmin' else admin_headers
+    response = benchmark(client.get, '/api/ml-data', headers=headers)
+    assert response.status_code == 200
+
+
+@pytest.mark.benchmark(group='get_transactions')
+@pytest.mark.parametrize('depth', ['shallow', 'deep'])
+def test_get_transactions(benchmark, client, superadmin_headers, bench_rows, depth):
+    # Deep: the last full page, i.e. OFFSET ~ BENCH_ROWS
+    page = 1 if depth == 'shallow' else max(bench_rows // PER_PAGE, 1)
+    benchmark.extra_info['page'] = page
+
+    response = benchmark(client.get, f'/api/transactions?page={page}&per_page={PER_PAGE}',
+                         headers=superadmin_headers)
+    assert response.status_code == 200
+    assert len(response.json['transactions']) == PER_PAGE
+
+
+# =====================================================================
+# MODEL INFERENCE
+# =====================================================================
+@pytest.mark.benchmark(group='inference')
+def test_policy_decide(benchmark, model_paths):
+    from services.offloading_policy import get_policy
+
+    policy = get_policy(model_paths[1])
+    if policy is None:
+        pytest.skip("no distilled policy (python scripts/train_offloading_model.py)")
+    label, _ = benchmark(policy.decide, 1200.0, 12.0, 8)
+    assert label in ('edge', 'cloud')
+
+
+@pytest.mark.benchmark(group='inference')
+def test_forest_predict(benchmark, app, model_paths):
+    from services.payments import forest_predict
+
+    if not os.path.exists(model_paths[0]):
+        pytest.skip("no forest model (python scripts/train_offloading_model.py)")
+    with app.app_context():
+        label, _ = benchmark(forest_predict, model_paths[0], 1200.0, 12.0, 8)
+    assert label in ('edge', 'cloud')
+
+
+@pytest.mark.benchmark(group='inference')
+def test_feature_lookup(benchmark, app):
+    from services.customer_features import lookup_features
+
+    with app.app_context():
+        features = benchmark(lambda: lookup_features(CUSTOMER, datetime.now(UTC8)))
+    assert features['txn_count_last_30d'] > 0
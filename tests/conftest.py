@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+BENCHMARKS = os.path.join(TESTS, 'benchmarks')
+
+
+def pytest_ignore_collect(collection_path, config):
+    # tests/benchmarks seeds its own database into the app.py singleton, so it only
+    # runs when asked for by path:  python -m pytest tests/benchmarks
+    if str(collection_path) != BENCHMARKS:
+        return None
+    requested = [os.path.abspath(str(arg).split('::')[0]) for arg in config.args]
+    if any(path == BENCHMARKS or path.startswith(BENCHMARKS + os.sep) for path in requested):
+        return None
+    return True
+
+
+# =====================================================================
+# APP ON ITS OWN DATABASE
+# =====================================================================
+@pytest.fixture(scope='session')
+def app_env():
+    """
+    app_env(db_path, **overrides) -> environment for an app.py on its own
+    SQLite file, with the background maintenance threads off and cheap bcrypt.
+    app.py reads it when first imported, so set it before `from app import app`.
+    """
+    def env(db_path, **overrides):
+        values = {
+            'DATABASE_URL': 'sqlite:///' + str(db_path),
+            'LOADTEST_RETENTION_INTERVAL': '0',
+            'CUSTOMER_FEATURES_COMPACT_INTERVAL': '0',
+            'BCRYPT_LOG_ROUNDS': '4',
+        }
+        values.update(overrides)
+        return values
+    return env
+
+
+@pytest.fixture(scope='session')
+def run_fresh_app(app_env):
+    """
+    run_fresh_app(func, db_path, **overrides) calls `func()` (a module-level
+    function of a test module) in a fresh interpreter with app_env(...), for
+    tests that need the app.py singleton on a database of their own. A failed
+    assertion in `func` fails the test with the child's traceback.
+    """
+    def run(func, db_path, **overrides):
+        code = f"from {func.__module__} import {func.__name__}; {func.__name__}()"
+        result = subprocess.run([sys.executable, '-c', code], cwd=TESTS, capture_output=True, text=True,
+                                env={**os.environ, **app_env(db_path, **overrides)}, timeout=120)
+        assert result.returncode == 0, result.stderr[-3000:]
+    return run
@@ -0,0 +1,64 @@
+"""
+Admission control (services/admission.py).
+
+A payment takes its device's token before it queues for a slot. If it is
+then shed (queue_timeout) or cancelled while queued, the token goes back,
+so shed traffic does not push the device's later payments into 429s.
+
+    python -m pytest -q tests/test_admission.py
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Add project root to path
+sys.path.append(ROOT)
+
+from services.admission import AdmissionController, AdmissionRejected  # noqa: E402
+
+DEVICE = 'edge-14'
+
+
+def controller():
+    # Burst of 2 tokens, refilling too slowly to matter; one slot; 20 ms of queueing
+    return AdmissionController({DEVICE: 0.001}, burst_seconds=2000, max_concurrent=1, max_queue_ms=20)
+
+
+def test_shed_waiter_gives_its_token_back():
+    c = controller()
+    c.admit(DEVICE)  # holds the only slot
+
+    with pytest.raises(AdmissionRejected) as shed:
+        c.admit(DEVICE)
+    assert shed.value.status == 503
+
+    # Still one token: queues and is shed again (503), not rate-limited (429)
+    with pytest.raises(AdmissionRejected) as again:
+        c.admit(DEVICE)
+    assert again.value.status == 503
+    c.release()
+    assert c.admit(DEVICE) == 0.0
+
+    shed_counts = c.snapshot()["devices"][DEVICE]["shed"]
+    assert shed_counts == {"rate_limited": 0, "queue_full": 0, "queue_timeout": 2}
+
+
+def test_cancelled_async_waiter_gives_its_token_back():
+    c = controller()
+
+    async def scenario():
+        await c.admit_async(DEVICE)  # holds the only slot
+        queued = asyncio.ensure_future(c.admit_async(DEVICE))
+        await asyncio.sleep(0)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        c.release()
+        return await c.admit_async(DEVICE)
+
+    assert asyncio.run(scenario()) == 0.0
+    assert c.snapshot()["waiting"] == 0
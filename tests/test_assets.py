@@ -0,0 +1,52 @@
+"""
+Fingerprinted static assets (services/assets.py).
+
+The CSS minifier must not touch quoted strings or url(...), and only a
+served dist/ file gets the year-long immutable Cache-Control. The header
+check runs the app in a fresh interpreter (run_fresh_app in conftest.py).
+
+    python -m pytest -q tests/test_assets.py
+"""
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Add project root to path
+sys.path.append(ROOT)
+
+from services.assets import IMMUTABLE, minify_css  # noqa: E402
+
+
+def test_minify_keeps_strings_and_urls():
+    css = """
+    /* "quote in a comment */
+    a::before {  content: "x  ;  y , z" ; }
+    b { background: url( 'a  b.png' ) no-repeat ,  url(c d.png) ; font-family: 'Open  Sans', serif; }
+    c { content: "/* not a comment */"; }
+    """
+    assert minify_css(css) == (
+        'a::before{content: "x  ;  y , z"}'
+        "b{background: url( 'a  b.png' ) no-repeat,url(c d.png);font-family: 'Open  Sans',serif}"
+        'c{content: "/* not a comment */"}'
+    )
+
+
+def static_headers():
+    from app import app
+    from services.assets import asset_url
+
+    client = app.test_client()
+    with app.test_request_context():
+        bundle = asset_url('css/app.css')
+    response = client.get(bundle)
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == IMMUTABLE
+
+    response = client.get('/static/dist/css/app.0000000000.css')
+    assert response.status_code == 404
+    assert 'immutable' not in response.headers.get('Cache-Control', '')
+
+
+def test_immutable_only_for_served_files(tmp_path, run_fresh_app):
+    run_fresh_app(static_headers, tmp_path / 'bankedge.db')
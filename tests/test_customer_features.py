@@ -0,0 +1,67 @@
+"""
+Payments against a database created before the customer feature store.
+
+A copy of the shipped bankedge.db (no customer_features tables) is opened
+by the app in a fresh interpreter (run_fresh_app in conftest.py). Startup
+must create the feature-store tables, and a payment must still be saved
+when the feature-store write itself fails.
+
+    python -m pytest -q tests/test_customer_features.py
+"""
+import os
+import shutil
+import sqlite3
+import sys
+from types import SimpleNamespace
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Add project root to path
+sys.path.append(ROOT)
+
+ADMIN = 'admin.kl@bankedge.com'
+
+
+def pay_against_old_db():
+    import stripe
+    import controllers.transactions_controller as transactions_controller
+    from app import app
+    from models import db, CustomerFeature, Transaction
+    from services.password_hashing import shutdown_pool
+
+    stripe.PaymentIntent.retrieve = lambda pi_id, **kwargs: SimpleNamespace(
+        id=pi_id, status='succeeded', amount=100, payment_method=None, charges=None,
+        metadata={'recipient_account': '1234567890', 'reference': 'Old DB'})
+    transactions_controller.sleep = lambda seconds: None
+
+    client = app.test_client()
+    token = client.post('/api/login', json={'username': ADMIN, 'password': 'Admin@123'}).json['access_token']
+    headers = {'Authorization': 'Bearer ' + token}
+
+    # Startup created the feature store; the payment updates it
+    response = client.post('/api/payment-success', json={'payment_intent': 'pi_olddb_1'}, headers=headers)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    with app.app_context():
+        assert db.session.get(CustomerFeature, ADMIN).txn_count_total == 1
+
+        # Feature-store write fails: the payment is saved anyway
+        db.session.execute(db.text('DROP TABLE customer_feature_buckets'))
+        db.session.commit()
+    response = client.post('/api/payment-success', json={'payment_intent': 'pi_olddb_2'}, headers=headers)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    with app.app_context():
+        assert db.session.get(Transaction, 'pi_olddb_2').stripe_status == 'succeeded'
+        assert db.session.get(CustomerFeature, ADMIN).txn_count_total == 1
+    shutdown_pool(wait=True)
+
+
+def test_payment_on_database_without_feature_tables(tmp_path, run_fresh_app):
+    db_path = str(tmp_path / 'bankedge.db')
+    for suffix in ('', '-wal'):
+        if os.path.exists(os.path.join(ROOT, 'bankedge.db' + suffix)):
+            shutil.copy(os.path.join(ROOT, 'bankedge.db' + suffix), db_path + suffix)
+    with sqlite3.connect(db_path) as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    assert 'customer_features' not in tables
+
+    run_fresh_app(pay_against_old_db, db_path, ADMISSION_CONTROL='0', DEVICE_COUNTERS='0')
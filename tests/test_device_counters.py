@@ -0,0 +1,133 @@
+"""
+Shared-memory device counters across worker processes.
+
+The app is imported once (like gunicorn's preloading master), then WORKERS
+processes are forked and each posts payments through /api/payment-success
+as a different regional admin. Afterwards the counters every worker wrote
+must agree with the transactions table, and get_hybrid_devices must report
+the same last-minute figures from the counters as from the DB query.
+
+    python -m pytest -q tests/test_device_counters.py
+"""
+import multiprocessing
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Add project root to path
+sys.path.append(ROOT)
+
+UTC8 = timezone(timedelta(hours=8))
+WORKERS = 4
+PAYMENTS_PER_WORKER = 10
+ADMINS = ['admin.kl@bankedge.com', 'admin.johor@bankedge.com', 'admin.penang@bankedge.com',
+          'admin.sabah@bankedge.com']
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory, app_env):
+    os.environ.update(app_env(
+        tmp_path_factory.mktemp('db') / 'counters.db',
+        LOADTEST_ROUTING='off',  # pi_sim_ payments go to the production table
+        DEVICE_COUNTERS='1',
+    ))
+    from app import app
+
+    assert app.test_client().get('/api/init-db').status_code == 200
+    return app
+
+
+def post_payments(username, count):
+    """Runs in a forked worker; any failed request fails the worker's exit code."""
+    from app import app
+    from models import db
+    from services.password_hashing import shutdown_pool
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+    client = app.test_client()
+    token = client.post('/api/login', json={'username': username, 'password': 'Admin@123'}).json['access_token']
+    prefix = username.split('@')[0].replace('.', '_')
+    for i in range(count):
+        response = client.post('/api/payment-success',
+                               json={'payment_intent': f'pi_sim_{prefix}_{i}', 'amount': 10 + i, 'latency': 10},
+                               headers={'Authorization': 'Bearer ' + token})
+        assert response.status_code == 200, response.get_data(as_text=True)
+    shutdown_pool(wait=True)
+
+
+def test_counters_match_db_across_workers(app, monkeypatch):
+    from models import db, Transaction
+    from services.device_counters import device_counters
+    from sqlalchemy import func
+
+    ctx = multiprocessing.get_context('fork')
+    workers = [ctx.Process(target=post_payments, args=(ADMINS[i % len(ADMINS)], PAYMENTS_PER_WORKER))
+               for i in range(WORKERS)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join(120)
+    assert [w.exitcode for w in workers] == [0] * WORKERS
+
+    with app.app_context():
+        rows = db.session.query(
+            Transaction.device_id, func.count(Transaction.id), func.sum(Transaction.latency)
+        ).group_by(Transaction.device_id).all()
+
+    totals = device_counters().totals()
+    assert sum(count for count, _ in totals.values()) == WORKERS * PAYMENTS_PER_WORKER
+    assert len(rows) == min(WORKERS, len(ADMINS))
+    for device_id, count, latency_sum in rows:
+        assert totals[device_id][0] == count
+        assert totals[device_id][1] == pytest.approx(latency_sum, abs=0.001 * count)
+
+    assert_devices_match(app, monkeypatch)
+
+
+def test_retry_of_an_old_payment_reenters_the_window(app, monkeypatch):
+    from models import db, Transaction
+    from services.device_counters import device_counters
+    from services.password_hashing import shutdown_pool
+
+    # Paid (and counted) ten minutes ago, outside the last-minute window
+    with app.app_context():
+        db.session.add(Transaction(id='pi_sim_retry_old', amount=25.0, stripe_status='failed',
+                                   timestamp=datetime.now(UTC8) - timedelta(minutes=10),
+                                   device_id='edge-14', customer_id=ADMINS[0], latency=42.0))
+        db.session.commit()
+    totals = device_counters().totals()
+
+    # handleRetryTransaction posts the same intent again: the row's timestamp moves to now
+    client = app.test_client()
+    token = client.post('/api/login', json={'username': ADMINS[0], 'password': 'Admin@123'}).json['access_token']
+    response = client.post('/api/payment-success', json={'payment_intent': 'pi_sim_retry_old', 'amount': 25},
+                           headers={'Authorization': 'Bearer ' + token})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    shutdown_pool(wait=True)
+
+    assert device_counters().totals() == totals  # not a new payment
+    assert_devices_match(app, monkeypatch)
+
+
+def assert_devices_match(app, monkeypatch):
+    """Dashboard view: counters vs the DB query they replace."""
+    from controllers import api_controller
+
+    with app.test_request_context():
+        from_counters = {d['id']: d for d in api_controller.get_hybrid_devices()}
+        with monkeypatch.context() as m:
+            m.setattr(api_controller, 'device_counters', lambda: None)
+            from_db = {d['id']: d for d in api_controller.get_hybrid_devices()}
+
+    assert from_counters.keys() == from_db.keys()
+    for device_id, expected in from_db.items():
+        assert from_counters[device_id]['transactionsPerSec'] == pytest.approx(expected['transactionsPerSec'])
+        assert from_counters[device_id]['load'] == pytest.approx(expected['load'])
+        assert from_counters[device_id]['latency'] == pytest.approx(expected['latency'], abs=0.001)
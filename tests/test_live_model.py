@@ -0,0 +1,60 @@
+"""
+/api/ml-diagnosis model state (services/live_model.py).
+
+A worker that has only served the distilled fast path never loads the
+forest; the artifact and its loadability must still be reported, from disk
+and from the last (background) validation of the same file.
+
+    python -m pytest -q tests/test_live_model.py
+"""
+import os
+import sys
+import time
+
+import joblib
+from sklearn.tree import DecisionTreeClassifier
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Add project root to path
+sys.path.append(ROOT)
+
+from services import live_model  # noqa: E402
+
+
+def wait_for_validation(path, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = live_model.last_validation(path)
+        if result and result.get("status") == "done":
+            return result
+        time.sleep(0.1)
+    raise AssertionError("validation did not finish")
+
+
+def test_artifact_state_without_loading_in_this_worker(tmp_path):
+    path = str(tmp_path / 'offloading_model.pkl')
+    joblib.dump(DecisionTreeClassifier().fit([[0], [1]], [0, 1]), path)
+
+    stats = live_model.live_model_stats(path)
+    assert stats["loaded"] is False
+    assert stats["artifact"]["exists"] and stats["artifact"]["sha256"]
+    assert stats["loadable"] is None
+
+    # Validation runs in the background and is shared through a file next to the model
+    pending = live_model.start_validation(path, 0)
+    assert pending["status"] == "running"
+    result = wait_for_validation(path)
+    assert result["loadable"] is True and result["sha256"] == stats["artifact"]["sha256"]
+
+    stats = live_model.live_model_stats(path)
+    assert stats["loaded"] is False
+    assert stats["loadable"] is True
+
+    # A replaced artifact is unknown until validated (or loaded) again
+    with open(path, 'wb') as f:
+        f.write(b'not a model')
+    assert live_model.live_model_stats(path)["loadable"] is None
+    live_model.start_validation(path, 0)
+    assert wait_for_validation(path)["loadable"] is False
+    assert live_model.live_model_stats(path)["loadable"] is False
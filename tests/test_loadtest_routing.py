@@ -0,0 +1,46 @@
+"""
+Which payments are stored as load-test traffic (services/loadtest_store.py).
+
+Load-test rows are purged after LOADTEST_RETENTION_HOURS, so only simulated
+(pi_sim_) intents may end up there; the X-Load-Test header can narrow that,
+never widen it to a real Stripe payment.
+
+    python -m pytest -q tests/test_loadtest_routing.py
+"""
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Add project root to path
+sys.path.append(ROOT)
+
+from services.loadtest_store import is_load_test_request  # noqa: E402
+
+HEADER = {'X-Load-Test': '1'}
+
+
+def routed(mode, pi_id, headers=None):
+    app = Flask(__name__)
+    app.config['LOADTEST_ROUTING'] = mode
+    with app.test_request_context('/api/payment-success', method='POST', headers=headers or {}):
+        return is_load_test_request(pi_id)
+
+
+@pytest.mark.parametrize('mode', ['auto', 'header', 'off'])
+def test_header_never_routes_a_real_intent(mode):
+    assert routed(mode, 'pi_3PqRealStripeIntent', HEADER) is False
+
+
+@pytest.mark.parametrize('mode, headers, expected', [
+    ('auto', None, True),
+    ('auto', HEADER, True),
+    ('header', None, False),
+    ('header', HEADER, True),
+    ('off', HEADER, False),
+])
+def test_simulated_intents(mode, headers, expected):
+    assert routed(mode, 'pi_sim_1700000000000_1234', headers) is expected
@@ -0,0 +1,53 @@
+"""
+Streaming training (services/offloading_stream.py) when the stream opens
+with a chunk whose rows all fall in the held-out partition.
+
+    python -m pytest -q tests/test_offloading_stream.py
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Add project root to path
+sys.path.append(ROOT)
+
+from services.offloading_features import FEATURES  # noqa: E402
+from services.offloading_stream import holdout_mask, train_streaming  # noqa: E402
+
+HOLDOUT = 0.2
+
+
+def make_chunk(ids, start):
+    rng = np.random.default_rng(len(ids))
+    amount = rng.uniform(10, 15000, len(ids))
+    return pd.DataFrame({
+        'id': ids,
+        'amount': amount.astype(np.float32),
+        'latency': rng.uniform(5, 500, len(ids)).astype(np.float32),
+        'type': 'Transfer',
+        'customer_id': [f"admin{i % 7}@bankedge.com" for i in range(len(ids))],
+        'processing_decision': np.where(amount > 5000, 'cloud', 'edge'),
+        'timestamp': pd.date_range(start, periods=len(ids), freq='min'),
+    })
+
+
+def test_first_chunk_entirely_held_out():
+    candidates = np.array([f"pi_{i}" for i in range(2000)], dtype=object)
+    held_out = holdout_mask(candidates, HOLDOUT)
+    start = datetime(2025, 1, 1)
+    chunks = [
+        make_chunk(candidates[held_out][:50], start),
+        make_chunk(candidates[~held_out][:500], start + timedelta(days=1)),
+        make_chunk(candidates[held_out][50:150], start + timedelta(days=2)),
+    ]
+
+    model, metrics = train_streaming(iter(chunks), holdout=HOLDOUT, log=lambda line: None)
+
+    # The opening chunk is skipped (nothing trained yet); the last one is scored
+    assert metrics.rows == 100
+    assert set(model.predict(chunks[1][FEATURES])) <= {'cloud', 'edge'}
@@ -0,0 +1,45 @@
+"""
+Concurrent logins through the bcrypt process pool (services/password_hashing.py).
+
+A burst larger than the backlog (BCRYPT_POOL_MAX_PENDING) must wait for a
+slot rather than get 503s; only BCRYPT_TIMEOUT running out rejects a login.
+
+    python -m pytest -q tests/test_password_hashing.py
+"""
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Add project root to path
+sys.path.append(ROOT)
+
+LOGINS = 8
+REGIONS = ['kl', 'johor', 'penang', 'sabah', 'sarawak', 'perak', 'kedah', 'pahang']
+
+
+def concurrent_logins():
+    from app import app
+    from services.password_hashing import hashing_metrics, shutdown_pool
+
+    assert app.test_client().get('/api/init-db').status_code == 200
+
+    def login(region):
+        response = app.test_client().post('/api/login', json={'username': f'admin.{region}@bankedge.com',
+                                                              'password': 'Admin@123'})
+        return response.status_code
+
+    with ThreadPoolExecutor(LOGINS) as threads:
+        statuses = list(threads.map(login, REGIONS[:LOGINS]))
+    assert statuses == [200] * LOGINS, statuses
+    with app.app_context():
+        verify = hashing_metrics()["operations"]["verify"]
+    assert verify["count"] == LOGINS and verify["rejected"] == 0
+    shutdown_pool(wait=True)
+
+
+def test_login_burst_beyond_backlog_waits_for_a_slot(tmp_path, run_fresh_app):
+    run_fresh_app(concurrent_logins, tmp_path / 'bankedge.db',
+                  BCRYPT_LOG_ROUNDS='8', BCRYPT_POOL_WORKERS='1', BCRYPT_POOL_MAX_PENDING='2',
+                  ADMISSION_CONTROL='0')